@@ -0,0 +1,411 @@
+"""
+Almacén local de documentos de convocatorias, direccionado por contenido.
+
+Cada documento se guarda una sola vez en disco con su SHA-256 como nombre
+(`blobs/ab/abcdef...`), de modo que el mismo fichero publicado en varias
+convocatorias (o subido por el usuario) no se duplica. Un índice SQLite
+relaciona cada `idDocumento` de la BDNS (o el hash, para las subidas) con su
+contenido: hash, tamaño, tipo MIME, nombre y fecha de descarga.
+
+- Escrituras atómicas: se escribe en un temporal mientras se calcula el hash y
+  solo se publica (rename) cuando la descarga está completa y con el tamaño
+  anunciado. Las descargas de `obtener` usan un `<id>.part` fijo y, si se
+  interrumpen, se reanudan con Range desde lo ya recibido. Un lock de fichero
+  (flock) garantiza un solo escritor por `.part` entre hilos y procesos.
+- Presupuesto de disco (`DOCUMENTOS_MAX_BYTES`) con expulsión LRU por contenido.
+  No se expulsa un blob que alguien está leyendo: las lecturas largas
+  (FileResponse, ZIP, ingesta) lo fijan en la tabla `lecturas` con `fijar=True`
+  hasta `soltar`, con un plazo máximo por si el proceso muere sin soltarlo; y
+  tampoco los usados hace menos de `DOCUMENTOS_MARGEN_EXPULSION` segundos, que
+  cubre a quien recibió la ruta sin fijarla.
+- Desde código async (endpoints) se escribe con `EscrituraAsincrona`, que
+  lleva el disco y SQLite al pool de hilos.
+
+Lo usan los endpoints de descarga y ZIP, `descargar_documentos_a_disco` y la
+ingesta del RAG.
+"""
+import hashlib
+import os
+import fcntl
+import tempfile
+import time
+from contextlib import contextmanager
+
+import anyio
+
+from almacen_sqlite import AlmacenSQLite
+from cliente_http import CLIENTE_BDNS
+
+# ======== CONFIGURACIÓN ========
+DOCUMENTOS_DIR = os.getenv("DOCUMENTOS_DIR", "data/cache/documentos")
+DOCUMENTOS_MAX_BYTES = int(os.getenv("DOCUMENTOS_MAX_BYTES", str(2 * 1024 ** 3)))
+URL_DOCUMENTO = "https://www.infosubvenciones.es/bdnstrans/api/convocatorias/documentos?idDocumento={}"
+REINTENTOS_DESCARGA = int(os.getenv("DOCUMENTOS_REINTENTOS", "2"))   # reanudaciones tras un corte
+LECTURA_MAX_SEGUNDOS = int(os.getenv("DOCUMENTOS_LECTURA_MAX_SEGUNDOS", "3600"))   # plazo de una lectura fijada
+MARGEN_EXPULSION = int(os.getenv("DOCUMENTOS_MARGEN_EXPULSION", "300"))   # no se expulsa lo usado hace menos
+TROZO_ESCRITURA_ASYNC = int(os.getenv("DOCUMENTOS_TROZO_ESCRITURA", str(1024 ** 2)))   # bytes por viaje al pool
+
+CONTADORES = ("aciertos", "fallos", "descargas", "deduplicados", "expulsados", "reanudadas", "expulsiones_aplazadas")
+
+
+class EscrituraDocumento:
+    """
+    Temporal que se va hasheando según se escribe; `confirmar` lo publica en el almacén.
+    Con `ruta_parcial` el temporal es fijo y reanudable: si ya existe, se continúa
+    a partir de lo escrito (que se vuelve a hashear) y, si la descarga queda
+    corta, se conserva para la siguiente vez.
+    """
+
+    def __init__(self, almacen, ruta_parcial=None):
+        self._almacen = almacen
+        self._sha = hashlib.sha256()
+        self.tamano = 0
+        self.reanudable = ruta_parcial is not None
+        if self.reanudable:
+            self.ruta_tmp = ruta_parcial
+            if os.path.exists(ruta_parcial):
+                with open(ruta_parcial, "rb") as f:
+                    while trozo := f.read(1024 * 1024):
+                        self._sha.update(trozo)
+                        self.tamano += len(trozo)
+            self._f = open(ruta_parcial, "ab")
+        else:
+            fd, self.ruta_tmp = tempfile.mkstemp(dir=almacen.dir_tmp, suffix=".tmp")
+            self._f = os.fdopen(fd, "wb")
+
+    def reiniciar(self):
+        """Descarta lo escrito (el servidor no admite Range o no cuadra el rango)."""
+        self._f.seek(0)
+        self._f.truncate()
+        self._sha = hashlib.sha256()
+        self.tamano = 0
+
+    def write(self, trozo):
+        self._f.write(trozo)
+        self._sha.update(trozo)
+        self.tamano += len(trozo)
+
+    def confirmar(self, id_documento=None, mime=None, nombre=None, tamano_esperado=None, fijar=False):
+        """
+        Publica el contenido bajo `id_documento` (por defecto, su propio hash).
+        Devuelve la entrada del índice, o None si el tamaño no es el esperado.
+        Con `fijar` la entrada lleva 'lectura' (ver `AlmacenDocumentos.soltar`).
+        """
+        self._f.close()
+        if tamano_esperado is not None and int(tamano_esperado) != self.tamano:
+            print(f"⚠️ Documento {id_documento} incompleto: {self.tamano} de {tamano_esperado} bytes")
+            if not (self.reanudable and self.tamano < int(tamano_esperado)):
+                self.descartar()
+            return None
+        sha = self._sha.hexdigest()
+        return self._almacen._publicar(self.ruta_tmp, sha, self.tamano, id_documento or sha, mime, nombre, fijar)
+
+    def descartar(self):
+        self._f.close()
+        if os.path.exists(self.ruta_tmp):
+            os.remove(self.ruta_tmp)
+
+    def cerrar(self):
+        """Cierra sin publicar ni borrar (una escritura reanudable se retoma después)."""
+        self._f.close()
+
+
+class EscrituraAsincrona:
+    """
+    `EscrituraDocumento` para endpoints async: acumula los trozos y los escribe
+    (y hashea) en el pool de hilos por bloques de TROZO_ESCRITURA_ASYNC, y
+    confirma/descarta también allí, así que el bucle de eventos no toca el
+    disco ni SQLite.
+    """
+
+    def __init__(self, escritura):
+        self.escritura = escritura
+        self._pendiente = bytearray()
+
+    @classmethod
+    async def abrir(cls, almacen):
+        return cls(await anyio.to_thread.run_sync(almacen.nueva_escritura))
+
+    @property
+    def tamano(self):
+        return self.escritura.tamano + len(self._pendiente)
+
+    async def write(self, trozo):
+        self._pendiente.extend(trozo)
+        if len(self._pendiente) >= TROZO_ESCRITURA_ASYNC:
+            await self._volcar()
+
+    async def _volcar(self):
+        if self._pendiente:
+            datos, self._pendiente = bytes(self._pendiente), bytearray()
+            await anyio.to_thread.run_sync(self.escritura.write, datos)
+
+    async def confirmar(self, id_documento=None, mime=None, nombre=None, tamano_esperado=None):
+        await self._volcar()
+        return await anyio.to_thread.run_sync(
+            lambda: self.escritura.confirmar(id_documento, mime=mime, nombre=nombre, tamano_esperado=tamano_esperado))
+
+    async def descartar(self):
+        # También con la petición cancelada (cliente desconectado): no queda un temporal huérfano
+        with anyio.CancelScope(shield=True):
+            await anyio.to_thread.run_sync(self.escritura.descartar)
+
+
+class AlmacenDocumentos(AlmacenSQLite):
+    """Documentos en disco por SHA-256 con índice `id -> contenido` y presupuesto LRU."""
+
+    CONTADORES = CONTADORES
+
+    def __init__(self, directorio=DOCUMENTOS_DIR, max_bytes=DOCUMENTOS_MAX_BYTES, url_documento=URL_DOCUMENTO):
+        self.directorio = directorio
+        self.dir_tmp = os.path.join(directorio, "tmp")
+        self.max_bytes = max_bytes
+        self.url_documento = url_documento
+        os.makedirs(self.dir_tmp, exist_ok=True)
+        super().__init__(os.path.join(directorio, "indice.sqlite"))
+
+    def _crear_tablas(self, con):
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                tamano INTEGER NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )""")
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS documentos (
+                id_documento TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+                tamano INTEGER NOT NULL,
+                mime TEXT,
+                nombre TEXT,
+                obtenido_en REAL NOT NULL
+            )""")
+        # Lecturas en curso: el blob no se expulsa mientras tenga alguna sin caducar
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS lecturas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sha256 TEXT NOT NULL,
+                hasta REAL NOT NULL
+            )""")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_blobs_acceso ON blobs(ultimo_acceso)")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_lecturas_sha ON lecturas(sha256)")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_documentos_sha ON documentos(sha256)")
+
+    def ruta_blob(self, sha):
+        return os.path.join(self.directorio, "blobs", sha[:2], sha)
+
+    # ---------- lectura ----------
+    def buscar(self, id_documento, fijar=False):
+        """
+        Entrada del índice (con 'ruta') si el documento está en disco; None si no.
+        Con `fijar` el blob no se expulsa hasta `soltar(info["lectura"])`.
+        """
+        clave = str(id_documento)
+        con = self._conexion()
+        fila = con.execute(
+            "SELECT sha256, tamano, mime, nombre, obtenido_en FROM documentos WHERE id_documento = ?", (clave,)
+        ).fetchone()
+        with con:
+            if fila is None:
+                self._contar(con, "fallos")
+                return None
+            sha, tamano, mime, nombre, obtenido_en = fila
+            ruta = self.ruta_blob(sha)
+            if not os.path.exists(ruta):
+                # Borrado a mano del disco: se olvida la entrada
+                con.execute("DELETE FROM documentos WHERE sha256 = ?", (sha,))
+                con.execute("DELETE FROM blobs WHERE sha256 = ?", (sha,))
+                self._contar(con, "fallos")
+                return None
+            con.execute("UPDATE blobs SET ultimo_acceso = ? WHERE sha256 = ?", (time.time(), sha))
+            self._contar(con, "aciertos")
+            info = {"id": clave, "sha256": sha, "tamano": tamano, "mime": mime, "nombre": nombre,
+                    "obtenido_en": obtenido_en, "ruta": ruta}
+            if fijar:
+                info["lectura"] = self._fijar(con, sha)
+        return info
+
+    def obtener(self, id_documento, nombre=None, reintentos=REINTENTOS_DESCARGA, fijar=False):
+        """
+        Lectura a través del almacén (código síncrono): devuelve la entrada del
+        documento y, si no está en disco, lo descarga antes de la BDNS
+        (reanudando con Range un `.part` previo o cortado). La entrada lleva
+        además 'bytes_descargados' (0 si ya estaba). None si la BDNS no lo sirve.
+        `fijar` como en `buscar`.
+        """
+        info = self.buscar(id_documento, fijar=fijar)
+        if info is not None:
+            return {**info, "bytes_descargados": 0}
+        with self._lock_documento(id_documento):
+            info = self.buscar(id_documento, fijar=fijar)   # otro hilo pudo terminarlo mientras esperábamos
+            if info is not None:
+                return {**info, "bytes_descargados": 0}
+            recibidos = [0]   # acumulado entre intentos, también los cortados
+            for intento in range(reintentos + 1):
+                antes = recibidos[0]
+                try:
+                    info = self._descargar(id_documento, nombre, recibidos, fijar)
+                except Exception as e:
+                    # Corte a mitad: el .part se queda y el siguiente intento sigue desde ahí
+                    if intento == reintentos:
+                        raise
+                    print(f"⚠️ Descarga de {id_documento} interrumpida ({e}); reanudando...")
+                    continue
+                if info is not None or recibidos[0] == antes:
+                    break
+            return {**info, "bytes_descargados": recibidos[0]} if info else None
+
+    def _descargar(self, id_documento, nombre, recibidos, fijar=False):
+        """Un intento de descarga sobre `<id>.part`; suma a `recibidos[0]` los bytes que lleguen."""
+        escritura = self.nueva_escritura(os.path.join(self.dir_tmp, f"{id_documento}.part"))
+        url = self.url_documento.format(id_documento)
+        r = CLIENTE_BDNS.abrir_stream_sync(url, headers={"Range": f"bytes={escritura.tamano}-"} if escritura.tamano else None)
+        total = r.headers.get("Content-Length")
+        if escritura.tamano and r.status_code == 206:
+            # Content-Range: bytes <inicio>-<fin>/<total>
+            rango, _, total = r.headers.get("Content-Range", "").partition("/")
+            inicio = rango.replace("bytes", "").strip().split("-")[0]
+            total = total if total.isdigit() else None
+            if inicio.isdigit() and int(inicio) == escritura.tamano:
+                with self._conexion() as con:
+                    self._contar(con, "reanudadas")
+            else:
+                r.status_code = 416   # rango que no cuadra: como si no se pudiera reanudar
+        if escritura.tamano and r.status_code == 416:
+            # El .part no encaja con el documento actual: se empieza de cero
+            r.cerrar_sync()
+            escritura.reiniciar()
+            r = CLIENTE_BDNS.abrir_stream_sync(url)
+            total = r.headers.get("Content-Length")
+        elif escritura.tamano and r.status_code == 200:
+            escritura.reiniciar()   # sin soporte de Range: la respuesta es el fichero entero
+        if not r.is_success:
+            r.cerrar_sync()
+            escritura.cerrar()
+            return None
+
+        try:
+            for trozo in r.iter_bytes_sync():
+                escritura.write(trozo)
+                recibidos[0] += len(trozo)
+        except Exception:
+            escritura.cerrar()
+            raise
+        return escritura.confirmar(id_documento, mime=r.headers.get("Content-Type"), nombre=nombre,
+                                   tamano_esperado=total, fijar=fijar)
+
+    @contextmanager
+    def _lock_documento(self, id_documento):
+        """
+        Un único escritor por documento para su `.part`, entre hilos y entre
+        procesos (varios workers comparten el directorio): flock sobre
+        `<id>.part.lock`, que el sistema suelta aunque el proceso muera. Al
+        terminar se borra el fichero de lock; quien lo tenía abierto esperando
+        comprueba después de bloquearlo que sigue siendo el de la ruta.
+        """
+        ruta = os.path.join(self.dir_tmp, f"{id_documento}.part.lock")
+        while True:
+            f = open(ruta, "a")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(ruta).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()   # lo borró quien lo tenía: se vuelve a abrir
+        try:
+            yield
+        finally:
+            os.remove(ruta)
+            f.close()
+
+    # ---------- lecturas en curso ----------
+    def _fijar(self, con, sha):
+        cursor = con.execute("INSERT INTO lecturas (sha256, hasta) VALUES (?, ?)",
+                             (sha, time.time() + LECTURA_MAX_SEGUNDOS))
+        return cursor.lastrowid
+
+    def soltar(self, lectura):
+        """Termina una lectura fijada con `fijar=True`; el blob vuelve a poder expulsarse."""
+        con = self._conexion()
+        with con:
+            con.execute("DELETE FROM lecturas WHERE id = ? OR hasta < ?", (lectura, time.time()))
+
+    @contextmanager
+    def en_uso(self, id_documento, nombre=None):
+        """`obtener` con el blob fijado durante el bloque (None si la BDNS no lo sirve)."""
+        info = self.obtener(id_documento, nombre=nombre, fijar=True)
+        try:
+            yield info
+        finally:
+            if info is not None:
+                self.soltar(info["lectura"])
+
+    # ---------- escritura ----------
+    def nueva_escritura(self, ruta_parcial=None):
+        return EscrituraDocumento(self, ruta_parcial)
+
+    def _publicar(self, ruta_tmp, sha, tamano, id_documento, mime, nombre, fijar=False):
+        destino = self.ruta_blob(sha)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if os.path.exists(destino):
+            os.remove(ruta_tmp)
+            motivo = "deduplicados"
+        else:
+            os.replace(ruta_tmp, destino)  # atómico: nunca se ve un fichero a medias
+            motivo = "descargas"
+        ahora = time.time()
+        con = self._conexion()
+        with con:
+            con.execute(
+                "INSERT INTO blobs (sha256, tamano, ultimo_acceso) VALUES (?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET ultimo_acceso = excluded.ultimo_acceso",
+                (sha, tamano, ahora),
+            )
+            con.execute(
+                "INSERT OR REPLACE INTO documentos (id_documento, sha256, tamano, mime, nombre, obtenido_en) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (str(id_documento), sha, tamano, mime, nombre, ahora),
+            )
+            self._contar(con, motivo)
+            info = {"id": str(id_documento), "sha256": sha, "tamano": tamano, "mime": mime, "nombre": nombre,
+                    "obtenido_en": ahora, "ruta": destino}
+            if fijar:
+                info["lectura"] = self._fijar(con, sha)
+            self._expulsar_por_tamano(con, conservar=sha)
+        return info
+
+    def _expulsar_por_tamano(self, con, conservar=None):
+        # LRU por contenido hasta volver al presupuesto de disco (nunca el recién publicado,
+        # uno con lecturas en curso o uno usado hace menos de MARGEN_EXPULSION)
+        (total,) = con.execute("SELECT COALESCE(SUM(tamano), 0) FROM blobs").fetchone()
+        if total <= self.max_bytes:
+            return
+        ahora = time.time()
+        for sha, tamano in con.execute(
+            "SELECT sha256, tamano FROM blobs WHERE sha256 != ? AND ultimo_acceso < ? "
+            "AND sha256 NOT IN (SELECT sha256 FROM lecturas WHERE hasta >= ?) ORDER BY ultimo_acceso ASC",
+            (conservar or "", ahora - MARGEN_EXPULSION, ahora),
+        ).fetchall():
+            con.execute("DELETE FROM documentos WHERE sha256 = ?", (sha,))
+            con.execute("DELETE FROM blobs WHERE sha256 = ?", (sha,))
+            ruta = self.ruta_blob(sha)
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            self._contar(con, "expulsados")
+            total -= tamano
+            if total <= self.max_bytes:
+                return
+        # Lo que queda está en uso: se supera el presupuesto hasta la próxima publicación
+        print(f"⚠️ Almacén de documentos por encima del presupuesto ({total / 1e6:.1f} MB): blobs en uso")
+        self._contar(con, "expulsiones_aplazadas")
+
+    def estadisticas(self):
+        stats = self._contadores()
+        con = self._conexion()
+        stats["documentos"] = con.execute("SELECT COUNT(*) FROM documentos").fetchone()[0]
+        stats["blobs"], stats["bytes"] = con.execute("SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM blobs").fetchone()
+        stats["max_bytes"] = self.max_bytes
+        stats["lecturas_en_curso"] = con.execute(
+            "SELECT COUNT(*) FROM lecturas WHERE hasta >= ?", (time.time(),)).fetchone()[0]
+        return stats
@@ -0,0 +1,65 @@
+"""
+Base común de las cachés y almacenes en SQLite (detalle de convocatorias,
+estados, espejo de la BDNS).
+
+Aporta lo que todos repiten: una conexión por hilo en modo WAL, la tabla de
+contadores `estadisticas` compartida por todos los procesos y la expulsión
+LRU por columna de último acceso. Cada subclase crea sus tablas en
+`_crear_tablas(con)`.
+"""
+import os
+import sqlite3
+import threading
+
+
+class AlmacenSQLite:
+    """Fichero SQLite compartido por hilos y procesos (WAL) con contadores persistidos."""
+
+    CONTADORES = ()
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        con = self._conexion()
+        with con:
+            con.execute("CREATE TABLE IF NOT EXISTS estadisticas (clave TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+            con.executemany("INSERT OR IGNORE INTO estadisticas (clave, valor) VALUES (?, 0)",
+                            [(c,) for c in self.CONTADORES])
+            self._crear_tablas(con)
+
+    def _crear_tablas(self, con):
+        raise NotImplementedError
+
+    # ---------- conexión ----------
+    def _conexion(self):
+        # Una conexión por hilo: sqlite3 no comparte conexiones entre hilos
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    # ---------- contadores ----------
+    def _contar(self, con, clave, n=1):
+        """Incrementa un contador dentro de la transacción abierta en `con`."""
+        con.execute("UPDATE estadisticas SET valor = valor + ? WHERE clave = ?", (n, clave))
+
+    def _contadores(self):
+        return dict(self._conexion().execute("SELECT clave, valor FROM estadisticas").fetchall())
+
+    # ---------- expulsión ----------
+    def _expulsar(self, con, tabla, clave, max_entradas, columna_acceso="ultimo_acceso"):
+        # LRU: se eliminan las entradas menos usadas recientemente que sobren
+        (total,) = con.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()
+        sobrantes = total - max_entradas
+        if sobrantes > 0:
+            con.execute(
+                f"DELETE FROM {tabla} WHERE {clave} IN ("
+                f"SELECT {clave} FROM {tabla} ORDER BY {columna_acceso} ASC LIMIT ?)",
+                (sobrantes,),
+            )
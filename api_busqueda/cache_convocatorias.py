@@ -0,0 +1,145 @@
+"""
+Caché persistente (SQLite) del detalle de convocatorias de la BDNS.
+
+Se guarda el JSON devuelto por `/bdnstrans/api/convocatorias?numConv=...` con:
+- TTL configurable: dentro del TTL se sirve directamente desde disco.
+- stale-while-revalidate: pasado el TTL (y dentro de la ventana `stale`) se
+  devuelve el dato antiguo y se refresca en segundo plano.
+- Expulsión LRU cuando se supera el número máximo de entradas.
+- Contadores de aciertos/fallos persistidos, compartidos por todos los workers.
+
+Al ser un fichero SQLite en modo WAL sobrevive a reinicios y lo pueden usar
+varios procesos de uvicorn a la vez.
+"""
+import json
+import os
+import threading
+import time
+
+import httpx
+
+from almacen_sqlite import AlmacenSQLite
+
+# ======== CONFIGURACIÓN ========
+CACHE_DB = os.getenv("BDNS_CACHE_DB", "data/cache/convocatorias.sqlite")
+CACHE_TTL = int(os.getenv("BDNS_CACHE_TTL", str(6 * 3600)))          # segundos
+CACHE_STALE = int(os.getenv("BDNS_CACHE_STALE", str(24 * 3600)))     # ventana extra sirviendo dato caducado
+CACHE_MAX_ENTRADAS = int(os.getenv("BDNS_CACHE_MAX_ENTRADAS", "5000"))
+BLOQUEO_REVALIDACION = 60  # segundos que una revalidación en curso bloquea a las demás
+
+CONTADORES = ("aciertos", "aciertos_caducados", "fallos", "errores_origen", "revalidaciones")
+
+
+class CacheConvocatorias(AlmacenSQLite):
+    """Caché clave-valor `numConv -> detalle` respaldada por SQLite."""
+
+    CONTADORES = CONTADORES
+
+    def __init__(self, ruta=CACHE_DB, ttl=CACHE_TTL, stale=CACHE_STALE, max_entradas=CACHE_MAX_ENTRADAS):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entradas = max_entradas
+        super().__init__(ruta)
+
+    def _crear_tablas(self, con):
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS convocatorias (
+                num_conv TEXT PRIMARY KEY,
+                datos TEXT NOT NULL,
+                guardado_en REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL,
+                revalidando_desde REAL
+            )""")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_conv_acceso ON convocatorias(ultimo_acceso)")
+
+    # ---------- API pública ----------
+    def obtener(self, num_conv, cargar):
+        """
+        Devuelve el detalle de `num_conv`. Si no está en caché (o ha caducado del
+        todo) se llama a `cargar(num_conv)`, que debe devolver el dict o None.
+        """
+        clave = str(num_conv).strip()
+        con = self._conexion()
+        ahora = time.time()
+        fila = con.execute(
+            "SELECT datos, guardado_en FROM convocatorias WHERE num_conv = ?", (clave,)
+        ).fetchone()
+
+        if fila is not None:
+            datos, guardado_en = fila
+            edad = ahora - guardado_en
+            if edad <= self.ttl:
+                with con:
+                    con.execute("UPDATE convocatorias SET ultimo_acceso = ? WHERE num_conv = ?", (ahora, clave))
+                    self._contar(con, "aciertos")
+                return json.loads(datos)
+            if edad <= self.ttl + self.stale:
+                with con:
+                    con.execute("UPDATE convocatorias SET ultimo_acceso = ? WHERE num_conv = ?", (ahora, clave))
+                    self._contar(con, "aciertos_caducados")
+                self._revalidar_en_segundo_plano(clave, cargar, guardado_en)
+                return json.loads(datos)
+
+        with con:
+            self._contar(con, "fallos")
+        try:
+            nuevo = cargar(num_conv)
+        except httpx.HTTPError as e:
+            # Timeout o error de conexión con el origen: se trata igual que una respuesta vacía
+            print(f"Error descargando la convocatoria {clave}: {e}")
+            nuevo = None
+        if nuevo is None:
+            with con:
+                self._contar(con, "errores_origen")
+            # stale-if-error: mejor un dato antiguo que ninguno
+            return json.loads(fila[0]) if fila is not None else None
+        self.guardar(clave, nuevo)
+        return nuevo
+
+    def guardar(self, num_conv, datos):
+        clave = str(num_conv).strip()
+        ahora = time.time()
+        con = self._conexion()
+        with con:
+            con.execute(
+                "INSERT OR REPLACE INTO convocatorias (num_conv, datos, guardado_en, ultimo_acceso, revalidando_desde) "
+                "VALUES (?, ?, ?, ?, NULL)",
+                (clave, json.dumps(datos, ensure_ascii=False), ahora, ahora),
+            )
+            self._expulsar(con, "convocatorias", "num_conv", self.max_entradas)
+
+    def _revalidar_en_segundo_plano(self, clave, cargar, guardado_en):
+        # Marca atómica en la propia tabla: solo un hilo/proceso refresca cada entrada,
+        # y solo si sigue siendo la versión caducada que se leyó (otro pudo refrescarla ya)
+        ahora = time.time()
+        with self._conexion() as con:
+            cur = con.execute(
+                "UPDATE convocatorias SET revalidando_desde = ? WHERE num_conv = ? AND guardado_en = ? "
+                "AND (revalidando_desde IS NULL OR revalidando_desde < ?)",
+                (ahora, clave, guardado_en, ahora - BLOQUEO_REVALIDACION),
+            )
+            if cur.rowcount != 1:
+                return
+            self._contar(con, "revalidaciones")
+
+        def _refrescar():
+            try:
+                nuevo = cargar(clave)
+            except Exception as e:
+                print(f"Error revalidando la convocatoria {clave}: {e}")
+                nuevo = None
+            if nuevo is not None:
+                self.guardar(clave, nuevo)
+            else:
+                with self._conexion() as con:
+                    con.execute("UPDATE convocatorias SET revalidando_desde = NULL WHERE num_conv = ?", (clave,))
+
+        threading.Thread(target=_refrescar, daemon=True).start()
+
+    def estadisticas(self):
+        """Contadores acumulados (todos los procesos) y llamadas al origen ahorradas."""
+        stats = self._contadores()
+        (entradas,) = self._conexion().execute("SELECT COUNT(*) FROM convocatorias").fetchone()
+        stats["entradas"] = entradas
+        stats["llamadas_ahorradas"] = stats.get("aciertos", 0) + stats.get("aciertos_caducados", 0)
+        return stats
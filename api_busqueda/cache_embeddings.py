@@ -0,0 +1,135 @@
+"""
+Caché global de embeddings por fragmento de texto.
+
+Las bases de las convocatorias repiten mucho texto legal (referencias a la
+Ley 38/2003, cláusulas estándar de justificación...), así que los mismos
+fragmentos aparecen en muchos documentos. Cada fragmento se identifica por
+hash(texto normalizado, modelo) y su vector se guarda una sola vez:
+- vectores: fichero float32 de solo-añadir (`<modelo>.f32`), leído con memmap;
+- índice compacto huella (16 bytes) -> fila en SQLite (WITHOUT ROWID).
+
+`embeber(textos, funcion)` devuelve los vectores en orden y solo llama a
+`funcion` una vez, con los fragmentos que no están en la caché.
+Lo usan los modelos de embeddings de `rag_openai.py` y `rag.py`.
+"""
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+from almacen_sqlite import AlmacenSQLite
+
+# ======== CONFIGURACIÓN ========
+EMBEDDINGS_CACHE_DIR = os.getenv("EMBEDDINGS_CACHE_DIR", "data/cache/embeddings")
+MAX_PARAMETROS_SQL = 500
+
+CONTADORES = ("aciertos", "fallos")
+
+_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_fragmento(texto):
+    # Solo diferencias que no cambian el embedding de forma apreciable: Unicode y espacios
+    return _ESPACIOS.sub(" ", unicodedata.normalize("NFC", texto)).strip()
+
+
+class CacheEmbeddings(AlmacenSQLite):
+    """Vectores de un modelo de embeddings en un fichero memmap de solo-añadir + índice SQLite."""
+
+    CONTADORES = CONTADORES
+
+    def __init__(self, modelo, directorio=EMBEDDINGS_CACHE_DIR):
+        self.modelo = modelo
+        nombre = re.sub(r"[^A-Za-z0-9_.-]+", "_", modelo)
+        self.ruta_vectores = os.path.join(directorio, f"{nombre}.f32")
+        self._lock = threading.Lock()
+        self._mapa = None
+        super().__init__(os.path.join(directorio, f"{nombre}.sqlite"))
+        fila = self._conexion().execute("SELECT valor FROM meta WHERE clave = 'dimension'").fetchone()
+        self.dimension = int(fila[0]) if fila else None
+
+    def _crear_tablas(self, con):
+        con.execute("CREATE TABLE IF NOT EXISTS filas (huella BLOB PRIMARY KEY, fila INTEGER NOT NULL) WITHOUT ROWID")
+        con.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT NOT NULL)")
+
+    def huella(self, texto):
+        datos = f"{self.modelo}\0{normalizar_fragmento(texto)}".encode("utf-8")
+        return hashlib.sha256(datos).digest()[:16]
+
+    # ---------- vectores ----------
+    def _vectores(self, filas_necesarias):
+        # Se vuelve a mapear solo si el fichero ha crecido por encima de lo mapeado
+        with self._lock:
+            if self._mapa is None or len(self._mapa) < filas_necesarias:
+                filas = os.path.getsize(self.ruta_vectores) // (4 * self.dimension)
+                self._mapa = np.memmap(self.ruta_vectores, dtype=np.float32, mode="r", shape=(filas, self.dimension))
+            return self._mapa
+
+    def buscar(self, huellas):
+        """{huella: vector} de las huellas que están en la caché."""
+        con = self._conexion()
+        filas = {}
+        for i in range(0, len(huellas), MAX_PARAMETROS_SQL):
+            lote = huellas[i:i + MAX_PARAMETROS_SQL]
+            filas.update(con.execute(
+                f"SELECT huella, fila FROM filas WHERE huella IN ({','.join('?' * len(lote))})", lote
+            ).fetchall())
+        if not filas:
+            return {}
+        mapa = self._vectores(max(filas.values()) + 1)
+        return {h: np.array(mapa[f]) for h, f in filas.items()}
+
+    def guardar(self, huellas, vectores):
+        vectores = np.ascontiguousarray(vectores, dtype=np.float32)
+        con = self._conexion()
+        # BEGIN IMMEDIATE serializa entre procesos el "añadir al fichero + indexar"
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if self.dimension is None:
+                self.dimension = vectores.shape[1]
+                con.execute("INSERT OR IGNORE INTO meta (clave, valor) VALUES ('dimension', ?)", (str(self.dimension),))
+            bytes_fila = 4 * self.dimension
+            tamano = os.path.getsize(self.ruta_vectores) if os.path.exists(self.ruta_vectores) else 0
+            primera = -(-tamano // bytes_fila)   # redondeo hacia arriba por si quedó una escritura a medias
+            with open(self.ruta_vectores, "r+b" if tamano else "wb") as f:
+                f.seek(primera * bytes_fila)
+                f.write(vectores.tobytes())
+            con.executemany("INSERT OR IGNORE INTO filas (huella, fila) VALUES (?, ?)",
+                            [(h, primera + i) for i, h in enumerate(huellas)])
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+
+    # ---------- API pública ----------
+    def embeber(self, textos, funcion_embeber):
+        """
+        Vectores (np.float32, uno por texto y en orden) usando la caché;
+        `funcion_embeber(lista)` se llama una sola vez con los que faltan.
+        """
+        huellas = [self.huella(t) for t in textos]
+        unicas = list(dict.fromkeys(huellas))
+        encontrados = self.buscar(unicas) if self.dimension else {}
+
+        faltan = [h for h in unicas if h not in encontrados]
+        if faltan:
+            texto_de = dict(zip(huellas, textos))
+            nuevos = np.asarray(funcion_embeber([texto_de[h] for h in faltan]), dtype=np.float32)
+            self.guardar(faltan, nuevos)
+            encontrados.update(zip(faltan, nuevos))
+
+        con = self._conexion()
+        with con:
+            self._contar(con, "aciertos", len(unicas) - len(faltan))
+            self._contar(con, "fallos", len(faltan))
+        print(f"🧠 Embeddings {self.modelo}: {len(unicas) - len(faltan)} en caché, {len(faltan)} calculados")
+        return np.stack([encontrados[h] for h in huellas]) if huellas else np.zeros((0, self.dimension or 0), np.float32)
+
+    def estadisticas(self):
+        stats = self._contadores()
+        stats["vectores"] = self._conexion().execute("SELECT COUNT(*) FROM filas").fetchone()[0]
+        stats["dimension"] = self.dimension
+        return stats
@@ -0,0 +1,135 @@
+"""
+Caché persistente (SQLite) del estado de las convocatorias.
+
+El estado ("abierta", "cerrada", "cerrada-no-publica", "desconocido") casi
+nunca cambia y, cuando lo hace, es porque vence su plazo. Cada entrada guarda:
+- una huella (SHA-256) de los datos de los que se deduce el estado (textFin,
+  anuncios, documentos y fechas): si el detalle cambia, la entrada no vale;
+- la fecha de cierre deducida, si se conoce: una convocatoria "abierta" deja
+  de ser válida en cuanto HOY supera esa fecha;
+- una caducidad: corta para "desconocido", moderada para las abiertas sin
+  fecha de cierre conocida (p.ej. "hasta agotar fondos" o decididas por el LLM)
+  y más larga para las cerradas deducidas de texto libre (reglas o LLM), que
+  pueden ser un error de interpretación. Solo no caducan las decididas por
+  datos estructurados (`fechaFinSolicitud`, concesión directa).
+"""
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime
+
+from almacen_sqlite import AlmacenSQLite
+
+# ======== CONFIGURACIÓN ========
+ESTADOS_CACHE_DB = os.getenv("ESTADOS_CACHE_DB", "data/cache/estados.sqlite")
+ESTADOS_TTL_DESCONOCIDO = int(os.getenv("ESTADOS_TTL_DESCONOCIDO", str(3600)))         # segundos
+ESTADOS_TTL_SIN_FECHA = int(os.getenv("ESTADOS_TTL_SIN_FECHA", str(24 * 3600)))        # abiertas sin fecha de cierre
+ESTADOS_TTL_CERRADA = int(os.getenv("ESTADOS_TTL_CERRADA", str(7 * 24 * 3600)))         # cerradas por texto libre
+ESTADOS_MAX_ENTRADAS = int(os.getenv("ESTADOS_CACHE_MAX_ENTRADAS", "20000"))
+
+# Campos del detalle que intervienen en el estado (motor de reglas y prompt del LLM)
+CAMPOS_HUELLA = ("textFin", "anuncios", "documentos", "fechaFinSolicitud", "fechaInicioSolicitud",
+                 "fechaRecepcion", "tipoConvocatoria")
+
+# Reglas de `plazos.decidir_estado` basadas en campos estructurados: su veredicto no caduca
+REGLAS_DEFINITIVAS = {"fecha_fin_estructurada", "concesion_directa"}
+
+CONTADORES = ("aciertos", "fallos", "invalidadas_huella", "invalidadas_fecha", "caducadas")
+
+
+def huella_estado(dic):
+    """SHA-256 de los campos del detalle de los que depende el estado."""
+    datos = {campo: dic.get(campo) for campo in CAMPOS_HUELLA}
+    return hashlib.sha256(json.dumps(datos, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class CacheEstados(AlmacenSQLite):
+    """Caché `numConv -> estado` invalidada por huella de entradas, fecha de cierre y TTL."""
+
+    CONTADORES = CONTADORES
+
+    def __init__(self, ruta=ESTADOS_CACHE_DB, ttl_desconocido=ESTADOS_TTL_DESCONOCIDO,
+                 ttl_sin_fecha=ESTADOS_TTL_SIN_FECHA, ttl_cerrada=ESTADOS_TTL_CERRADA,
+                 max_entradas=ESTADOS_MAX_ENTRADAS):
+        self.ttl_desconocido = ttl_desconocido
+        self.ttl_sin_fecha = ttl_sin_fecha
+        self.ttl_cerrada = ttl_cerrada
+        self.max_entradas = max_entradas
+        super().__init__(ruta)
+
+    def _crear_tablas(self, con):
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS estados (
+                num_conv TEXT PRIMARY KEY,
+                huella TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                regla TEXT,
+                fecha_cierre TEXT,
+                caduca_en REAL,
+                guardado_en REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )""")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_estados_acceso ON estados(ultimo_acceso)")
+
+    # ---------- API pública ----------
+    def obtener(self, num_conv, dic, hoy=None):
+        """
+        Estado guardado de `num_conv` si sigue siendo válido para el detalle `dic`
+        y el día `hoy`; None en caso contrario (hay que recalcularlo).
+        """
+        clave = str(num_conv).strip()
+        hoy = hoy or datetime.now().date()
+        con = self._conexion()
+        fila = con.execute(
+            "SELECT huella, estado, fecha_cierre, caduca_en FROM estados WHERE num_conv = ?", (clave,)
+        ).fetchone()
+
+        motivo = "fallos"
+        if fila is not None:
+            huella, estado, fecha_cierre, caduca_en = fila
+            if huella != huella_estado(dic):
+                motivo = "invalidadas_huella"
+            elif estado == "abierta" and fecha_cierre and hoy > date.fromisoformat(fecha_cierre):
+                motivo = "invalidadas_fecha"
+            elif caduca_en is not None and time.time() > caduca_en:
+                motivo = "caducadas"
+            else:
+                with con:
+                    con.execute("UPDATE estados SET ultimo_acceso = ? WHERE num_conv = ?", (time.time(), clave))
+                    self._contar(con, "aciertos")
+                return estado
+
+        with con:
+            self._contar(con, motivo)
+            if fila is not None:
+                con.execute("DELETE FROM estados WHERE num_conv = ?", (clave,))
+        return None
+
+    def guardar(self, num_conv, dic, estado, regla=None, fecha_cierre=None):
+        clave = str(num_conv).strip()
+        ahora = time.time()
+        if estado == "desconocido":
+            caduca_en = ahora + self.ttl_desconocido
+        elif estado == "abierta" and fecha_cierre is None:
+            caduca_en = ahora + self.ttl_sin_fecha
+        elif estado != "abierta" and regla not in REGLAS_DEFINITIVAS:
+            caduca_en = ahora + self.ttl_cerrada
+        else:
+            caduca_en = None
+        con = self._conexion()
+        with con:
+            con.execute(
+                "INSERT OR REPLACE INTO estados "
+                "(num_conv, huella, estado, regla, fecha_cierre, caduca_en, guardado_en, ultimo_acceso) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (clave, huella_estado(dic), estado, regla,
+                 fecha_cierre.isoformat() if fecha_cierre else None, caduca_en, ahora, ahora),
+            )
+            self._expulsar(con, "estados", "num_conv", self.max_entradas)
+
+    def estadisticas(self):
+        """Contadores acumulados (todos los procesos) y reparto de entradas por estado."""
+        stats = self._contadores()
+        stats["entradas"] = dict(self._conexion().execute("SELECT estado, COUNT(*) FROM estados GROUP BY estado").fetchall())
+        return stats
@@ -0,0 +1,146 @@
+"""
+Caché de consultas -> filtros parseados por el LLM (`parser_openai`).
+
+- Acierto exacto sobre la consulta normalizada (minúsculas, sin acentos,
+  espacios colapsados).
+- Acierto semántico: si se proporciona un `embedder`, las consultas casi
+  idénticas ("ayudas autónomos madrid" / "ayudas para autonomos en Madrid")
+  se resuelven por similitud coseno por encima de `umbral`.
+- Persistencia en SQLite (WAL, `AlmacenSQLite`): una fila por consulta con su
+  vector como BLOB, así que guardar una entrada no reescribe las demás y la
+  comparten todos los workers. Expulsión LRU por número de entradas.
+
+Para no confundir consultas que solo difieren en un dato concreto (un número
+de convocatoria, una provincia...) la búsqueda semántica solo compara entradas
+con la misma "guardia": los números de la consulta más la guardia extra que
+indique el llamador.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from almacen_sqlite import AlmacenSQLite
+from normalizacion import normalizar_texto
+
+# ======== CONFIGURACIÓN ========
+LLM_CACHE_MAX_ENTRADAS = int(os.getenv("LLM_CACHE_MAX_ENTRADAS", "500"))
+LLM_CACHE_UMBRAL = float(os.getenv("LLM_CACHE_UMBRAL", "0.93"))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "data/cache/filtros_llm.sqlite")
+
+CONTADORES = ("aciertos_exactos", "aciertos_semanticos", "fallos")
+
+
+def normalizar_consulta(consulta: str) -> str:
+    return normalizar_texto(consulta)
+
+
+class CacheFiltros(AlmacenSQLite):
+    """Caché LRU `consulta normalizada -> dict de filtros` con búsqueda semántica opcional."""
+
+    CONTADORES = CONTADORES
+
+    def __init__(self, max_entradas=LLM_CACHE_MAX_ENTRADAS, umbral=LLM_CACHE_UMBRAL,
+                 ruta=LLM_CACHE_DB, embedder=None):
+        self.max_entradas = max_entradas
+        self.umbral = umbral
+        self.embedder = embedder          # callable(texto) -> vector normalizado (np.ndarray) o None
+        self._vectores_recientes = OrderedDict()  # evita pedir dos veces el embedding de la misma consulta
+        self._lock = threading.Lock()
+        super().__init__(ruta)
+
+    def _crear_tablas(self, con):
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS filtros (
+                clave TEXT PRIMARY KEY,
+                filtros TEXT NOT NULL,
+                guardia TEXT NOT NULL,
+                vector BLOB,
+                ultimo_acceso REAL NOT NULL
+            )""")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_filtros_guardia ON filtros(guardia)")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_filtros_acceso ON filtros(ultimo_acceso)")
+
+    # ---------- API pública ----------
+    def obtener(self, consulta, guardia=()):
+        """Devuelve los filtros cacheados para `consulta` (una copia nueva) o None."""
+        clave = normalizar_consulta(consulta)
+        guardia = self._guardia(clave, guardia)
+        con = self._conexion()
+        fila = con.execute("SELECT filtros FROM filtros WHERE clave = ?", (clave,)).fetchone()
+        if fila is not None:
+            return self._acierto(con, clave, fila[0], "aciertos_exactos")
+
+        vector = self._vector(clave)
+        if vector is not None:
+            candidatas = con.execute(
+                "SELECT clave, filtros, vector FROM filtros WHERE guardia = ? AND vector IS NOT NULL", (guardia,)
+            ).fetchall()
+            candidatas = [c for c in candidatas if len(c[2]) == vector.nbytes]
+            if candidatas:
+                matriz = np.vstack([np.frombuffer(c[2], dtype=np.float32) for c in candidatas])
+                similitudes = matriz @ vector
+                mejor = int(np.argmax(similitudes))
+                if similitudes[mejor] >= self.umbral:
+                    return self._acierto(con, candidatas[mejor][0], candidatas[mejor][1], "aciertos_semanticos")
+
+        with con:
+            self._contar(con, "fallos")
+        return None
+
+    def guardar(self, consulta, filtros, guardia=()):
+        if not isinstance(filtros, dict):
+            return
+        clave = normalizar_consulta(consulta)
+        vector = self._vector(clave)
+        con = self._conexion()
+        with con:
+            con.execute(
+                "INSERT OR REPLACE INTO filtros (clave, filtros, guardia, vector, ultimo_acceso) VALUES (?, ?, ?, ?, ?)",
+                (clave, json.dumps(filtros, ensure_ascii=False), self._guardia(clave, guardia),
+                 vector.tobytes() if vector is not None else None, time.time()),
+            )
+            self._expulsar(con, "filtros", "clave", self.max_entradas)
+
+    def __len__(self):
+        return self._conexion().execute("SELECT COUNT(*) FROM filtros").fetchone()[0]
+
+    def estadisticas(self):
+        stats = self._contadores()
+        stats["entradas"] = len(self)
+        return stats
+
+    # ---------- auxiliares ----------
+    def _acierto(self, con, clave, filtros, contador):
+        with con:
+            con.execute("UPDATE filtros SET ultimo_acceso = ? WHERE clave = ?", (time.time(), clave))
+            self._contar(con, contador)
+        return json.loads(filtros)
+
+    @staticmethod
+    def _guardia(clave, guardia):
+        numeros = sorted(re.findall(r"\d+", clave))
+        return json.dumps([numeros, sorted(guardia)])
+
+    def _vector(self, clave):
+        if self.embedder is None:
+            return None
+        with self._lock:
+            if clave in self._vectores_recientes:
+                return self._vectores_recientes[clave]
+        try:
+            vector = self.embedder(clave)
+        except Exception as e:
+            print(f"No se pudo calcular el embedding de la consulta: {e}")
+            return None
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._vectores_recientes[clave] = vector
+            while len(self._vectores_recientes) > 64:
+                self._vectores_recientes.popitem(last=False)
+        return vector
@@ -0,0 +1,243 @@
+"""
+Clasificador por embeddings de beneficiario / instrumento / finalidad.
+
+Las descripciones de TIPOS_BENEFICIARIO_MAP, INSTRUMENTOS_MAP y FINALIDADES_MAP
+se embeben UNA vez (un único request) y se guardan en disco. Cada consulta se
+compara contra todas ellas con un producto matriz-vector y, por categoría, se
+decide:
+
+- "segura": la mejor descripción supera el umbral de confianza con margen
+  suficiente sobre la siguiente -> se usa su ID sin preguntar al LLM.
+- "ausente": categoría opcional cuya mejor similitud queda por debajo del
+  umbral de ausencia -> la consulta no habla de ella y no se filtra.
+- "dudosa": cualquier otro caso -> se delega en el LLM.
+
+Los umbrales por categoría se calibran sobre las consultas etiquetadas con
+`python evaluar_clasificador.py --calibrar`, que los guarda junto a la matriz
+(`CLASIFICADOR_UMBRALES_PATH`, con la huella de modelo + descripciones y las
+métricas obtenidas). Si no hay calibración para la matriz actual se usan
+UMBRALES_POR_DEFECTO (provisionales); la variable de entorno
+CLASIFICADOR_UMBRALES (JSON) prevalece sobre ambos.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from mapas_bdns import TIPOS_BENEFICIARIO_MAP, INSTRUMENTOS_MAP, FINALIDADES_MAP
+
+# ======== CONFIGURACIÓN ========
+EMBEDDINGS_MAPAS_PATH = os.getenv("EMBEDDINGS_MAPAS_PATH", "data/cache/embeddings_mapas.npz")
+CLASIFICADOR_UMBRALES_PATH = os.getenv("CLASIFICADOR_UMBRALES_PATH", "data/cache/umbrales_clasificador.json")
+
+# maximo: nº de IDs que puede devolver; obligatoria: el prompt exige siempre un valor
+CATEGORIAS = {
+    "tiposBeneficiario": {"mapa": TIPOS_BENEFICIARIO_MAP, "maximo": 2, "obligatoria": False, "lista": True},
+    "instrumentos": {"mapa": INSTRUMENTOS_MAP, "maximo": 1, "obligatoria": False, "lista": False},
+    "finalidad": {"mapa": FINALIDADES_MAP, "maximo": 1, "obligatoria": True, "lista": False},
+}
+
+# Provisionales: solo se usan si no hay calibración guardada para la matriz actual
+UMBRALES_POR_DEFECTO = {
+    "tiposBeneficiario": {"confianza": 0.42, "margen": 0.04, "ausencia": 0.30},
+    "instrumentos": {"confianza": 0.45, "margen": 0.05, "ausencia": 0.30},
+    "finalidad": {"confianza": 0.40, "margen": 0.04, "ausencia": 0.0},
+}
+
+
+# Rejilla de la calibración
+REJILLA_CONFIANZA = np.round(np.arange(0.25, 0.70, 0.01), 2)
+REJILLA_MARGEN = np.round(np.arange(0.0, 0.11, 0.01), 2)
+REJILLA_AUSENCIA = np.round(np.arange(0.0, 0.50, 0.02), 2)
+
+
+def _umbrales(calibrados=None):
+    umbrales = {c: dict(u) for c, u in UMBRALES_POR_DEFECTO.items()}
+    for categoria, valores in (calibrados or {}).items():
+        umbrales.setdefault(categoria, {}).update(valores)
+    extra = os.getenv("CLASIFICADOR_UMBRALES")
+    if extra:
+        for categoria, valores in json.loads(extra).items():
+            umbrales.setdefault(categoria, {}).update(valores)
+    return umbrales
+
+
+def _ids(valor):
+    return list(valor) if isinstance(valor, (list, tuple)) else [valor]
+
+
+def decidir(similitudes, valores, conf, umbral):
+    """
+    Decisión de una categoría a partir de las similitudes de la consulta con
+    cada descripción: (True, valor) si es segura, (True, None) si está
+    ausente y (False, None) si es dudosa (decide el LLM).
+    """
+    orden = np.argsort(-similitudes)
+    elegidos = [i for i in orden[:conf["maximo"]] if similitudes[i] >= umbral["confianza"]]
+    siguiente = orden[len(elegidos)] if len(elegidos) < len(orden) else None
+    if elegidos:
+        margen = similitudes[elegidos[-1]] - (similitudes[siguiente] if siguiente is not None else -1.0)
+        if margen >= umbral["margen"]:
+            ids = [x for i in elegidos for x in _ids(valores[i])]
+            return True, ids if conf["lista"] else ids[0]
+    elif not conf["obligatoria"] and similitudes[orden[0]] < umbral["ausencia"]:
+        return True, None
+    return False, None
+
+
+def como_conjunto(valor):
+    """Valor de un filtro (ID o lista de IDs) comparable con una etiqueta; None si está vacío."""
+    if valor is None or valor == []:
+        return None
+    return frozenset(int(v) for v in _ids(valor))
+
+
+def calibrar_categoria(casos, categoria, valores, precision_minima=0.95):
+    """
+    Umbrales de `categoria` que maximizan la cobertura (consultas decididas sin
+    LLM) con un acierto frente a la etiqueta de al menos `precision_minima`;
+    a igual cobertura, los de más acierto y después los más estrictos.
+    `casos`: [(similitudes con cada descripción, etiqueta)].
+    Devuelve (umbrales, {"cobertura", "acierto", "decididas", "consultas"}) o
+    (None, métricas vacías) si ninguna combinación llega a la precisión pedida.
+    """
+    conf = CATEGORIAS[categoria]
+    etiquetas = [como_conjunto(etiqueta) for _, etiqueta in casos]
+    ausencias = [0.0] if conf["obligatoria"] else REJILLA_AUSENCIA
+    mejor, clave_mejor = None, None
+    for confianza in REJILLA_CONFIANZA:
+        for margen in REJILLA_MARGEN:
+            for ausencia in ausencias:
+                if ausencia > confianza:
+                    continue
+                umbral = {"confianza": float(confianza), "margen": float(margen), "ausencia": float(ausencia)}
+                decididas = aciertos = 0
+                for (similitudes, _), etiqueta in zip(casos, etiquetas):
+                    decidida, valor = decidir(similitudes, valores, conf, umbral)
+                    if decidida:
+                        decididas += 1
+                        aciertos += como_conjunto(valor) == etiqueta
+                if not decididas or aciertos / decididas < precision_minima:
+                    continue
+                clave = (decididas, aciertos / decididas, confianza, margen, -ausencia)
+                if clave_mejor is None or clave > clave_mejor:
+                    mejor, clave_mejor = umbral, clave
+    if mejor is None:
+        return None, {"cobertura": 0.0, "acierto": None, "decididas": 0, "consultas": len(casos)}
+    decididas, acierto = clave_mejor[0], clave_mejor[1]
+    return mejor, {"cobertura": round(decididas / len(casos), 3), "acierto": round(acierto, 3),
+                   "decididas": decididas, "consultas": len(casos)}
+
+
+class ClasificadorMapas:
+    """Vecino más cercano (coseno) de la consulta frente a las descripciones de cada mapa."""
+
+    def __init__(self, embedder, embedder_lote, modelo, ruta=EMBEDDINGS_MAPAS_PATH, umbrales=None,
+                 ruta_umbrales=CLASIFICADOR_UMBRALES_PATH):
+        self.embedder = embedder            # callable(texto) -> vector normalizado
+        self.embedder_lote = embedder_lote  # callable(lista de textos) -> matriz (n, d)
+        self.modelo = modelo
+        self.ruta = ruta
+        self.ruta_umbrales = ruta_umbrales
+        self._umbrales_fijos = umbrales is not None
+        self.umbrales = umbrales or _umbrales()
+        self._matrices = None               # categoria -> (matriz normalizada, [valores])
+        self._lock = threading.Lock()
+
+    # ---------- embeddings de las descripciones ----------
+    def _huella(self):
+        h = hashlib.sha256(self.modelo.encode("utf-8"))
+        for categoria, conf in CATEGORIAS.items():
+            for descripcion in conf["mapa"]:
+                h.update(categoria.encode("utf-8"))
+                h.update(descripcion.encode("utf-8"))
+        return h.hexdigest()
+
+    def _cargar_matrices(self):
+        with self._lock:
+            if self._matrices is not None:
+                return self._matrices
+            huella = self._huella()
+            textos = [d for conf in CATEGORIAS.values() for d in conf["mapa"]]
+            matriz = None
+            if os.path.exists(self.ruta):
+                datos = np.load(self.ruta)
+                if str(datos["huella"]) == huella:
+                    matriz = datos["matriz"]
+            if matriz is None:
+                # Se recalculan solo si cambian las descripciones o el modelo
+                matriz = np.asarray(self.embedder_lote(textos), dtype=np.float32)
+                matriz /= np.linalg.norm(matriz, axis=1, keepdims=True)
+                directorio = os.path.dirname(self.ruta)
+                if directorio:
+                    os.makedirs(directorio, exist_ok=True)
+                temporal = self.ruta + ".tmp.npz"
+                np.savez(temporal, huella=huella, matriz=matriz)
+                os.replace(temporal, self.ruta)
+
+            if not self._umbrales_fijos:
+                self.umbrales = _umbrales(self._umbrales_calibrados(huella))
+
+            self._matrices, inicio = {}, 0
+            for categoria, conf in CATEGORIAS.items():
+                n = len(conf["mapa"])
+                self._matrices[categoria] = (matriz[inicio:inicio + n], list(conf["mapa"].values()))
+                inicio += n
+            return self._matrices
+
+    # ---------- umbrales calibrados ----------
+    def _umbrales_calibrados(self, huella):
+        if not self.ruta_umbrales or not os.path.exists(self.ruta_umbrales):
+            return None
+        with open(self.ruta_umbrales, "r", encoding="utf-8") as f:
+            guardados = json.load(f)
+        if guardados.get("huella") != huella:
+            print("⚠️ Umbrales del clasificador calibrados para otras descripciones o modelo: se usan los de defecto")
+            return None
+        return guardados["umbrales"]
+
+    def guardar_umbrales(self, umbrales, metricas):
+        """Guarda la calibración (`evaluar_clasificador.py --calibrar`) ligada a la matriz actual."""
+        huella = self._huella()
+        directorio = os.path.dirname(self.ruta_umbrales)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        temporal = self.ruta_umbrales + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"huella": huella, "modelo": self.modelo, "umbrales": umbrales, "metricas": metricas},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(temporal, self.ruta_umbrales)
+        if not self._umbrales_fijos:
+            self.umbrales = _umbrales(umbrales)
+
+    # ---------- clasificación ----------
+    def similitudes(self, consulta, vector=None):
+        """{categoria: similitudes de la consulta con cada descripción del mapa}."""
+        matrices = self._cargar_matrices()
+        if vector is None:
+            vector = self.embedder(consulta)
+        vector = np.asarray(vector, dtype=np.float32)
+        return {categoria: matriz @ vector for categoria, (matriz, _) in matrices.items()}
+
+    def valores(self, categoria):
+        return self._cargar_matrices()[categoria][1]
+
+    def clasificar(self, consulta, vector=None):
+        """
+        Devuelve {"valores": {categoria: valor o None}, "dudosas": [categorias],
+        "similitudes": {categoria: [top-3 similitudes]}}.
+        `valores` solo contiene las categorías seguras o ausentes.
+        """
+        resultado = {"valores": {}, "dudosas": [], "similitudes": {}}
+        for categoria, similitudes in self.similitudes(consulta, vector).items():
+            orden = np.argsort(-similitudes)
+            resultado["similitudes"][categoria] = [round(float(similitudes[i]), 4) for i in orden[:3]]
+            decidida, valor = decidir(similitudes, self.valores(categoria), CATEGORIAS[categoria],
+                                      self.umbrales[categoria])
+            if decidida:
+                resultado["valores"][categoria] = valor
+            else:
+                resultado["dudosas"].append(categoria)
+        return resultado
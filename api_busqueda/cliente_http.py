@@ -0,0 +1,231 @@
+"""
+Cliente HTTP compartido (asíncrono, con pool) para todas las llamadas a la BDNS.
+
+Un único `httpx.AsyncClient` vive en un bucle de eventos propio, en un hilo en
+segundo plano, y lo usan tanto los endpoints async de FastAPI (`await get(...)`)
+como el código síncrono que corre en hilos (`get_sync(...)`: pipeline de pandas,
+espejo, cachés). Aporta:
+- keep-alive y HTTP/2 si está instalado `h2` (`pip install httpx[http2]`);
+- límite de conexiones simultáneas por host y el limitador de tasa de `limitador.py`;
+- timeouts por defecto;
+- reintentos con backoff exponencial y jitter ante 429/5xx, timeouts y errores de conexión;
+- singleflight: varios GET idénticos concurrentes comparten una sola petición.
+
+Las descargas grandes usan `abrir_stream(...)`, que devuelve las cabeceras en
+cuanto llegan y entrega el cuerpo por trozos sin cargarlo en memoria. Cada
+stream abierto ocupa un hueco del semáforo del host y una conexión del pool
+hasta que se cierra: quien lo abre tiene que cerrarlo pase lo que pase (ver
+`RespuestaProxy` en main.py para las respuestas de FastAPI).
+"""
+import asyncio
+import importlib.util
+import os
+import random
+import threading
+from urllib.parse import urlsplit
+
+import httpx
+
+from limitador import limitador_para
+
+# ======== CONFIGURACIÓN ========
+TIMEOUT_BDNS = float(os.getenv("BDNS_TIMEOUT", "30"))
+TIMEOUT_CONEXION = float(os.getenv("BDNS_TIMEOUT_CONEXION", "10"))
+MAX_CONEXIONES = int(os.getenv("BDNS_MAX_CONEXIONES_TOTAL", "40"))
+MAX_CONEXIONES_POR_HOST = int(os.getenv("BDNS_MAX_CONEXIONES", "10"))
+REINTENTOS = int(os.getenv("BDNS_REINTENTOS", "3"))
+BACKOFF_BASE = float(os.getenv("BDNS_BACKOFF_BASE", "0.5"))   # segundos
+BACKOFF_MAX = float(os.getenv("BDNS_BACKOFF_MAX", "8"))
+TAMANO_TROZO = 64 * 1024
+
+HTTP2 = importlib.util.find_spec("h2") is not None
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+CABECERAS = {"Accept": "application/json", "User-Agent": "Mozilla/5.0"}
+
+
+def _espera_backoff(intento, respuesta=None):
+    # Retry-After del servidor si lo indica; si no, backoff exponencial con jitter completo
+    if respuesta is not None and respuesta.headers.get("Retry-After", "").isdigit():
+        return min(BACKOFF_MAX, float(respuesta.headers["Retry-After"]))
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** intento))
+
+
+class RespuestaStream:
+    """Respuesta cuyo cuerpo se lee por trozos; hay que cerrarla (o agotarla) siempre."""
+
+    def __init__(self, cliente, respuesta, semaforo):
+        self._cliente = cliente
+        self._respuesta = respuesta
+        self._semaforo = semaforo
+        self._trozos = None
+        self._cerrada = False
+        self.status_code = respuesta.status_code
+        self.headers = respuesta.headers
+        self.is_success = respuesta.is_success
+
+    # ---------- en el bucle del cliente ----------
+    async def _siguiente(self):
+        if self._trozos is None:
+            self._trozos = self._respuesta.aiter_bytes(TAMANO_TROZO)
+        try:
+            return await self._trozos.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    async def _cerrar(self):
+        if not self._cerrada:
+            self._cerrada = True
+            await self._respuesta.aclose()
+            self._semaforo.release()
+
+    # ---------- desde cualquier bucle / hilo ----------
+    async def iter_bytes(self):
+        try:
+            while True:
+                trozo = await self._cliente._en_bucle(self._siguiente())
+                if trozo is None:
+                    break
+                yield trozo
+        finally:
+            await self.cerrar()
+
+    def iter_bytes_sync(self):
+        try:
+            while True:
+                trozo = self._cliente._ejecutar(self._siguiente())
+                if trozo is None:
+                    break
+                yield trozo
+        finally:
+            self.cerrar_sync()
+
+    async def cerrar(self):
+        await self._cliente._en_bucle(self._cerrar())
+
+    def cerrar_sync(self):
+        self._cliente._ejecutar(self._cerrar())
+
+
+class ClienteBDNS:
+    """Cliente httpx asíncrono compartido por todo el proceso (ver docstring del módulo)."""
+
+    def __init__(self, timeout=TIMEOUT_BDNS, reintentos=REINTENTOS, max_por_host=MAX_CONEXIONES_POR_HOST):
+        self.reintentos = reintentos
+        self.max_por_host = max_por_host
+        self.timeout = httpx.Timeout(timeout, connect=TIMEOUT_CONEXION)
+        self.estadisticas = {"peticiones": 0, "reintentos": 0, "coalescidas": 0, "errores": 0}
+        # Solo se tocan desde el bucle del cliente (un único hilo): no necesitan lock
+        self._semaforos = {}
+        self._en_vuelo = {}
+        self._bucle = asyncio.new_event_loop()
+        threading.Thread(target=self._bucle.run_forever, name="cliente-bdns", daemon=True).start()
+        self._cliente = self._ejecutar(self._crear_cliente())
+
+    async def _crear_cliente(self):
+        return httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=MAX_CONEXIONES, max_keepalive_connections=MAX_CONEXIONES),
+            headers=CABECERAS,
+            follow_redirects=True,
+        )
+
+    # ---------- puente entre bucles ----------
+    def _ejecutar(self, corrutina):
+        """Ejecuta `corrutina` en el bucle del cliente y espera el resultado (código síncrono)."""
+        return asyncio.run_coroutine_threadsafe(corrutina, self._bucle).result()
+
+    async def _en_bucle(self, corrutina):
+        """Igual que `_ejecutar` pero sin bloquear el bucle que llama (endpoints async)."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(corrutina, self._bucle))
+
+    # ---------- en el bucle del cliente ----------
+    def _semaforo(self, host):
+        if host not in self._semaforos:
+            self._semaforos[host] = asyncio.Semaphore(self.max_por_host)
+        return self._semaforos[host]
+
+    async def _enviar(self, url, params=None, headers=None, stream=False):
+        host = urlsplit(url).hostname
+        semaforo = self._semaforo(host)
+        for intento in range(self.reintentos + 1):
+            await limitador_para(host).esperar_async()
+            await semaforo.acquire()
+            respuesta = None
+            try:
+                self.estadisticas["peticiones"] += 1
+                peticion = self._cliente.build_request("GET", url, params=params, headers=headers)
+                respuesta = await self._cliente.send(peticion, stream=stream)
+                if respuesta.status_code not in ESTADOS_REINTENTABLES or intento == self.reintentos:
+                    if stream:
+                        # El semáforo se libera al cerrar el stream: la conexión sigue ocupada
+                        return RespuestaStream(self, respuesta, semaforo)
+                    semaforo.release()
+                    return respuesta
+                await respuesta.aclose()
+                semaforo.release()
+            except httpx.TransportError:
+                # Timeouts y errores de conexión
+                semaforo.release()
+                if intento == self.reintentos:
+                    self.estadisticas["errores"] += 1
+                    raise
+            except BaseException:
+                semaforo.release()
+                raise
+            self.estadisticas["reintentos"] += 1
+            await asyncio.sleep(_espera_backoff(intento, respuesta))
+
+    async def _get_compartido(self, url, params=None, headers=None):
+        # Singleflight: la misma URL con los mismos parámetros solo se pide una vez a la vez
+        clave = (url, tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())),
+                 tuple(sorted((headers or {}).items())))
+        futuro = self._en_vuelo.get(clave)
+        if futuro is not None:
+            self.estadisticas["coalescidas"] += 1
+            return await asyncio.shield(futuro)
+        futuro = self._bucle.create_task(self._enviar(url, params, headers))
+        self._en_vuelo[clave] = futuro
+        try:
+            return await asyncio.shield(futuro)
+        finally:
+            self._en_vuelo.pop(clave, None)
+
+    # ---------- API pública ----------
+    async def get(self, url, params=None, headers=None):
+        """GET con el cuerpo ya leído (httpx.Response) desde un endpoint async."""
+        return await self._en_bucle(self._get_compartido(url, params, headers))
+
+    def get_sync(self, url, params=None, headers=None):
+        """GET con el cuerpo ya leído (httpx.Response) desde código síncrono."""
+        return self._ejecutar(self._get_compartido(url, params, headers))
+
+    async def abrir_stream(self, url, headers=None):
+        """Respuesta en streaming (RespuestaStream) desde un endpoint async."""
+        futuro = asyncio.run_coroutine_threadsafe(
+            self._enviar(url, headers=self._sin_compresion(headers), stream=True), self._bucle)
+        try:
+            return await asyncio.wrap_future(futuro)
+        except asyncio.CancelledError:
+            # Quien lo pidió ya no está (cliente desconectado): si el stream llega a abrirse, se cierra
+            futuro.add_done_callback(self._cerrar_huerfano)
+            raise
+
+    def _cerrar_huerfano(self, futuro):
+        if not futuro.cancelled() and futuro.exception() is None:
+            asyncio.run_coroutine_threadsafe(futuro.result()._cerrar(), self._bucle)
+
+    def abrir_stream_sync(self, url, headers=None):
+        """Respuesta en streaming (RespuestaStream) desde código síncrono."""
+        return self._ejecutar(self._enviar(url, headers=self._sin_compresion(headers), stream=True))
+
+    @staticmethod
+    def _sin_compresion(headers):
+        # Sin gzip los bytes recibidos son los del fichero y Content-Length/Range se pueden reenviar tal cual
+        return {"Accept-Encoding": "identity", **(headers or {})}
+
+    def cerrar(self):
+        self._ejecutar(self._cliente.aclose())
+
+
+CLIENTE_BDNS = ClienteBDNS()
@@ -0,0 +1,145 @@
+"""
+Embeddings de OpenAI por lotes, según tokens, en paralelo y con reintentos.
+
+Sustituye al comportamiento por defecto de LangChain (`OpenAIEmbeddings`):
+- empaqueta los fragmentos en peticiones por número de tokens (y de entradas)
+  sin pasar de los límites del modelo;
+- envía varias peticiones a la vez respetando un presupuesto de peticiones y
+  de tokens por minuto (dos `TokenBucket` de `limitador.py`);
+- reintenta 429 / 5xx / timeouts con backoff exponencial (o el Retry-After);
+- registra el rendimiento (fragmentos/s y tokens/s) de cada ingesta.
+
+Los límites se ajustan al tier de la cuenta con EMBED_RPM / EMBED_TPM.
+"""
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+from limitador import TokenBucket
+
+# ======== CONFIGURACIÓN ========
+EMBED_MAX_TOKENS_ENTRADA = 8191                                          # por texto (text-embedding-3-*)
+EMBED_MAX_TOKENS_PETICION = int(os.getenv("EMBED_MAX_TOKENS_PETICION", "250000"))  # la API admite 300k
+EMBED_MAX_ENTRADAS_PETICION = 2048
+EMBED_RPM = int(os.getenv("EMBED_RPM", "3000"))
+EMBED_TPM = int(os.getenv("EMBED_TPM", "1000000"))
+EMBED_CONCURRENCIA = int(os.getenv("EMBED_CONCURRENCIA", "4"))
+EMBED_REINTENTOS = int(os.getenv("EMBED_REINTENTOS", "5"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+ERRORES_REINTENTABLES = (openai.RateLimitError, openai.InternalServerError,
+                         openai.APITimeoutError, openai.APIConnectionError)
+
+
+def _codificador(modelo):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(modelo)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken descarga la codificación la primera vez; sin red se estima por caracteres
+        print(f"⚠️ tiktoken no disponible ({e}); se estiman los tokens por longitud")
+        return None
+
+
+def lotes_por_tokens(tokens, max_tokens=EMBED_MAX_TOKENS_PETICION, max_entradas=EMBED_MAX_ENTRADAS_PETICION):
+    """Índices agrupados en lotes consecutivos de como mucho `max_tokens` y `max_entradas`."""
+    lotes, actual, suma = [], [], 0
+    for i, n in enumerate(tokens):
+        if actual and (suma + n > max_tokens or len(actual) == max_entradas):
+            lotes.append(actual)
+            actual, suma = [], 0
+        actual.append(i)
+        suma += n
+    if actual:
+        lotes.append(actual)
+    return lotes
+
+
+def _espera_reintento(error, intento):
+    respuesta = getattr(error, "response", None)
+    retry_after = respuesta.headers.get("retry-after") if respuesta is not None else None
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** intento))
+
+
+class EmbedderOpenAI:
+    """`embed_documents` / `embed_query` sobre el cliente de OpenAI con lotes por tokens y límites de tasa."""
+
+    def __init__(self, client, modelo, rpm=EMBED_RPM, tpm=EMBED_TPM, concurrencia=EMBED_CONCURRENCIA,
+                 reintentos=EMBED_REINTENTOS, max_tokens_peticion=EMBED_MAX_TOKENS_PETICION):
+        self.client = client
+        self.modelo = modelo
+        self.max_tokens_peticion = max_tokens_peticion
+        self.concurrencia = concurrencia
+        self.reintentos = reintentos
+        self._enc = _codificador(modelo)
+        # Presupuestos por minuto repartidos por segundo; la ráfaga admite la petición más grande
+        self._peticiones = TokenBucket(rpm / 60, max(1, min(rpm, concurrencia)))
+        self._tokens = TokenBucket(tpm / 60, max(tpm / 60, max_tokens_peticion))
+
+    def _preparar(self, texto):
+        """(texto recortado al máximo de tokens del modelo, nº de tokens)."""
+        if self._enc is None:
+            # Sin tiktoken: ~4 caracteres por token
+            maximo = EMBED_MAX_TOKENS_ENTRADA * 4
+            return texto[:maximo], min(len(texto), maximo) // 4 + 1
+        ids = self._enc.encode(texto, disallowed_special=())
+        if len(ids) > EMBED_MAX_TOKENS_ENTRADA:
+            print(f"⚠️ Fragmento de {len(ids)} tokens recortado a {EMBED_MAX_TOKENS_ENTRADA}")
+            ids = ids[:EMBED_MAX_TOKENS_ENTRADA]
+            texto = self._enc.decode(ids)
+        return texto, len(ids)
+
+    def _peticion(self, textos, n_tokens):
+        for intento in range(self.reintentos + 1):
+            self._peticiones.esperar(1)
+            self._tokens.esperar(n_tokens)
+            try:
+                respuesta = self.client.embeddings.create(model=self.modelo, input=textos)
+                return [d.embedding for d in sorted(respuesta.data, key=lambda d: d.index)]
+            except ERRORES_REINTENTABLES as e:
+                if intento == self.reintentos:
+                    raise
+                espera = _espera_reintento(e, intento)
+                print(f"⚠️ Embeddings: {type(e).__name__}, reintento {intento + 1} en {espera:.1f}s")
+                time.sleep(espera)
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        t0 = time.perf_counter()
+        preparados = [self._preparar(t) for t in texts]
+        tokens = [n for _, n in preparados]
+        lotes = lotes_por_tokens(tokens, self.max_tokens_peticion)
+
+        def procesar(lote):
+            return self._peticion([preparados[i][0] for i in lote], sum(tokens[i] for i in lote))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.concurrencia, len(lotes)))) as ex:
+            resultados = list(ex.map(procesar, lotes))
+
+        vectores = [None] * len(texts)
+        for lote, embeddings in zip(lotes, resultados):
+            for i, v in zip(lote, embeddings):
+                vectores[i] = v
+        segundos = time.perf_counter() - t0
+        print(f"🔢 Embeddings {self.modelo}: {len(texts)} fragmentos, {sum(tokens)} tokens, {len(lotes)} peticiones "
+              f"en {segundos:.2f}s ({len(texts) / segundos:.1f} frag/s, {sum(tokens) / segundos:.0f} tokens/s)")
+        return vectores
+
+    def embed_query(self, text):
+        texto, n_tokens = self._preparar(text)
+        return self._peticion([texto], n_tokens)[0]
@@ -0,0 +1,310 @@
+"""
+Espejo local (SQLite + FTS5) de la búsqueda de convocatorias de la BDNS.
+
+La búsqueda de la BDNS no devuelve regiones, beneficiarios, instrumentos ni
+finalidad de cada convocatoria, así que el espejo se sincroniza por
+particiones: una partición "todas" (sin filtros) y una por cada valor de los
+mapas de `mapas_bdns` (p.ej. regiones=71). Cada partición guarda hasta qué
+`fechaRecepcion` se ha descargado y la siguiente sincronización solo pide lo
+publicado desde esa fecha. La pertenencia (convocatoria, categoría, valor) se
+guarda en una tabla indexada y `descripcion` en un índice FTS5 sin acentos.
+
+`consultar(filtros)` traduce el dict de `parser_openai` a una consulta local
+y devuelve None si el espejo no cubre esos filtros o está desactualizado:
+el llamador recurre entonces a la API en vivo.
+
+Sincronización (p.ej. desde cron) y medición del tiempo de consulta:
+    python espejo_bdns.py
+    python espejo_bdns.py --categorias todas regiones --dias 365
+    python espejo_bdns.py --medir
+"""
+import argparse
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+from almacen_sqlite import AlmacenSQLite
+from mapas_bdns import REGIONES_MAP, TIPOS_BENEFICIARIO_MAP, INSTRUMENTOS_MAP, FINALIDADES_MAP
+from normalizacion import normalizar_texto
+
+# ======== CONFIGURACIÓN ========
+ESPEJO_DB = os.getenv("BDNS_ESPEJO_DB", "data/cache/espejo_bdns.sqlite")
+ESPEJO_DIAS_INICIALES = int(os.getenv("BDNS_ESPEJO_DIAS", "365"))           # ventana de la primera sincronización
+ESPEJO_MAX_ANTIGUEDAD = int(os.getenv("BDNS_ESPEJO_MAX_ANTIGUEDAD", str(24 * 3600)))  # segundos
+ESPEJO_PAGE_SIZE = int(os.getenv("BDNS_ESPEJO_PAGE_SIZE", "200"))
+URL_BUSQUEDA = "https://www.pap.hacienda.gob.es/bdnstrans/api/convocatorias/busqueda"
+
+TODAS = "todas"
+
+
+def _valores_mapa(mapa):
+    valores = []
+    for v in mapa.values():
+        for x in (v if isinstance(v, (list, tuple)) else [v]):
+            if x not in valores:
+                valores.append(x)
+    return valores
+
+
+# categoría de filtro -> valores que se sincronizan como partición
+PARTICIONES = {
+    "regiones": _valores_mapa(REGIONES_MAP),
+    "tiposBeneficiario": _valores_mapa(TIPOS_BENEFICIARIO_MAP),
+    "instrumentos": _valores_mapa(INSTRUMENTOS_MAP),
+    "finalidad": _valores_mapa(FINALIDADES_MAP),
+}
+
+CONTADORES = ("aciertos", "sin_cobertura", "vacias")
+
+# Filtros representativos de `parser_openai` para medir el tiempo de consulta (objetivo < 100 ms)
+CONSULTAS_MEDICION = [
+    {"regiones": [71], "pageSize": 5},
+    {"regiones": [26, 4], "finalidad": 14, "pageSize": 5},
+    {"descripcion": "digitalización pymes", "descripcionTipoBusqueda": 2, "pageSize": 5},
+    {"descripcion": "rehabilitación vivienda", "tiposBeneficiario": [1], "regiones": [63], "pageSize": 5},
+    {"instrumentos": 2, "finalidad": 12, "pageSize": 5},
+]
+
+
+def _lista(valor):
+    if valor is None or valor == "" or valor == []:
+        return []
+    return [str(v) for v in (valor if isinstance(valor, (list, tuple)) else [valor])]
+
+
+def _fecha_iso(valor):
+    # La API acepta fechas dd/mm/aaaa; en el espejo se guardan como aaaa-mm-dd
+    try:
+        return datetime.strptime(str(valor), "%d/%m/%Y").date().isoformat()
+    except ValueError:
+        return str(valor)[:10]
+
+
+class EspejoBDNS(AlmacenSQLite):
+    """Réplica local de la búsqueda de la BDNS con sincronización incremental por partición."""
+
+    CONTADORES = CONTADORES
+
+    def __init__(self, ruta=ESPEJO_DB, max_antiguedad=ESPEJO_MAX_ANTIGUEDAD):
+        self.max_antiguedad = max_antiguedad
+        super().__init__(ruta)
+
+    def _crear_tablas(self, con):
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS convocatorias (
+                id INTEGER PRIMARY KEY,
+                num_conv TEXT NOT NULL UNIQUE,
+                fecha_recepcion TEXT,
+                datos TEXT NOT NULL,
+                actualizado_en REAL NOT NULL
+            )""")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_espejo_fecha ON convocatorias(fecha_recepcion)")
+        # rowid del índice FTS = id de la convocatoria
+        con.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS convocatorias_fts USING fts5(
+                descripcion, tokenize = 'unicode61 remove_diacritics 2'
+            )""")
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS pertenencias (
+                categoria TEXT NOT NULL,
+                valor TEXT NOT NULL,
+                num_conv TEXT NOT NULL,
+                PRIMARY KEY (categoria, valor, num_conv)
+            ) WITHOUT ROWID""")
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS particiones (
+                categoria TEXT NOT NULL,
+                valor TEXT NOT NULL,
+                sincronizado_hasta TEXT NOT NULL,
+                ultima_sync REAL NOT NULL,
+                PRIMARY KEY (categoria, valor)
+            )""")
+
+    def _registrar(self, clave):
+        with self._conexion() as con:
+            self._contar(con, clave)
+
+    # ---------- sincronización ----------
+    def _guardar_pagina(self, convocatorias, categoria, valor):
+        ahora = time.time()
+        con = self._conexion()
+        with con:
+            for c in convocatorias:
+                num_conv = str(c.get("numeroConvocatoria") or "").strip()
+                if not num_conv:
+                    continue
+                (id_conv,) = con.execute(
+                    "INSERT INTO convocatorias (num_conv, fecha_recepcion, datos, actualizado_en) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(num_conv) DO UPDATE SET fecha_recepcion = excluded.fecha_recepcion, "
+                    "datos = excluded.datos, actualizado_en = excluded.actualizado_en RETURNING id",
+                    (num_conv, str(c.get("fechaRecepcion") or "")[:10], json.dumps(c, ensure_ascii=False), ahora),
+                ).fetchone()
+                con.execute("DELETE FROM convocatorias_fts WHERE rowid = ?", (id_conv,))
+                con.execute("INSERT INTO convocatorias_fts (rowid, descripcion) VALUES (?, ?)",
+                            (id_conv, c.get("descripcion") or ""))
+                if categoria != TODAS:
+                    con.execute("INSERT OR IGNORE INTO pertenencias (categoria, valor, num_conv) VALUES (?, ?, ?)",
+                                (categoria, str(valor), num_conv))
+
+    def sincronizar_particion(self, get, categoria=TODAS, valor="", dias_iniciales=ESPEJO_DIAS_INICIALES,
+                              page_size=ESPEJO_PAGE_SIZE):
+        """
+        Descarga lo publicado desde la última sincronización de la partición
+        (o los últimos `dias_iniciales` días la primera vez). `get(url, params=...)`
+        hace la petición HTTP. Devuelve el número de convocatorias recibidas.
+        """
+        hoy = datetime.now().date()
+        fila = self._conexion().execute(
+            "SELECT sincronizado_hasta FROM particiones WHERE categoria = ? AND valor = ?",
+            (categoria, str(valor)),
+        ).fetchone()
+        # Se vuelve a pedir el propio día de la marca: pueden haberse publicado más después
+        desde = datetime.fromisoformat(fila[0]).date() if fila else hoy - timedelta(days=dias_iniciales)
+
+        params = {
+            "vpd": "GE", "order": "fechaRecepcion", "direccion": "asc", "pageSize": page_size,
+            "fechaDesde": desde.strftime("%d/%m/%Y"), "fechaHasta": hoy.strftime("%d/%m/%Y"),
+        }
+        if categoria != TODAS:
+            params[categoria] = valor
+
+        total, pagina = 0, 0
+        while True:
+            response = get(URL_BUSQUEDA, params={**params, "page": pagina})
+            response.raise_for_status()
+            data = response.json()
+            convocatorias = data.get("convocatorias", data.get("content", []))
+            self._guardar_pagina(convocatorias, categoria, valor)
+            total += len(convocatorias)
+            total_paginas = data.get("totalPages")
+            pagina += 1
+            if len(convocatorias) < page_size or (total_paginas is not None and pagina >= int(total_paginas)):
+                break
+
+        # La marca solo avanza si se han descargado todas las páginas
+        with self._conexion() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO particiones (categoria, valor, sincronizado_hasta, ultima_sync) "
+                "VALUES (?, ?, ?, ?)",
+                (categoria, str(valor), hoy.isoformat(), time.time()),
+            )
+        return total
+
+    def sincronizar(self, get, categorias=None, dias_iniciales=ESPEJO_DIAS_INICIALES):
+        """Sincroniza la partición "todas" y las de cada valor de `categorias` (por defecto, todas)."""
+        categorias = categorias or [TODAS] + list(PARTICIONES)
+        for categoria in categorias:
+            valores = [""] if categoria == TODAS else PARTICIONES[categoria]
+            for valor in valores:
+                inicio = time.perf_counter()
+                try:
+                    n = self.sincronizar_particion(get, categoria, valor, dias_iniciales)
+                    print(f"Espejo BDNS {categoria}={valor}: {n} convocatorias en {time.perf_counter() - inicio:.1f} s")
+                except Exception as e:
+                    # Una partición que falla no avanza su marca y se reintenta en la próxima sincronización
+                    print(f"Error sincronizando {categoria}={valor}: {e}")
+
+    # ---------- consulta ----------
+    def _cubre(self, con, filtros):
+        necesarias = [(TODAS, "")] + [(c, v) for c in PARTICIONES for v in _lista(filtros.get(c))]
+        limite = time.time() - self.max_antiguedad
+        for categoria, valor in necesarias:
+            fila = con.execute("SELECT ultima_sync FROM particiones WHERE categoria = ? AND valor = ?",
+                               (categoria, valor)).fetchone()
+            if fila is None or fila[0] < limite:
+                return False
+        return True
+
+    def consultar(self, filtros, limite=15):
+        """
+        Convocatorias (dicts como los de la API) que cumplen `filtros`, ordenadas
+        por fechaRecepcion. None si el espejo no cubre la consulta.
+        """
+        con = self._conexion()
+        if not self._cubre(con, filtros):
+            self._registrar("sin_cobertura")
+            return None
+
+        condiciones, args = [], []
+        if filtros.get("numeroConvocatoria"):
+            condiciones.append("c.num_conv = ?")
+            args.append(str(filtros["numeroConvocatoria"]).strip())
+        for categoria in PARTICIONES:
+            valores = _lista(filtros.get(categoria))
+            if valores:
+                # OR dentro de la categoría, AND entre categorías (como la API)
+                condiciones.append(
+                    "c.num_conv IN (SELECT num_conv FROM pertenencias WHERE categoria = ? AND valor IN (%s))"
+                    % ",".join("?" * len(valores)))
+                args += [categoria] + valores
+        terminos = re.findall(r"\w+", normalizar_texto(filtros.get("descripcion") or ""))
+        if terminos:
+            tipo = str(filtros.get("descripcionTipoBusqueda", 2))
+            # 0: frase exacta, 1: todas las palabras, 2: alguna de las palabras
+            if tipo == "0":
+                match = '"' + " ".join(terminos) + '"'
+            else:
+                match = (" AND " if tipo == "1" else " OR ").join(f'"{t}"' for t in terminos)
+            condiciones.append("c.id IN (SELECT rowid FROM convocatorias_fts WHERE convocatorias_fts MATCH ?)")
+            args.append(match)
+        if filtros.get("fechaDesde"):
+            condiciones.append("c.fecha_recepcion >= ?")
+            args.append(_fecha_iso(filtros["fechaDesde"]))
+        if filtros.get("fechaHasta"):
+            condiciones.append("c.fecha_recepcion <= ?")
+            args.append(_fecha_iso(filtros["fechaHasta"]))
+
+        direccion = "ASC" if str(filtros.get("direccion", "desc")).lower() == "asc" else "DESC"
+        sql = "SELECT c.datos FROM convocatorias c"
+        if condiciones:
+            sql += " WHERE " + " AND ".join(condiciones)
+        sql += f" ORDER BY c.fecha_recepcion {direccion} LIMIT ?"
+        filas = con.execute(sql, args + [int(limite)]).fetchall()
+        self._registrar("aciertos" if filas else "vacias")
+        return [json.loads(datos) for (datos,) in filas]
+
+    def estadisticas(self):
+        con = self._conexion()
+        stats = self._contadores()
+        (stats["convocatorias"],) = con.execute("SELECT COUNT(*) FROM convocatorias").fetchone()
+        stats["particiones"] = dict(con.execute("SELECT categoria, COUNT(*) FROM particiones GROUP BY categoria").fetchall())
+        (ultima,) = con.execute("SELECT MIN(ultima_sync) FROM particiones").fetchone()
+        stats["sincronizacion_mas_antigua"] = datetime.fromtimestamp(ultima).isoformat() if ultima else None
+        return stats
+
+
+def medir_consultas(espejo, consultas=CONSULTAS_MEDICION, repeticiones=20, max_paginas=3):
+    """Imprime la mediana y el p95 (ms) de cada consulta; la cobertura no se exige para medir."""
+    max_antiguedad, espejo.max_antiguedad = espejo.max_antiguedad, float("inf")
+    try:
+        for filtros in consultas:
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                filas = espejo.consultar(filtros, limite=int(filtros.get("pageSize", 5)) * max_paginas)
+                tiempos.append(1000 * (time.perf_counter() - inicio))
+            tiempos.sort()
+            print(f"{json.dumps(filtros, ensure_ascii=False)}: {len(filas or [])} filas | "
+                  f"mediana {tiempos[len(tiempos) // 2]:.1f} ms | p95 {tiempos[int(0.95 * (len(tiempos) - 1))]:.1f} ms")
+    finally:
+        espejo.max_antiguedad = max_antiguedad
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--categorias", nargs="*", choices=[TODAS] + list(PARTICIONES))
+    parser.add_argument("--dias", type=int, default=ESPEJO_DIAS_INICIALES,
+                        help="días hacia atrás en la primera sincronización de cada partición")
+    parser.add_argument("--medir", action="store_true", help="no sincroniza: mide el tiempo de consulta")
+    args = parser.parse_args()
+
+    espejo = EspejoBDNS()
+    if args.medir:
+        medir_consultas(espejo)
+    else:
+        # Mismo cliente HTTP (pool compartido + limitador por host + reintentos) que la API
+        from parser_openai_edo_url import get_bdns
+        espejo.sincronizar(get_bdns, args.categorias, args.dias)
+    print(espejo.estadisticas())
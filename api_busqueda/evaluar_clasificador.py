@@ -0,0 +1,109 @@
+"""
+Evaluación offline del clasificador por embeddings frente al parser LLM.
+
+Para cada consulta del fichero etiquetado se obtienen los filtros del LLM
+(`parser_llm`, sin cachés ni atajos) y la clasificación local, y se informa
+por categoría de:
+- cobertura: % de consultas que el clasificador decide sin LLM,
+- acuerdo: % de esas decisiones que coinciden con el LLM,
+- acierto de cada uno frente a la etiqueta manual.
+
+Con `--calibrar` no se llama al LLM: se buscan, por categoría, los umbrales
+que deciden más consultas sin LLM con un acierto frente a la etiqueta de al
+menos `--precision-minima`, y se guardan (con las métricas) junto a la matriz
+de embeddings, de donde los carga `ClasificadorMapas`.
+
+Uso:
+    python evaluar_clasificador.py
+    python evaluar_clasificador.py --consultas otras.jsonl --umbrales '{"finalidad": {"confianza": 0.45}}'
+    python evaluar_clasificador.py --calibrar --precision-minima 0.95
+"""
+import argparse
+import json
+
+from clasificador_embeddings import CATEGORIAS, como_conjunto, calibrar_categoria
+from normalizacion import normalizar_texto
+from parser_openai_edo_url import CLASIFICADOR_MAPAS, parser_llm
+
+
+def _leer(ruta_consultas):
+    with open(ruta_consultas, "r", encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def _pct(a, b):
+    return f"{100 * a / b:5.1f}%" if b else "   - "
+
+
+def evaluar(ruta_consultas):
+    etiquetadas = _leer(ruta_consultas)
+
+    contadores = {c: {"decididas": 0, "acuerdo": 0, "ok_clf": 0, "ok_llm": 0, "etiquetadas": 0,
+                      "etiquetadas_decididas": 0} for c in CATEGORIAS}
+    sin_llm = 0
+
+    for item in etiquetadas:
+        consulta = item["consulta"]
+        llm = parser_llm(consulta) or {}
+        clasificacion = CLASIFICADOR_MAPAS.clasificar(normalizar_texto(consulta))
+        if not clasificacion["dudosas"]:
+            sin_llm += 1
+
+        for categoria, c in contadores.items():
+            valor_llm = como_conjunto(llm.get(categoria))
+            decidida = categoria in clasificacion["valores"]
+            valor_clf = como_conjunto(clasificacion["valores"].get(categoria))
+            if decidida:
+                c["decididas"] += 1
+                c["acuerdo"] += valor_clf == valor_llm
+            if categoria in item:
+                etiqueta = como_conjunto(item[categoria])
+                c["etiquetadas"] += 1
+                c["ok_llm"] += valor_llm == etiqueta
+                if decidida:
+                    c["etiquetadas_decididas"] += 1
+                    c["ok_clf"] += valor_clf == etiqueta
+
+        print(f"- {consulta}\n    LLM: { {k: llm.get(k) for k in CATEGORIAS} }"
+              f"\n    CLF: {clasificacion['valores']} dudosas={clasificacion['dudosas']}")
+
+    n = len(etiquetadas)
+    print(f"\nConsultas: {n} | resueltas sin LLM: {sin_llm} ({_pct(sin_llm, n).strip()})\n")
+    print(f"{'categoría':<18} {'cobertura':>9} {'acuerdo':>8} {'acierto clf':>11} {'acierto llm':>11}")
+    for categoria, c in contadores.items():
+        print(f"{categoria:<18} {_pct(c['decididas'], n):>9} {_pct(c['acuerdo'], c['decididas']):>8} "
+              f"{_pct(c['ok_clf'], c['etiquetadas_decididas']):>11} {_pct(c['ok_llm'], c['etiquetadas']):>11}")
+
+
+def calibrar(ruta_consultas, precision_minima):
+    etiquetadas = _leer(ruta_consultas)
+    similitudes = [CLASIFICADOR_MAPAS.similitudes(normalizar_texto(item["consulta"])) for item in etiquetadas]
+    umbrales, metricas = {}, {"precision_minima": precision_minima, "consultas": ruta_consultas}
+    for categoria in CATEGORIAS:
+        casos = [(s[categoria], item[categoria]) for s, item in zip(similitudes, etiquetadas) if categoria in item]
+        umbral, metricas[categoria] = calibrar_categoria(casos, categoria, CLASIFICADOR_MAPAS.valores(categoria),
+                                                         precision_minima)
+        if umbral is None:
+            print(f"⚠️ {categoria}: ningún umbral llega al {precision_minima:.0%} de acierto; se mantiene el actual")
+            continue
+        umbrales[categoria] = umbral
+        print(f"{categoria:<18} {umbral} -> cobertura {metricas[categoria]['cobertura']:.1%}, "
+              f"acierto {metricas[categoria]['acierto']:.1%} ({metricas[categoria]['consultas']} consultas)")
+    CLASIFICADOR_MAPAS.guardar_umbrales(umbrales, metricas)
+    print(f"✅ Umbrales guardados en {CLASIFICADOR_MAPAS.ruta_umbrales}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--consultas", default="consultas_etiquetadas.jsonl")
+    parser.add_argument("--umbrales", help="JSON con umbrales por categoría que sobrescriben los actuales")
+    parser.add_argument("--calibrar", action="store_true", help="calcula y guarda los umbrales a partir de las etiquetas")
+    parser.add_argument("--precision-minima", type=float, default=0.95)
+    args = parser.parse_args()
+    if args.calibrar:
+        calibrar(args.consultas, args.precision_minima)
+        raise SystemExit
+    if args.umbrales:
+        for categoria, valores in json.loads(args.umbrales).items():
+            CLASIFICADOR_MAPAS.umbrales.setdefault(categoria, {}).update(valores)
+    evaluar(args.consultas)
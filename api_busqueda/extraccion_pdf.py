@@ -0,0 +1,193 @@
+"""
+Extracción de texto de PDFs por páginas, con backends intercambiables y en paralelo.
+
+- "pdfium" (pypdfium2): muy rápido; es el backend por defecto si está instalado.
+- "pdfplumber": lento pero más fiel con maquetaciones raras. Se usa como
+  respaldo página a página cuando pdfium devuelve poco texto o caracteres
+  ilegibles, y como backend único si pypdfium2 no está disponible.
+
+Los documentos grandes se reparten por rangos de páginas en un pool de
+procesos (pdfium no es seguro entre hilos). Cada página se extrae de forma
+independiente y el resultado se ordena por número de página, así que la
+salida es idéntica con cualquier número de workers.
+
+Medición con los PDFs de ejemplo:
+    python extraccion_pdf.py --benchmark
+    python extraccion_pdf.py --benchmark ../notebooks/documentos_convocatoria --workers 1 2 4
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # pragma: no cover - solo sin pypdfium2 instalado
+    pdfium = None
+
+# ======== CONFIGURACIÓN ========
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGINAS_POR_TAREA = int(os.getenv("PDF_PAGINAS_POR_TAREA", "16"))
+MIN_CARACTERES_PAGINA = 40        # por debajo, pdfium probablemente no ha sabido leer la página
+MAX_PROPORCION_ILEGIBLE = 0.02    # proporción de U+FFFD / caracteres de control tolerada
+CARPETA_BENCHMARK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "notebooks", "documentos_convocatoria")
+
+_ILEGIBLE = re.compile(r"[�\x00-\x08\x0b\x0c\x0e-\x1f]")
+_ESPACIO_FINAL = re.compile(r"[ \t]+\n")
+
+
+# ---------- backends (se ejecutan dentro de los workers) ----------
+def _normalizar(texto):
+    # pdfium usa \r\n y deja espacios al final de línea; se iguala al formato de pdfplumber
+    texto = texto.replace("\r\n", "\n").replace("\r", "\n")
+    return _ESPACIO_FINAL.sub("\n", texto).strip()
+
+
+def _paginas_pdfplumber(ruta, paginas):
+    import pdfplumber
+    with pdfplumber.open(ruta) as pdf:
+        return [(n, _normalizar(pdf.pages[n - 1].extract_text() or "")) for n in paginas]
+
+
+def _dudosa(texto):
+    """Página que conviene repetir con pdfplumber (poco texto o caracteres ilegibles)."""
+    if len(texto) < MIN_CARACTERES_PAGINA:
+        return True
+    return len(_ILEGIBLE.findall(texto)) > MAX_PROPORCION_ILEGIBLE * len(texto)
+
+
+def _paginas_pdfium(ruta, paginas):
+    pdf = pdfium.PdfDocument(ruta)
+    try:
+        resultado = []
+        for n in paginas:
+            pagina = pdf[n - 1]
+            textpage = pagina.get_textpage()
+            resultado.append((n, _normalizar(textpage.get_text_range())))
+            textpage.close()
+            pagina.close()
+    finally:
+        pdf.close()
+    # Respaldo para las páginas dudosas; se queda el texto más largo de los dos
+    dudosas = [n for n, t in resultado if _dudosa(t)]
+    if dudosas:
+        try:
+            alternativas = dict(_paginas_pdfplumber(ruta, dudosas))
+        except Exception as e:
+            print(f"⚠️ pdfplumber no pudo con {os.path.basename(ruta)} ({e}); se mantiene pdfium")
+            alternativas = {}
+        resultado = [(n, alternativas[n] if len(alternativas.get(n, "")) > len(t) else t) for n, t in resultado]
+    return resultado
+
+
+BACKENDS = {
+    "pdfium": _paginas_pdfium,
+    "pdfplumber": _paginas_pdfplumber,
+}
+BACKEND_POR_DEFECTO = "pdfium" if pdfium is not None else "pdfplumber"
+
+
+def _extraer_rango(backend, ruta, inicio, fin):
+    return BACKENDS[backend](ruta, range(inicio, fin + 1))
+
+
+# ---------- pool de procesos ----------
+_POOL = None
+_POOL_WORKERS = 0
+
+
+def _pool(workers):
+    # Pool persistente (arrancar procesos cuesta más que extraer un PDF pequeño).
+    # "spawn": el proceso de la API tiene hilos (cliente HTTP) y fork no es seguro con hilos.
+    global _POOL, _POOL_WORKERS
+    if _POOL is None or _POOL_WORKERS != workers:
+        if _POOL is not None:
+            _POOL.shutdown()
+        _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _POOL_WORKERS = workers
+    return _POOL
+
+
+def numero_paginas(ruta):
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(ruta)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    import pdfplumber
+    with pdfplumber.open(ruta) as pdf:
+        return len(pdf.pages)
+
+
+# ---------- API pública ----------
+def extraer_paginas(ruta, backend=None, workers=PDF_WORKERS, paginas_por_tarea=PDF_PAGINAS_POR_TAREA, progreso=None):
+    """
+    Texto de cada página de `ruta` como lista de (número de página desde 1, texto),
+    en orden y sin páginas vacías. Con más de `paginas_por_tarea` páginas y
+    `workers` > 1 se reparte por rangos en el pool de procesos.
+    `progreso(paginas_extraidas, total)` se llama al terminar cada rango.
+    """
+    backend = backend or BACKEND_POR_DEFECTO
+    total = numero_paginas(ruta)
+    rangos = [(i, min(i + paginas_por_tarea - 1, total)) for i in range(1, total + 1, paginas_por_tarea)]
+
+    if workers <= 1 or len(rangos) <= 1:
+        tareas = ((lambda i=i, f=f: _extraer_rango(backend, ruta, i, f)) for i, f in rangos)
+    else:
+        pool = _pool(workers)
+        futuros = [pool.submit(_extraer_rango, backend, ruta, i, f) for i, f in rangos]
+        tareas = (futuro.result for futuro in futuros)
+
+    partes = []
+    for (_, fin), tarea in zip(rangos, tareas):
+        partes.append(tarea())
+        if progreso:
+            progreso(fin, total)
+
+    return [(n, texto) for parte in partes for n, texto in parte if texto]
+
+
+def extraer_texto(ruta, **kwargs):
+    """Texto completo del PDF (páginas unidas por saltos de línea)."""
+    return "\n".join(texto for _, texto in extraer_paginas(ruta, **kwargs))
+
+
+# ---------- benchmark ----------
+def benchmark(carpeta=CARPETA_BENCHMARK, workers=(1, 2, 4)):
+    """Compara pdfplumber, pdfium en serie y pdfium en paralelo sobre los PDFs de `carpeta`."""
+    pdfs = sorted(os.path.join(carpeta, f) for f in os.listdir(carpeta) if f.lower().endswith(".pdf"))
+    print(f"{'documento':<28}{'págs':>6}{'modo':>16}{'segundos':>10}{'págs/s':>9}")
+    for ruta in pdfs:
+        paginas = numero_paginas(ruta)
+        modos = [("pdfplumber", "pdfplumber", 1)] + [(f"{BACKEND_POR_DEFECTO} x{w}", BACKEND_POR_DEFECTO, w) for w in workers]
+        referencia = None
+        for etiqueta, backend, w in modos:
+            if w > 1:
+                extraer_paginas(ruta, backend=backend, workers=w)  # calentar el pool
+            t0 = time.perf_counter()
+            salida = extraer_paginas(ruta, backend=backend, workers=w)
+            segundos = time.perf_counter() - t0
+            print(f"{os.path.basename(ruta):<28}{paginas:>6}{etiqueta:>16}{segundos:>10.3f}{paginas / segundos:>9.1f}")
+            if backend != "pdfplumber":
+                referencia = referencia or salida
+                assert salida == referencia, f"La salida de {etiqueta} difiere con {w} workers"
+    print("✅ Salida idéntica con cualquier número de workers")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extracción de texto de PDFs")
+    parser.add_argument("pdf", nargs="?", help="PDF del que extraer el texto")
+    parser.add_argument("--benchmark", nargs="?", const=CARPETA_BENCHMARK, help="carpeta con PDFs de prueba")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--backend", choices=sorted(BACKENDS))
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.benchmark, args.workers)
+    elif args.pdf:
+        for numero, texto in extraer_paginas(args.pdf, backend=args.backend, workers=args.workers[-1]):
+            print(f"--- página {numero} ---\n{texto}")
+    else:
+        parser.print_help()
@@ -0,0 +1,128 @@
+"""
+Gazetteer local de regiones/provincias de la BDNS.
+
+Resuelve de forma determinista "Sevilla" -> 71 sin pasar por el LLM. Todos
+los nombres y alias (sin acentos) se compilan UNA vez al importar en una única
+expresión regular con alternativas ordenadas de más larga a más corta, que
+actúa como autómata multipatrón: "comunidad de madrid" gana a "madrid" y
+"ciudad autonoma de ceuta" a "ceuta".
+
+Los nombres que también son palabras corrientes ("cuenca minera", "la palma
+de la mano", "el hierro") solo cuentan como región si les precede una pista
+de lugar ("en Cuenca", "provincia de Granada"); si no, decide el LLM.
+"""
+import re
+
+from mapas_bdns import REGIONES_MAP
+from normalizacion import normalizar_texto
+
+# Claves de REGIONES_MAP que son palabras corrientes o agrupaciones NUTS que
+# nadie escribe en una consulta ("este", "sur"...): no se buscan localmente.
+CLAVES_EXCLUIDAS = {"noroeste", "noreste", "centro (es)", "este", "sur", "extra-regio nuts 1"}
+
+# Provincias/islas cuyo nombre es también un sustantivo común (ya normalizados)
+NOMBRES_AMBIGUOS = {"cuenca", "granada", "leon", "la palma", "el hierro"}
+PISTA_LUGAR = re.compile(
+    r"\b(?:en|provincia de|isla de|ciudad de|municipio de|ayuntamiento de|diputacion de|cabildo de)\s+$")
+
+# Alias y grafías alternativas habituales en las consultas
+ALIAS_REGIONES = {
+    "la coruña": [4], "coruña": [4], "orense": [6],
+    "araba": [14], "álava": [14], "guipúzcoa": [15], "vizcaya": [16],
+    "país vasco": [13], "euskadi": [13],
+    "castilla-la mancha": [39], "castilla y león": [29], "aragón": [21],
+    "catalunya": [49], "gerona": [51], "lérida": [52], "castelló": [56],
+    "comunitat valenciana": [54],
+    "ibiza": [59], "eivissa": [59], "formentera": [59],
+    "baleares": [58], "islas baleares": [58], "illes balears": [58],
+    "andalucía": [63], "región de murcia": [72],
+    "ciudad autónoma de ceuta": [74], "ciudad autónoma de melilla": [76],
+    "islas canarias": [79], "comunidad de madrid": [26],
+}
+
+# Palabras que no aportan filtros: si la consulta solo tiene esto y regiones no hace falta el LLM
+PALABRAS_TRIVIALES = {
+    "a", "al", "de", "del", "el", "la", "las", "los", "en", "para", "por", "y", "o", "e",
+    "con", "sobre", "que", "mi", "me", "un", "una", "unos", "unas", "hay", "quiero",
+    "busco", "buscar", "necesito", "dame", "muestrame", "ver", "todas", "todos",
+    "ayuda", "ayudas", "subvencion", "subvenciones", "convocatoria", "convocatorias",
+    "publica", "publicas", "disponible", "disponibles", "provincia", "comunidad",
+    "region", "autonoma", "lo", "se", "su", "sus", "es", "son", "como", "mas", "muy",
+    "mis", "tengo", "soy", "somos", "puedo", "pedir", "solicitar", "existen", "alguna",
+    "algun", "alguno", "hola", "cual", "cuales", "donde",
+}
+
+# Número de convocatoria BDNS: entero de 6 dígitos que empieza por 8 (regla 6 del prompt)
+PATRON_NUMERO_CONVOCATORIA = re.compile(r"\b8\d{5}\b")
+
+
+def _compilar():
+    nombres = {}
+    for nombre, ids in list(REGIONES_MAP.items()) + list(ALIAS_REGIONES.items()):
+        if nombre in CLAVES_EXCLUIDAS:
+            continue
+        for variante in nombre.split("/"):
+            nombres[normalizar_texto(variante)] = ids
+    alternativas = sorted(nombres, key=len, reverse=True)
+    patron = re.compile(r"\b(?:" + "|".join(re.escape(a) for a in alternativas) + r")\b")
+    return patron, nombres
+
+
+_PATRON_REGIONES, _IDS_POR_NOMBRE = _compilar()
+
+
+def _es_region(consulta_normalizada: str, m) -> bool:
+    if m.group(0) not in NOMBRES_AMBIGUOS:
+        return True
+    return bool(PISTA_LUGAR.search(consulta_normalizada[:m.start()]))
+
+
+def buscar_regiones(consulta_normalizada: str):
+    """
+    Devuelve [(inicio, fin, [ids])] de cada región encontrada en la consulta ya
+    normalizada. Los NOMBRES_AMBIGUOS sin pista de lugar delante no cuentan.
+    """
+    return [(m.start(), m.end(), _IDS_POR_NOMBRE[m.group(0)])
+            for m in _PATRON_REGIONES.finditer(consulta_normalizada) if _es_region(consulta_normalizada, m)]
+
+
+def extraer_regiones(consulta: str, maximo: int = 2):
+    """IDs de región de la consulta, en orden de aparición y sin repetir (máximo dos, como el LLM)."""
+    ids = []
+    for _, _, encontrados in buscar_regiones(normalizar_texto(consulta)):
+        for i in encontrados:
+            if i not in ids:
+                ids.append(i)
+    return ids[:maximo]
+
+
+def consulta_trivial(consulta: str) -> bool:
+    """
+    True si, quitando regiones y números de convocatoria, solo quedan palabras
+    de PALABRAS_TRIVIALES (y hay al menos una región o un número).
+    """
+    normalizada = normalizar_texto(consulta)
+    encontrados = buscar_regiones(normalizada)
+    restante = _PATRON_REGIONES.sub(lambda m: " " if _es_region(normalizada, m) else m.group(0), normalizada)
+    restante, numeros = PATRON_NUMERO_CONVOCATORIA.subn(" ", restante)
+    if not encontrados and not numeros:
+        return False
+    return all(p in PALABRAS_TRIVIALES for p in re.findall(r"\w+", restante))
+
+
+def palabras_clave(consulta: str, maximo: int = 10) -> str:
+    """
+    Palabras clave de la consulta (campo "descripcion" de la búsqueda) sin
+    stopwords ni nombres de región, conservando la grafía original.
+    """
+    normalizada = normalizar_texto(consulta)
+    en_regiones = {p for inicio, fin, _ in buscar_regiones(normalizada)
+                   for p in re.findall(r"\w+", normalizada[inicio:fin])}
+    palabras = []
+    for palabra in re.findall(r"\w+", consulta.lower()):
+        plegada = normalizar_texto(palabra)
+        if plegada in PALABRAS_TRIVIALES or plegada in en_regiones or plegada.isdigit():
+            continue
+        if palabra not in palabras:
+            palabras.append(palabra)
+    return " ".join(palabras[:maximo])
@@ -0,0 +1,154 @@
+"""
+Índice léxico BM25 en memoria para la recuperación híbrida del RAG.
+
+La búsqueda densa falla con consultas que citan artículos, importes o
+referencias legales ("artículo 12", "Ley 38/2003"): el embedding no distingue
+bien un número de otro. Este índice invertido compacto (listas de
+fragmentos y frecuencias en `array`) se construye al añadir documentos al
+registro (`registro_indices.py`), junto al índice vectorial:
+- normalización en español: minúsculas, sin tildes, sin palabras vacías,
+  abreviaturas legales expandidas ("art." -> artículo) y un stemmer ligero
+  (plural y un sufijo). Snowball separa pares frecuentes en las bases
+  ("justificar"/"justificación", "lugar"/"lugares"), así que no se usa;
+- las referencias numéricas se conservan como un único término ("38/2003",
+  "1.500,00", "12");
+- `fusionar` combina rankings densos y léxicos (Reciprocal Rank Fusion) y
+  `seleccionar` descarta los fragmentos que quedan muy por debajo del mejor,
+  así que cuando ambas búsquedas coinciden se responde con menos fragmentos.
+"""
+import math
+import os
+import re
+from array import array
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from normalizacion import quitar_acentos
+
+# ======== CONFIGURACIÓN ========
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60                                                   # constante de Reciprocal Rank Fusion
+FUSION_CORTE = float(os.getenv("RAG_FUSION_CORTE", "0.6"))   # fracción de la puntuación del mejor para entrar
+RAG_CANDIDATOS = int(os.getenv("RAG_CANDIDATOS", "20"))      # resultados de cada búsqueda que entran en la fusión
+MODOS_BUSQUEDA = ("hibrido", "denso", "lexico")
+RAG_MODO_BUSQUEDA = os.getenv("RAG_MODO_BUSQUEDA", "hibrido")
+
+_TOKEN = re.compile(r"\d+(?:[.,/-]\d+)*|[^\W\d_]+")
+_ORDINAL = re.compile(r"(\d)[ºª°]")
+
+ABREVIATURAS = {"art": "articulo", "arts": "articulos", "apdo": "apartado", "apdos": "apartados",
+                "disp": "disposicion", "num": "numero", "pag": "pagina", "pags": "paginas"}
+
+PALABRAS_VACIAS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aquel aquella aquellas aquellos aqui asi aun cada
+como con contra cual cuales cuando cuyo cuya de del desde donde durante e el ella ellas ellos en entre era
+eran es esa esas ese eso esos esta estas este esto estos fue fueron ha han hasta hay la las le les lo los mas
+me mi muy ni no nos o os otra otras otro otros para pero por porque que quien se sea sean segun ser si sido
+sin sobre son su sus tambien tan te ti tiene tienen toda todas todo todos tu u un una unas uno unos y ya
+""".split())
+
+
+# ---------- normalización ----------
+_SUFIJOS = ("amiento", "imiento", "acion", "icion", "ucion", "mente", "idad", "able", "ible", "ista", "oso", "osa",
+            "ivo", "iva", "ando", "iendo", "ar", "er", "ir", "o", "a", "e")
+
+
+def _raiz(palabra):
+    # Primero el plural y después un sufijo derivativo, verbal o de género
+    # ("lugares" -> "lugar" -> "lug", "justificaciones" -> "justificacion" -> "justific")
+    for plural in ("es", "s"):
+        if palabra.endswith(plural) and len(palabra) - len(plural) >= 3:
+            palabra = palabra[:-len(plural)]
+            break
+    for sufijo in _SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 3:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+@lru_cache(maxsize=100_000)
+def _termino(palabra):
+    palabra = quitar_acentos(palabra)
+    return _raiz(ABREVIATURAS.get(palabra, palabra))
+
+
+def tokenizar(texto):
+    """Términos BM25 de `texto`: números y referencias enteros, palabras normalizadas y con raíz."""
+    terminos = []
+    for token in _TOKEN.findall(_ORDINAL.sub(r"\1", texto.lower())):
+        if token[0].isdigit():
+            terminos.append(token)
+        elif len(token) > 1 and quitar_acentos(token) not in PALABRAS_VACIAS:
+            terminos.append(_termino(token))
+    return terminos
+
+
+# ---------- índice ----------
+class IndiceBM25:
+    """Índice invertido `término -> (fragmentos, frecuencias)` con altas incrementales."""
+
+    def __init__(self, textos=(), k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._listas = {}
+        self._longitudes = array("I")
+        self.anadir(textos)
+
+    def __len__(self):
+        return len(self._longitudes)
+
+    def anadir(self, textos):
+        """Añade fragmentos al final (sus posiciones siguen a las ya indexadas)."""
+        for texto in textos:
+            terminos = tokenizar(texto)
+            posicion = len(self._longitudes)
+            self._longitudes.append(len(terminos))
+            for termino, frecuencia in Counter(terminos).items():
+                fragmentos, frecuencias = self._listas.setdefault(termino, (array("I"), array("I")))
+                fragmentos.append(posicion)
+                frecuencias.append(frecuencia)
+
+    def tamano(self):
+        """Bytes aproximados del índice (para el presupuesto de memoria del registro)."""
+        return 4 * len(self._longitudes) + sum(8 * len(f) + len(t) + 64 for t, (f, _) in self._listas.items())
+
+    def buscar(self, consulta, k=10):
+        """[(posición del fragmento, puntuación BM25)] de los `k` mejores con puntuación > 0."""
+        n = len(self._longitudes)
+        if not n:
+            return []
+        longitudes = np.frombuffer(self._longitudes, dtype=np.uint32).astype(np.float32)
+        norma = self.k1 * (1 - self.b + self.b * longitudes / max(longitudes.mean(), 1.0))
+        puntuaciones = np.zeros(n, dtype=np.float32)
+        for termino in set(tokenizar(consulta)):
+            if termino not in self._listas:
+                continue
+            fragmentos, frecuencias = self._listas[termino]
+            ids = np.frombuffer(fragmentos, dtype=np.uint32)
+            tf = np.frombuffer(frecuencias, dtype=np.uint32).astype(np.float32)
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            puntuaciones[ids] += idf * tf * (self.k1 + 1) / (tf + norma[ids])
+        mejores = np.argsort(-puntuaciones)[:k]
+        return [(int(i), float(puntuaciones[i])) for i in mejores if puntuaciones[i] > 0]
+
+
+# ---------- fusión ----------
+def fusionar(*rankings, k=RRF_K):
+    """Reciprocal Rank Fusion de listas de claves ordenadas: [(clave, puntuación)] de mayor a menor."""
+    puntuaciones = {}
+    for ranking in rankings:
+        for posicion, clave in enumerate(ranking):
+            puntuaciones[clave] = puntuaciones.get(clave, 0.0) + 1.0 / (k + posicion + 1)
+    return sorted(puntuaciones.items(), key=lambda par: par[1], reverse=True)
+
+
+def seleccionar(fusionados, top_k, corte=FUSION_CORTE):
+    """Como mucho `top_k` claves, sin las que no llegan a `corte` x la puntuación del mejor."""
+    mejores = fusionados[:top_k]
+    if not mejores:
+        return []
+    umbral = mejores[0][1] * corte
+    return [clave for clave, puntuacion in mejores if puntuacion >= umbral]
@@ -0,0 +1,170 @@
+"""
+Índices vectoriales persistentes por documento para el RAG.
+
+Cada documento procesado se guarda en disco (vectores, fragmentos y
+metadatos) bajo una clave que combina el SHA-256 de su contenido, el modelo
+de embeddings y los parámetros de troceado. Volver a subir el mismo PDF, o
+reiniciar el contenedor, carga el índice en milisegundos en lugar de volver a
+extraer el texto y pagar los embeddings.
+
+Estructura de `RAG_INDICES_DIR/<clave>/`:
+- vectores.npy      float32 (n_fragmentos x dimensión)
+- fragmentos.json   textos y metadatos de cada fragmento (documento, sha256
+                    y la página del PDF en la que empieza)
+- meta.json         documento, modelo, parámetros y fecha
+
+Lo usan `rag_openai.py` (OpenAI + FAISS) y `rag.py` (modelos locales).
+"""
+import bisect
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from extraccion_pdf import extraer_paginas
+
+# ======== CONFIGURACIÓN ========
+RAG_INDICES_DIR = os.getenv("RAG_INDICES_DIR", "data/cache/indices")
+FRAGMENTOS_POR_PASO = 256   # con seguimiento de progreso, se embebe por pasos de este tamaño
+
+
+def sha256_fichero(ruta):
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        while trozo := f.read(1024 * 1024):
+            sha.update(trozo)
+    return sha.hexdigest()
+
+
+def clave_indice(sha256, modelo, chunk_size, overlap):
+    """Clave del índice: contenido + modelo de embeddings + parámetros de troceado."""
+    datos = json.dumps([sha256, modelo, chunk_size, overlap])
+    return hashlib.sha256(datos.encode("utf-8")).hexdigest()[:32]
+
+
+def cargar_indice(clave, directorio=RAG_INDICES_DIR):
+    """(vectores, fragmentos, metadatos por fragmento, meta) del índice guardado; None si no existe."""
+    carpeta = os.path.join(directorio, clave)
+    if not os.path.exists(os.path.join(carpeta, "meta.json")):
+        return None
+    vectores = np.load(os.path.join(carpeta, "vectores.npy"))
+    with open(os.path.join(carpeta, "fragmentos.json"), encoding="utf-8") as f:
+        datos = json.load(f)
+    with open(os.path.join(carpeta, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    return vectores, datos["fragmentos"], datos["metadatos"], meta
+
+
+def guardar_indice(clave, vectores, fragmentos, metadatos, meta, directorio=RAG_INDICES_DIR):
+    """Escribe el índice en una carpeta temporal y la publica con un rename atómico."""
+    os.makedirs(directorio, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=directorio, prefix=".tmp-")
+    try:
+        np.save(os.path.join(tmp, "vectores.npy"), np.asarray(vectores, dtype=np.float32))
+        with open(os.path.join(tmp, "fragmentos.json"), "w", encoding="utf-8") as f:
+            json.dump({"fragmentos": fragmentos, "metadatos": metadatos}, f, ensure_ascii=False)
+        # meta.json el último: su presencia marca el índice como completo
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        try:
+            os.replace(tmp, os.path.join(directorio, clave))
+        except OSError:
+            # Otro proceso lo publicó antes (mismo contenido): se descarta el nuestro
+            shutil.rmtree(tmp, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def _actualizar_metadatos(clave, metadatos, directorio=RAG_INDICES_DIR):
+    """Reescribe solo los metadatos de un índice guardado (mismos fragmentos y vectores)."""
+    ruta = os.path.join(directorio, clave, "fragmentos.json")
+    with open(ruta, encoding="utf-8") as f:
+        datos = json.load(f)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({**datos, "metadatos": metadatos}, f, ensure_ascii=False)
+    os.replace(tmp, ruta)
+
+
+def paginas_de_fragmentos(paginas, fragmentos):
+    """
+    Página (número desde 1) en la que empieza cada fragmento. El troceado
+    trabaja sobre el texto de las páginas unidas por saltos de línea y devuelve los
+    fragmentos en orden; cada uno se localiza en ese texto a partir del
+    anterior y su desplazamiento se traduce a página.
+    """
+    inicios, desplazamiento = [], 0
+    for _, texto in paginas:
+        inicios.append(desplazamiento)
+        desplazamiento += len(texto) + 1
+    texto = "\n".join(t for _, t in paginas)
+    resultado, posicion = [], 0
+    for fragmento in fragmentos:
+        encontrado = texto.find(fragmento, posicion)
+        if encontrado >= 0:
+            posicion = encontrado
+        resultado.append(paginas[bisect.bisect_right(inicios, posicion) - 1][0])
+    return resultado
+
+
+def _embeber_con_progreso(fragmentos, embeber, progreso):
+    if progreso is None:
+        return np.asarray(embeber(fragmentos), dtype=np.float32)
+    partes = []
+    for i in range(0, len(fragmentos), FRAGMENTOS_POR_PASO):
+        partes.append(np.asarray(embeber(fragmentos[i:i + FRAGMENTOS_POR_PASO]), dtype=np.float32))
+        progreso("fragmentos", min(i + FRAGMENTOS_POR_PASO, len(fragmentos)), len(fragmentos))
+    return np.concatenate(partes)
+
+
+def indice_documento(doc, modelo, chunk_size, overlap, trocear, embeber, directorio=RAG_INDICES_DIR, progreso=None):
+    """
+    Fragmentos y vectores de un documento (dict con 'ruta', 'nombreFic' y
+    opcionalmente 'sha256'), cargados de disco si ya se procesó con el mismo
+    modelo y troceado o, si no, extraídos, troceados con `trocear(texto)`,
+    embebidos con `embeber(fragmentos) -> array` y guardados.
+    `progreso(etapa, hechos, total)`, opcional, recibe el avance por "paginas"
+    extraídas y "fragmentos" embebidos. Los metadatos de cada fragmento llevan
+    'documento', 'sha256' y 'pagina' (la del PDF en la que empieza).
+    Devuelve (clave, vectores, fragmentos, metadatos) o None si no hay texto.
+    """
+    ruta = doc["ruta"]
+    nombre = doc.get("nombreFic") or os.path.basename(ruta)
+    sha = doc.get("sha256") or sha256_fichero(ruta)
+    clave = clave_indice(sha, modelo, chunk_size, overlap)
+
+    t0 = time.perf_counter()
+    guardado = cargar_indice(clave, directorio)
+    if guardado is not None:
+        vectores, fragmentos, metadatos, _ = guardado
+        if fragmentos and any("pagina" not in m for m in metadatos):
+            # Índice anterior a las páginas: se añaden sin volver a embeber
+            paginas = paginas_de_fragmentos(extraer_paginas(ruta), fragmentos)
+            metadatos = [{**m, "pagina": pagina} for m, pagina in zip(metadatos, paginas)]
+            _actualizar_metadatos(clave, metadatos, directorio)
+        print(f"⚡ Índice de {nombre} cargado de disco ({len(fragmentos)} fragmentos, "
+              f"{(time.perf_counter() - t0) * 1000:.0f} ms)")
+        if progreso:
+            progreso("fragmentos", len(fragmentos), len(fragmentos))
+        return clave, vectores, fragmentos, metadatos
+
+    paginas = extraer_paginas(ruta, progreso=(lambda hechas, total: progreso("paginas", hechas, total))
+                              if progreso else None)
+    texto = "\n".join(t for _, t in paginas)
+    if not texto:
+        return None
+    fragmentos = trocear(texto)
+    vectores = _embeber_con_progreso(fragmentos, embeber, progreso)
+    metadatos = [{"documento": nombre, "sha256": sha, "pagina": pagina}
+                 for pagina in paginas_de_fragmentos(paginas, fragmentos)]
+    guardar_indice(clave, vectores, fragmentos, metadatos, {
+        "documento": nombre, "sha256": sha, "modelo": modelo, "chunk_size": chunk_size,
+        "overlap": overlap, "fragmentos": len(fragmentos), "creado_en": time.time(),
+    }, directorio)
+    print(f"💾 Índice de {nombre} creado ({len(fragmentos)} fragmentos, {time.perf_counter() - t0:.1f}s)")
+    return clave, vectores, fragmentos, metadatos
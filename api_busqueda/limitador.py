@@ -0,0 +1,76 @@
+"""
+Limitador de tasa (token bucket) compartido por todo el proceso.
+
+Sustituye a los `time.sleep` fijos entre peticiones: cada host de origen tiene
+su propio cubo con una tasa (peticiones/segundo) y una ráfaga máxima, y todas
+las llamadas a ese host, vengan del hilo que vengan, consumen del mismo cubo.
+
+Los límites por host se configuran con la variable de entorno BDNS_LIMITES,
+p.ej. '{"www.pap.hacienda.gob.es": [4, 4], "www.infosubvenciones.es": [8, 8]}'.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+# ======== CONFIGURACIÓN ========
+# host -> (peticiones por segundo, ráfaga)
+LIMITES_POR_HOST = {
+    "www.pap.hacienda.gob.es": (4.0, 4),
+    "www.infosubvenciones.es": (8.0, 8),
+}
+LIMITE_POR_DEFECTO = (5.0, 5)
+if os.getenv("BDNS_LIMITES"):
+    LIMITES_POR_HOST.update({h: tuple(v) for h, v in json.loads(os.getenv("BDNS_LIMITES")).items()})
+
+
+class TokenBucket:
+    """Cubo de `capacidad` fichas que se rellena a `tasa` fichas por segundo."""
+
+    def __init__(self, tasa, capacidad):
+        self.tasa = float(tasa)
+        self.capacidad = float(capacidad)
+        self._fichas = float(capacidad)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self, n=1):
+        """
+        Reserva `n` fichas y devuelve los segundos que hay que esperar antes de
+        usarlas (0 si hay saldo). La reserva se hace siempre, así las esperas de
+        llamadas concurrentes quedan escalonadas en lugar de competir.
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultimo) * self.tasa)
+            self._ultimo = ahora
+            self._fichas -= n
+            if self._fichas >= 0:
+                return 0.0
+            return -self._fichas / self.tasa
+
+    def esperar(self, n=1):
+        espera = self.reservar(n)
+        if espera > 0:
+            time.sleep(espera)
+
+    async def esperar_async(self, n=1):
+        espera = self.reservar(n)
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+_limitadores = {}
+_lock_registro = threading.Lock()
+
+
+def limitador_para(url_o_host):
+    """Devuelve el TokenBucket (único por proceso) del host de `url_o_host`."""
+    host = urlsplit(url_o_host).hostname if "://" in url_o_host else url_o_host
+    with _lock_registro:
+        if host not in _limitadores:
+            tasa, rafaga = LIMITES_POR_HOST.get(host, LIMITE_POR_DEFECTO)
+            _limitadores[host] = TokenBucket(tasa, rafaga)
+        return _limitadores[host]
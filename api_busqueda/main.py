@@ -1,25 +1,58 @@
-from fastapi import FastAPI, UploadFile, File
-from pydantic import BaseModel
+from fastapi import FastAPI, Request
+from pydantic import BaseModel, Field
+from typing import Literal
 import pandas as pd
 import numpy as np
 import os
+import json
 from urllib.parse import quote
 
 
-from rag_openai import procesar_documentos_convocatoria, preguntar_al_modelo_rag
+from rag_openai import REGISTRO_INDICES, eventos_respuesta_rag, procesar_documentos_convocatoria, preguntar_al_modelo_rag
 from fastapi.middleware.cors import CORSMiddleware
 from parser_openai_edo_url import (
     data_frame_resumen,
+    eventos_resumen,
     obtener_ids_y_nombres,          # ya lo tienes
     BASE_DOC_URL,                   # ya lo tienes
     descargar_documentos_a_disco,   # (opcional) para RAG/cache local
+    CACHE_CONVOCATORIAS,
+    CACHE_ESTADOS,
+    LLM_CACHE,
+    ESPEJO_BDNS,
+    ALMACEN_DOCUMENTOS,             # documentos en disco por idDocumento / SHA-256
 )
+from cliente_http import CLIENTE_BDNS  # cliente httpx compartido: pool, limitador, reintentos
+from almacen_documentos import EscrituraAsincrona  # escritura en el almacén sin bloquear el bucle
+from zip_documentos import zip_en_streaming
+from trabajos_ingesta import GestorTrabajos
+from subida_documentos import SubidaDemasiadoGrande, SubidaNoValida, recibir_documento
 from fastapi import HTTPException
-from fastapi.responses import StreamingResponse
-import requests, io, zipfile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+import anyio, httpx
 
 app = FastAPI()
 
+def _procesar_y_soltar(documentos, **kwargs):
+    """Ingesta de documentos subidos: el fichero queda fijado en el almacén (no se expulsa) hasta terminar."""
+    try:
+        return procesar_documentos_convocatoria(documentos, **kwargs)
+    finally:
+        for d in documentos:
+            if d.get("lectura") is not None:
+                ALMACEN_DOCUMENTOS.soltar(d["lectura"])
+
+# Ingesta RAG en segundo plano (pool acotado); /procesar_documento solo encola
+TRABAJOS_INGESTA = GestorTrabajos(_procesar_y_soltar)
+
+
+@app.on_event("shutdown")
+def cerrar_cliente_http():
+    CLIENTE_BDNS.cerrar()
+    TRABAJOS_INGESTA.cerrar()
+
 PDF_FOLDER = "data/documentos_convocatoria"
 
 
@@ -37,11 +70,16 @@ os.makedirs("data/documentos_convocatoria", exist_ok=True)
 # --- Búsqueda de convocatorias ---
 class Pregunta(BaseModel):
     texto: str
+    max_paginas: int | None = Field(None, ge=1, le=10)   # páginas de la BDNS a recorrer (por defecto 3)
+    pageSize: int | None = Field(None, ge=1, le=50)      # resultados por página
 
 @app.post("/convocatorias")
-def obtener_convocatorias(pregunta: Pregunta):
+async def obtener_convocatorias(pregunta: Pregunta):
     try:
-        df = data_frame_resumen(pregunta.texto)
+        # El pipeline (pandas + OpenAI) es síncrono: se ejecuta en el pool de hilos
+        df = await run_in_threadpool(
+            data_frame_resumen, pregunta.texto, max_paginas=pregunta.max_paginas, page_size=pregunta.pageSize
+        )
         if not isinstance(df, pd.DataFrame):
             print("ERROR: data_frame_resumen no devolvió un DataFrame")
             return {"error": "data_frame_resumen no devolvió un DataFrame"}
@@ -53,35 +91,172 @@ def obtener_convocatorias(pregunta: Pregunta):
         print("ERROR:", str(e))
         return {"error": str(e)}
 
+# --- Búsqueda de convocatorias en streaming (NDJSON) ---
+def _valor_json(clave, valor):
+    # Mismo criterio que /convocatorias: NaN/inf/None -> "no info"; el estado pendiente se deja en null
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if clave == "estado" and valor is None:
+        return None
+    if valor is None or (np.isscalar(valor) and pd.isna(valor)) or valor in (np.inf, -np.inf):
+        return "no info"
+    return valor
+
+def _registro_json(registro):
+    return {k: _valor_json(k, v) for k, v in registro.items()}
+
+def _linea_ndjson(evento):
+    if evento["tipo"] == "resultados":
+        evento = {**evento, "resultados": [_registro_json(r) for r in evento["resultados"]]}
+    elif evento["tipo"] == "fila":
+        evento = _registro_json(evento)
+    return json.dumps(jsonable_encoder(evento), ensure_ascii=False) + "\n"
+
+@app.post("/convocatorias/stream")
+def obtener_convocatorias_stream(pregunta: Pregunta):
+    """
+    Igual que /convocatorias pero incremental: una línea JSON por evento
+    ("resultados" sin enriquecer, "fila" por cada convocatoria enriquecida,
+    "orden" final o "error"). Ver `eventos_resumen`.
+    """
+    eventos = eventos_resumen(pregunta.texto, max_paginas=pregunta.max_paginas, page_size=pregunta.pageSize)
+    return StreamingResponse(
+        (_linea_ndjson(e) for e in eventos),
+        media_type="application/x-ndjson",
+        # Evita que proxies intermedios acumulen la respuesta
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- Estadísticas de la caché de detalle de convocatorias ---
+@app.get("/cache/convocatorias")
+def estadisticas_cache_convocatorias():
+    return CACHE_CONVOCATORIAS.estadisticas()
+
+# --- Estadísticas de la caché de estados de convocatorias ---
+@app.get("/cache/estados")
+def estadisticas_cache_estados():
+    return CACHE_ESTADOS.estadisticas()
+
+# --- Estadísticas de la caché consulta -> filtros del LLM ---
+@app.get("/cache/filtros")
+def estadisticas_cache_filtros():
+    return LLM_CACHE.estadisticas()
+
+# --- Estado del espejo local de la BDNS ---
+@app.get("/cache/documentos")
+def estadisticas_almacen_documentos():
+    return ALMACEN_DOCUMENTOS.estadisticas()
+
+@app.get("/espejo")
+def estadisticas_espejo():
+    if ESPEJO_BDNS is None:
+        return {"activo": False}
+    return {"activo": True, **ESPEJO_BDNS.estadisticas()}
+
 # --- Procesar documento para RAG ---
-@app.post("/procesar_documento")
-async def procesar_documento(file: UploadFile = File(...)):
-    # Guarda el archivo subido en la carpeta que espera el RAG
-    save_path = f"data/documentos_convocatoria/{file.filename}"
-    os.makedirs("data/documentos_convocatoria", exist_ok=True)
-    with open(save_path, "wb") as f:
-        f.write(await file.read())
-    # Procesa el documento con RAG
-    procesar_documentos_convocatoria([{"id": file.filename, "nombreFic": file.filename}])
-    return {"status": "procesado", "filename": file.filename}
+# El formulario se lee a mano (en streaming), así que se describe aquí para /docs
+FORMULARIO_DOCUMENTO = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"],
+    "properties": {"file": {"type": "string", "format": "binary"}, "indice": {"type": "string"}},
+}}}}}
+
+@app.post("/procesar_documento", openapi_extra=FORMULARIO_DOCUMENTO)
+async def procesar_documento(request: Request):
+    # Guarda el archivo subido en el almacén de documentos (clave: su SHA-256) según llega,
+    # por trozos y con un tamaño máximo (SUBIDA_MAX_BYTES)
+    try:
+        info, campos = await recibir_documento(request, ALMACEN_DOCUMENTOS, fijar=True)
+    except SubidaDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except SubidaNoValida as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # `indice`: índice RAG al que añadir el documento (p. ej. uno por convocatoria);
+    # sin él se crea/reutiliza uno propio del documento
+    indice = campos.get("indice") or None
+    if indice:
+        try:
+            REGISTRO_INDICES.validar_id(indice)
+        except ValueError as e:
+            await run_in_threadpool(ALMACEN_DOCUMENTOS.soltar, info["lectura"])
+            raise HTTPException(status_code=400, detail=str(e))
+    nombre = info["nombre"] or f"{info['sha256'][:16]}.pdf"
+    # Procesa el documento con RAG en segundo plano: se responde enseguida con el trabajo.
+    # El fichero sigue fijado en el almacén hasta que termine la ingesta (`_procesar_y_soltar`)
+    trabajo = TRABAJOS_INGESTA.enviar({"id": info["id"], "nombreFic": nombre, "ruta": info["ruta"],
+                                       "sha256": info["sha256"], "lectura": info["lectura"]}, indice=indice)
+    if trabajo.documento.get("lectura") != info["lectura"]:
+        # Ya se estaba procesando el mismo fichero: esa ingesta tiene su propia lectura
+        await run_in_threadpool(ALMACEN_DOCUMENTOS.soltar, info["lectura"])
+    return JSONResponse(status_code=202, content={"status": "en_proceso", "filename": nombre, **trabajo.a_dict()})
+
+@app.get("/trabajos/{trabajo_id}")
+def estado_trabajo(trabajo_id: str):
+    """Estado de un trabajo de ingesta: avance, ETA y, al completarse, el índice RAG."""
+    estado = TRABAJOS_INGESTA.obtener(trabajo_id)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return estado
+
+@app.get("/trabajos")
+def estadisticas_trabajos():
+    return TRABAJOS_INGESTA.estadisticas()
 
 # --- Preguntar al RAG ---
 class RAGPregunta(BaseModel):
     pregunta: str
+    indice: str   # id devuelto por /procesar_documento (obligatorio: sin él, 422)
+    # Recuperación: densa + BM25 fusionadas, solo densa o solo léxica (sin embedding de la pregunta)
+    modo: Literal["hibrido", "denso", "lexico"] | None = None
+
+def _validar_indice(indice):
+    try:
+        REGISTRO_INDICES.validar_id(indice)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/preguntar_rag")
 def preguntar_rag(req: RAGPregunta):
+    _validar_indice(req.indice)
     try:
-        respuesta = preguntar_al_modelo_rag(req.pregunta)
+        respuesta = preguntar_al_modelo_rag(req.pregunta, indice_id=req.indice, modo=req.modo)
         return {"resultados": [{"respuesta": respuesta}]}
     except Exception as e:
         return {"error": str(e)}
 
+def _eventos_sse(eventos):
+    # Server-Sent Events: "event: <tipo>" + "data: <json>"; un error se envía como evento final
+    try:
+        for evento in eventos:
+            yield f"event: {evento['tipo']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+    except Exception as e:
+        print("ERROR:", str(e))
+        yield f"event: error\ndata: {json.dumps({'tipo': 'error', 'error': str(e)}, ensure_ascii=False)}\n\n"
+
+@app.post("/preguntar_rag/stream")
+def preguntar_rag_stream(req: RAGPregunta):
+    """
+    Igual que /preguntar_rag pero en streaming (SSE): primero un evento
+    "contexto" con los fragmentos recuperados, después un "token" por cada
+    trozo de la respuesta según lo genera el modelo y un "fin" (o "aviso" /
+    "error"). Ver `eventos_respuesta_rag`.
+    """
+    _validar_indice(req.indice)
+    return StreamingResponse(
+        _eventos_sse(eventos_respuesta_rag(req.pregunta, indice_id=req.indice, modo=req.modo)),
+        media_type="text/event-stream",
+        # Evita que proxies intermedios acumulen la respuesta
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/rag/indices")
+def estadisticas_indices_rag():
+    return REGISTRO_INDICES.estadisticas()
+
 
     # --- ENDPOINT: listar documentos reales de una convocatoria ---
 @app.get("/convocatorias/{numconv}/documentos")
-def listar_documentos(numconv: int):
-    docs = obtener_ids_y_nombres(numconv)
+async def listar_documentos(numconv: int):
+    docs = await run_in_threadpool(obtener_ids_y_nombres, numconv)
     return {
         "has": bool(docs),
         "documentos": [
@@ -99,51 +274,120 @@ def listar_documentos(numconv: int):
 
 
 # --- ENDPOINT: descarga directa de UN PDF (streaming) ---
-@app.get("/documentos/{doc_id}")
-def descargar_documento(doc_id: int, name: str | None = None):
-    r = requests.get(BASE_DOC_URL.format(doc_id), timeout=30)
-    if not r.ok:
-        raise HTTPException(status_code=404, detail="Documento no disponible")
+# Cabeceras de la BDNS que se reenvían tal cual al cliente
+CABECERAS_PROXY = ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "Last-Modified", "ETag")
+
+class RespuestaProxy(StreamingResponse):
+    """
+    StreamingResponse que cierra siempre el stream de la BDNS (hueco del
+    semáforo del host y conexión del pool), también si el cliente se desconecta
+    antes de que se empiece a leer el cuerpo: en ese caso el generador no llega
+    a arrancar y su `finally` no se ejecuta.
+    """
+    def __init__(self, upstream, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upstream = upstream
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Aunque la petición se esté cancelando; cerrar es idempotente
+            with anyio.CancelScope(shield=True):
+                await self.upstream.cerrar()
+
+class RespuestaAlmacen(FileResponse):
+    """FileResponse de un documento del almacén fijado con `buscar(..., fijar=True)`:
+    la lectura se suelta al terminar de enviarlo, también si el cliente se desconecta."""
+    def __init__(self, lectura, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lectura = lectura
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(ALMACEN_DOCUMENTOS.soltar, self.lectura)
 
+async def _reenviar_y_guardar(upstream, doc_id, nombre):
+    """
+    Reenvía los trozos de la BDNS según llegan y, si la respuesta es el fichero
+    completo, los va escribiendo en el almacén de documentos, que solo lo
+    publica si la descarga termina entera. El disco y SQLite van en el pool de
+    hilos (`EscrituraAsincrona`).
+    """
+    escritura = await EscrituraAsincrona.abrir(ALMACEN_DOCUMENTOS) if upstream.status_code == 200 else None
+    try:
+        async for trozo in upstream.iter_bytes():
+            if escritura:
+                await escritura.write(trozo)
+            yield trozo
+        if escritura:
+            await escritura.confirmar(doc_id, mime=upstream.headers.get("Content-Type"), nombre=nombre,
+                                      tamano_esperado=upstream.headers.get("Content-Length"))
+            escritura = None
+    finally:
+        # Cliente desconectado o descarga incompleta: no se deja nada a medias en el almacén
+        await upstream.cerrar()
+        if escritura:
+            await escritura.descartar()
+
+@app.get("/documentos/{doc_id}")
+async def descargar_documento(doc_id: int, request: Request, name: str | None = None):
+    """
+    Proxy en streaming del documento: sirve desde el almacén local si ya está en
+    disco y, si no, reenvía los bytes de la BDNS según llegan. Admite peticiones
+    Range para que los visores de PDF carguen páginas bajo demanda.
+    """
     filename = name or f"{doc_id}"  # usamos el nombre que vino en la lista
-    media_type = r.headers.get("Content-Type") or "application/octet-stream"
+    disposicion = {"Content-Disposition": f'attachment; filename="{filename}"'}
 
-    return StreamingResponse(
-        io.BytesIO(r.content),
-        media_type=media_type,
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    info = await run_in_threadpool(ALMACEN_DOCUMENTOS.buscar, doc_id, fijar=True)
+    if info is not None:
+        # FileResponse resuelve Range / 206 / 416 por sí mismo
+        return RespuestaAlmacen(info["lectura"], info["ruta"], media_type=info["mime"] or "application/octet-stream",
+                                headers=disposicion)
+
+    rango = request.headers.get("Range")
+    try:
+        r = await CLIENTE_BDNS.abrir_stream(BASE_DOC_URL.format(doc_id), headers={"Range": rango} if rango else None)
+    except httpx.HTTPError:
+        raise HTTPException(status_code=502, detail="BDNS no disponible")
+    if r.status_code == 416:
+        await r.cerrar()
+        raise HTTPException(status_code=416, detail="Rango no satisfacible")
+    if not r.is_success:
+        await r.cerrar()
+        raise HTTPException(status_code=404, detail="Documento no disponible")
+
+    cabeceras = {h: r.headers[h] for h in CABECERAS_PROXY if h in r.headers}
+    cabeceras.setdefault("Content-Type", "application/octet-stream")
+    return RespuestaProxy(
+        r,
+        _reenviar_y_guardar(r, doc_id, name),
+        status_code=r.status_code,  # 200, o 206 si se pidió un rango
+        headers={**cabeceras, **disposicion},
     )
 
 # --- ENDPOINT: ZIP con TODOS los PDFs de una convocatoria ---
 @app.get("/convocatorias/{numconv}/documentos.zip")
-def descargar_zip(numconv: int):
+async def descargar_zip(numconv: int):
     """
-    Empaqueta en memoria todos los PDFs y los sirve como ZIP.
+    Sirve como ZIP todos los documentos de la convocatoria, escrito en
+    streaming: los bytes salen mientras se descargan los siguientes documentos
+    (hasta ZIP_PREFETCH en paralelo) y la memoria no depende del tamaño total.
     """
     try:
-        docs = obtener_ids_y_nombres(numconv)  # [{id,name}]
+        docs = await run_in_threadpool(obtener_ids_y_nombres, numconv)  # [{id,name}]
     except Exception:
         docs = []
 
     if not docs:
         raise HTTPException(status_code=404, detail="Sin documentos para esta convocatoria")
 
-    mem = io.BytesIO()
-    with zipfile.ZipFile(mem, "w", compression=zipfile.ZIP_DEFLATED) as z:
-        for d in docs:
-            try:
-                r = requests.get(BASE_DOC_URL.format(d["id"]), timeout=30)
-                if r.ok:
-                    z.writestr(d["name"], r.content)
-            except requests.RequestException:
-                # si un doc falla, seguimos con los demás
-                continue
-
-    mem.seek(0)
     return StreamingResponse(
-        mem,
+        zip_en_streaming(docs, ALMACEN_DOCUMENTOS),
         media_type="application/zip",
         headers={"Content-Disposition": f'attachment; filename="convocatoria_{numconv}.zip"'}
     )
-
-
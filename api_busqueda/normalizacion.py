@@ -0,0 +1,18 @@
+"""
+Utilidades de normalización de texto compartidas por los parsers y cachés.
+"""
+import re
+import unicodedata
+
+
+def quitar_acentos(texto: str) -> str:
+    """Elimina tildes y diacríticos ("Sevilla, Cádiz, España" -> "Sevilla, Cadiz, Espana")."""
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, sin acentos y con los espacios colapsados."""
+    if not texto:
+        return ""
+    return re.sub(r"\s+", " ", quitar_acentos(texto).lower()).strip()
@@ -12,8 +12,8 @@ from datetime import datetime, timedelta # Importa clases para manejar fechas y
 from typing import Dict, List, Any, Optional
 from logging import warning
 
-import requests
 import pandas as pd
+import numpy as np
 import re
 from openai import OpenAI
 import json
@@ -21,13 +21,63 @@ import os
 import unicodedata
 
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 
 # Importar la configuración personalizada
 from config import get_openai_client
+from cache_convocatorias import CacheConvocatorias
+from cache_estados import CacheEstados
+from almacen_documentos import AlmacenDocumentos, URL_DOCUMENTO
+from espejo_bdns import EspejoBDNS, ESPEJO_DB
+from cache_filtros import CacheFiltros
+from clasificador_embeddings import ClasificadorMapas
+from mapas_bdns import REGIONES_MAP, TIPOS_BENEFICIARIO_MAP, INSTRUMENTOS_MAP, FINALIDADES_MAP
+from gazetteer_regiones import extraer_regiones, consulta_trivial, palabras_clave, PATRON_NUMERO_CONVOCATORIA
+from normalizacion import normalizar_texto
+from cliente_http import CLIENTE_BDNS
+from plazos import decidir_estado
 
 # Obtener el cliente de OpenAI configurado
 client = get_openai_client()
-LLM_CACHE = {}
+
+OPENAI_EMBED_MODEL = "text-embedding-3-small"
+
+
+@lru_cache(maxsize=256)
+def embedding_consulta(texto: str) -> np.ndarray:
+    """Embedding normalizado (norma 1) de una consulta corta. Se memoiza: la caché
+    semántica y el clasificador piden el de la misma consulta."""
+    resp = client.embeddings.create(model=OPENAI_EMBED_MODEL, input=texto)
+    vector = np.asarray(resp.data[0].embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def embeddings_textos(textos: List[str]) -> np.ndarray:
+    """Embeddings de varios textos en un único request (filas en el mismo orden)."""
+    resp = client.embeddings.create(model=OPENAI_EMBED_MODEL, input=list(textos))
+    return np.asarray([d.embedding for d in sorted(resp.data, key=lambda d: d.index)], dtype=np.float32)
+
+
+# Caché consulta -> filtros de parser_openai (exacta + semántica, LRU, en SQLite compartido por los workers)
+LLM_CACHE = CacheFiltros(embedder=embedding_consulta)
+
+# Clasificador local de beneficiario/instrumento/finalidad (embeddings de los mapas precalculados)
+CLASIFICADOR_MAPAS = ClasificadorMapas(embedding_consulta, embeddings_textos, OPENAI_EMBED_MODEL)
+
+# Caché en disco del detalle de convocatorias (compartida por todos los workers)
+CACHE_CONVOCATORIAS = CacheConvocatorias()
+
+# Caché en disco del estado de cada convocatoria (invalidada por huella de entradas y fecha de cierre)
+CACHE_ESTADOS = CacheEstados()
+
+# Espejo local de la búsqueda de la BDNS (se sincroniza con `python espejo_bdns.py`).
+# Sin BDNS_USAR_ESPEJO explícito solo se usa si ya existe la base (es decir, si se ha sincronizado).
+USAR_ESPEJO = os.getenv("BDNS_USAR_ESPEJO", "1" if os.path.exists(ESPEJO_DB) else "0") == "1"
+ESPEJO_BDNS = EspejoBDNS() if USAR_ESPEJO else None
+
+# Documentos descargados de la BDNS, por idDocumento y SHA-256 (descargas, ZIP y RAG)
+ALMACEN_DOCUMENTOS = AlmacenDocumentos()
 
 
 import openai
@@ -43,149 +93,141 @@ from typing import Dict, Any, Optional
 # y colocar tu clave directamente, pero con precaución.
 
 
-def parser_openai(query: str) -> Optional[Dict[str, Any]]:
-    """
-    Analiza una consulta de lenguaje natural para subvenciones usando la API de OpenAI.
+# Parámetros fijos que el prompt pide incluir siempre en la salida
+PARAMETROS_FIJOS = {
+    "descripcionTipoBusqueda": 2,
+    "order": "fechaRecepcion",
+    "direccion": "desc",
+    "vpd": "GE",
+    "page": 0,
+    "pageSize": 5,
+}
 
-    Args:
-        query (str): La consulta de búsqueda del usuario en lenguaje natural.
 
-    Returns:
-        Optional[Dict[str, Any]]: Un diccionario con los parámetros de búsqueda extraídos,
-                                  o None si la llamada a la API falla.
+def _formatear_mapa(mapa: Dict[str, Any]) -> str:
+    return json.dumps(mapa, ensure_ascii=False, indent=4)
+
+
+def filtros_sin_llm(query: str, regiones: List[int]) -> Optional[Dict[str, Any]]:
+    """
+    Atajo determinista: si la consulta solo contiene regiones, un número de
+    convocatoria y palabras triviales ("ayudas en Sevilla", "convocatoria 812345")
+    construye los filtros sin llamar al LLM. Devuelve None si no aplica.
+    No se fija `finalidad`: no hay sector en la consulta y filtrar por uno
+    arbitrario dejaría fuera resultados.
+    """
+    if not consulta_trivial(query):
+        return None
+    numero = PATRON_NUMERO_CONVOCATORIA.search(normalizar_texto(query))
+    if numero:
+        return {"numeroConvocatoria": int(numero.group(0)), **PARAMETROS_FIJOS}
+    return {"regiones": regiones, **PARAMETROS_FIJOS}
+
+
+def combinar_regiones(filtros: Dict[str, Any], regiones: List[int], maximo: int = 2) -> Dict[str, Any]:
+    """Las regiones del gazetteer (deterministas) tienen prioridad sobre las del LLM."""
+    if not regiones or filtros.get("numeroConvocatoria"):
+        return filtros
+    del_llm = filtros.get("regiones") or []
+    if not isinstance(del_llm, list):
+        del_llm = [del_llm]
+    combinadas = list(regiones)
+    for r in del_llm:
+        if r not in combinadas:
+            combinadas.append(r)
+    filtros["regiones"] = combinadas[:maximo]
+    return filtros
+
+
+# Secciones de mapeo del prompt: (parámetro, comentario, nombre en el prompt, mapa)
+SECCIONES_PROMPT = [
+    ("regiones",
+     "# Mapeo de nombres de regiones/provincias de España a sus IDs numéricos.\n"
+     "# Las claves son strings en minúsculas y los valores son listas que contienen el ID.",
+     "regiones_map", REGIONES_MAP),
+    ("tiposBeneficiario",
+     "# Mapeo de palabras clave de tipos de beneficiario a sus IDs numéricos.\n"
+     "# Los IDs están en listas, lo que permite flexibilidad para futuras expansiones",
+     "tipos_beneficiario_comunes_map", TIPOS_BENEFICIARIO_MAP),
+    ("instrumentos",
+     "# Mapeo de palabras clave de instrumentos de ayuda a sus IDs numéricos.\n"
+     "# Los IDs están en listas, permitiendo asociar múltiples palabras a un mismo ID.",
+     "instrumentos_map", INSTRUMENTOS_MAP),
+    ("finalidad",
+     "# Mapeo de palabras clave de finalidades de política de gasto a sus IDs numéricos.",
+     "finalidades_map", FINALIDADES_MAP),
+]
+PARAMETROS_LLM = [seccion[0] for seccion in SECCIONES_PROMPT]
+EJEMPLO_SALIDA = {
+    "descripcion": "beca doctorado estudiante",
+    "numeroConvocatoria": 812345,
+    "regiones": [27],
+    "finalidad": 8,
+    "instrumentos": 1,
+    "tiposBeneficiario": [1, 3],
+}
+
+
+def construir_system_prompt(parametros: List[str] = PARAMETROS_LLM) -> str:
+    """
+    Prompt del parser con solo los mapas de `parametros`. Cuando el clasificador
+    local ya ha resuelto alguna categoría, su mapa no se envía (menos tokens).
     """
-    system_prompt = f'''Eres un asistente experto en la clasificación de subvenciones. Tu tarea es analizar una consulta de un usuario y extraer parámetros clave para refinar una búsqueda de subvenciones.
-                A continuación, se te proporcionan varios diccionarios de mapeo. Cada diccionario contiene descripciones y palabras clave asociadas a un ID numérico o un código.
-                Debes leer la QUERY del usuario, identificar qué clasificaciones son relevantes para cada PARAMETRO y devolver el ID o código correspondiente.
-                ##
-
-                # Mapeo de nombres de regiones/provincias de España a sus IDs numéricos.
-                # Las claves son strings en minúsculas y los valores son listas que contienen el ID.
-                regiones_map = {{
-                "a coruña": [4], "lugo": [5], "ourense": [6], "pontevedra": [7],
-                "galicia": [3], "asturias": [9], "principado de asturias": [8],
-                "cantabria": [11], "cantabria": [10],
-                "noroeste": [2], "araba/álava": [14], "gipuzkoa": [15],
-                "bizkaia": [16], "pais vasco": [13], "navarra": [18],
-                "comunidad foral de navarra": [17], "la rioja": [20],
-                "la rioja": [19],
-                "huesca": [22], "teruel": [23], "zaragoza": [24],
-                "aragon": [21], "noreste": [12], "madrid": [27],
-                "comunidad de madrid": [26], "centro (es)": [28],
-                "ávila": [30], "burgos": [31], "león": [32],
-                "palencia": [33], "salamanca": [34], "segovia": [35],
-                "soria": [36], "valladolid": [37], "zamora": [38],
-                "castilla y leon": [29], "albacete": [40], "ciudad real": [41],
-                "cuenca": [42], "guadalajara": [43], "toledo": [44],
-                "castilla la mancha": [39], "badajoz": [46], "cáceres": [47],
-                "extremadura": [45], "barcelona": [50], "girona": [51],
-                "lleida": [52], "tarragona": [53], "cataluña": [49],
-                "alicante": [55], "castellón": [56], "valencia": [57],
-                "comunidad valenciana": [54], "eivissa y formentera": [59],
-                "mallorca": [60], "menorca": [61], "illes balears": [58],
-                "este": [48], "almería": [64], "cádiz": [65], "córdoba": [66],
-                "granada": [67], "huelva": [68], "jaén": [69], "málaga": [70],
-                "sevilla": [71], "andalucia": [63], "murcia": [73],
-                "region de murcia": [72], "ceuta": [75], "ciudad autonoma de ceuta": [74],
-                "melilla": [77], "ciudad autonoma de melilla": [76],
-                "sur": [62], "el hierro": [80], "fuerteventura": [81],
-                "gran canaria": [82], "la gomera": [83], "la palma": [84],
-                "lanzarote": [85], "tenerife": [86], "canarias": [79],
-                "españa": [1], "extra-regio nuts 1": [87]
-                }}
-
-
-                # Mapeo de palabras clave de tipos de beneficiario a sus IDs numéricos.
-                # Los IDs están en listas, lo que permite flexibilidad para futuras expansiones
-                tipos_beneficiario_comunes_map = {{
-                    "Esta categoría incluye a personas físicas que no desarrollan ninguna actividad económica. Engloba a particulares, ciudadanos en general, individuos, estudiantes, jubilados, desempleados, pensionados, familias y hogares que buscan ayudas o beneficios.": [1],
-                    "Esta categoría se refiere a personas jurídicas que no persiguen un fin de lucro o no realizan una actividad económica lucrativa. Incluye a asociaciones, fundaciones, organizaciones sin ánimo de lucro (ONGs), clubes deportivos, federaciones, confederaciones, partidos políticos y colegios profesionales.": [2],
-                    "Engloba a Pequeñas y Medianas Empresas (PYMES) y a personas físicas (autónomos) que sí desarrollan una actividad económica. Aquí se incluyen autónomos, profesionales independientes, emprendedores, pequeños negocios, microempresas, sociedades limitadas (SL) y start-ups.": [3],
-                    "Esta categoría está dirigida a grandes empresas, corporaciones, multinacionales y otras entidades de gran envergadura o tamaño económico. Son organizaciones con una gran capacidad productiva y un número elevado de empleados.": [4]
-                }}
-
-
-
-                # Mapeo de palabras clave de instrumentos de ayuda a sus IDs numéricos.
-                # Los IDs están en listas, permitiendo asociar múltiples palabras a un mismo ID.
-                instrumentos_map = {{
-                    "SUBVENCIÓN Y ENTREGA DINERARIA SIN CONTRAPRESTACIÓN. Ayuda económica no reembolsable, también conocida como subvención directa, que se otorga sin esperar devolución ni contraprestación. Se vincula a un objetivo concreto como la innovación, el empleo, o el desarrollo regional. Palabras clave: subvención, ayuda directa, entrega dineraria, no reembolsable, sin contraprestación.": 1,
-                    "PRÉSTAMO. Instrumento financiero basado en la entrega de capital reembolsable, generalmente sujeto a intereses y plazos de amortización. Puede tener tipo de interés fijo o variable. Frecuente en programas de financiación para inversiones, digitalización o crecimiento empresarial. Palabras clave: préstamo, devolución, intereses, amortización, financiación": 2,
-                    "GARANTÍA. Instrumento de aval, fianza o respaldo financiero proporcionado por una entidad para asegurar el cumplimiento de obligaciones o facilitar el acceso a otras fuentes de financiación. Se usa mucho en licitaciones, proyectos de inversión o emprendimiento. Palabras clave: garantía, aval, respaldo, fianza, seguridad financiera.": 4,
-                    "VENTAJA FISCAL. Conjunto de incentivos en materia de impuestos o tributos, como deducciones fiscales, bonificaciones, exenciones o aplazamientos. Permiten a empresas o autónomos reducir su carga fiscal. Muy frecuente en políticas de I+D+i o empleo. Palabras clave: ventaja fiscal, deducción, bonificación, exención, ahorro tributario.": 5,
-                    "APORTACIÓN DE FINANCIACIÓN DE RIESGO. Modalidad de inversión que implica asumir riesgo empresarial, como el capital riesgo o el venture capital. El apoyo se hace mediante la entrada al capital social o financiación subordinada. Muy usada en startups o proyectos con alto potencial de crecimiento. Palabras clave: capital riesgo, inversión, venture capital, participación, financiación de riesgo.": 6,
-                    "OTROS INSTRUMENTOS DE AYUDA. Categoría abierta para apoyos no monetarios directos como consultoría gratuita, asesoramiento técnico, acceso a espacios físicos o servicios sin coste. Incluye cualquier forma de ayuda que no sea préstamo, subvención, garantía, fiscalidad o capital. Palabras clave: asesoramiento, consultoría, cesión, soporte no financiero, apoyo institucional.": 7
-                }}
-
-                # Mapeo de palabras clave de finalidades de política de gasto a sus IDs numéricos.
-                finalidades_map = {{
-                    "ACCESO A LA VIVIENDA Y FOMENTO DE LA EDIFICACIÓN. Ayudas y programas dirigidos a facilitar la adquisición, el alquiler o la rehabilitación de viviendas, así como al impulso y financiación de proyectos de construcción de nuevas edificaciones. Palabras clave: vivienda, alquiler, hipoteca, rehabilitación, edificación.": 8,
-                    "AGRICULTURA, PESCA Y ALIMENTACIÓN. Programas de apoyo a la agricultura, la ganadería, la silvicultura, la pesca y todas las actividades relacionadas con la producción, transformación y comercialización de alimentos. Palabras clave: agroalimentario, ganadería, agricultura, pesca, alimentos.": 12,
-                    "COMERCIO, TURISMO. Iniciativas y fondos destinados a impulsar el comercio minorista y mayorista, la promoción turística de destinos y servicios, y el apoyo específico a Empresas en su desarrollo y crecimiento del sector turismo. Palabras clave: comercio, turismo, hostelería, marketing comercial.": 14,
-                    "COOPERACIÓN INTERNACIONAL PARA EL DESARROLLO Y CULTURAL. Proyectos y fondos orientados a la colaboración con otros países para su desarrollo económico y social, así como al fomento y difusión de la cultura a nivel internacional. Palabras clave: cooperación internacional, ayuda exterior, desarrollo global, cultura exterior, relaciones internacionales.": 20,
-                    "CULTURA. Ayudas y programas para la promoción, conservación y difusión del patrimonio cultural, las artes escénicas, las bellas artes, el cine, la música, la literatura y otras manifestaciones culturales. Palabras clave: patrimonio, arte, cine, música, literatura.": 11,
-                    "DEFENSA. Programas y presupuestos destinados a la seguridad y defensa nacional, incluyendo el equipamiento militar, la formación de personal y las operaciones de seguridad y protección. Palabras clave: defensa, militar, ejército, armamento, estrategia nacional.": 2,
-                    "DESEMPLEO. Ayudas y prestaciones dirigidas a personas en situación de desempleo, incluyendo subsidios, prestaciones por desempleo y programas de reinserción laboral. Palabras clave: paro, subsidio, prestación por desempleo, reinserción, desempleado.": 7,
-                    "EDUCACION. Fondos y programas dedicados a la financiación de centros educativos, becas para estudiantes, formación profesional, educación superior y todas las actividades relacionadas con la enseñanza y el aprendizaje. Palabras clave: educación, beca, escolar, universidad, formación académica.": 10,
-                    "FOMENTO DEL EMPLEO. Iniciativas y ayudas para la creación de empleo, el fomento del autoempleo, la formación y cualificación profesional, y el apoyo a la contratación de colectivos específicos. Palabras clave: contratación, autoempleo, inserción laboral, empleabilidad, creación de empleo.": 6,
-                    "INDUSTRIA Y ENERGÍA. Ayudas y programas para el desarrollo de la industria, la innovación tecnológica en el sector industrial, la eficiencia energética y el fomento de fuentes de energía sostenibles. Palabras clave: industria, energía, eficiencia energética, fábrica, energía renovable.": 13,
-                    "INFORMACIÓN NO DISPONIBLE. Esta categoría se utiliza cuando no se dispone de información específica o suficiente para clasificar la ayuda en ninguna de las otras áreas definidas. Palabras clave: desconocido, sin categorizar, información ausente, no disponible.": 21,
-                    "INFRAESTRUCTURAS. Inversiones y proyectos para el desarrollo y mantenimiento de infraestructuras de transporte (carreteras, ferrocarriles, puertos, aeropuertos), energéticas, hidráulicas o de telecomunicaciones. Palabras clave: carreteras, infraestructuras, transporte, puertos, telecomunicaciones.": 16,
-                    "INVESTIGACIÓN, DESARROLLO E INNOVACIÓN. Apoyo a proyectos de investigación científica, desarrollo tecnológico y actividades de innovación en todos los sectores, buscando el avance del conocimiento y la aplicación de nuevas tecnologías. Palabras clave: I+D, innovación, ciencia, desarrollo tecnológico, investigación aplicada.": 17,
-                    "JUSTICIA. Programas y fondos relacionados con la administración de justicia, los sistemas judiciales, la asistencia legal y los servicios penitenciarios. Palabras clave: justicia, tribunales, legal, juzgado, penitenciario.": 1,
-                    "OTRAS ACTUACIONES DE CARÁCTER ECONÓMICO. Categoría amplia que engloba subvenciones y ayudas no clasificables en otros sectores específicos, pero que tienen un claro impacto o finalidad económica, como apoyo a empresas en general, desarrollo regional, etc. Palabras clave: subvenciones, incentivo empresarial, desarrollo economico, crecimiento.": 18,
-                    "OTRAS PRESTACIONES ECONÓMICAS. Incluye diversas ayudas económicas que no se ajustan a las categorías de empleo, vivienda o dependencia, como ayudas a familias, a la natalidad, o prestaciones económicas por situaciones especiales. Palabras clave: natalidad, familia numerosa, prestación especial, ayuda puntual, situación excepcional.": 4,
-                    "SANIDAD. Programas y fondos destinados a la atención sanitaria, la prevención de enfermedades, la salud pública, la investigación médica y la mejora de los servicios de salud. Palabras clave: salud, sanidad, atención médica, prevención, sistema sanitario.": 9,
-                    "SEGURIDAD CIUDADANA E INSTITUCIONES PENITENCIARIAS. Ayudas y presupuestos para la seguridad pública, las fuerzas y cuerpos de seguridad, la prevención del delito, y la gestión y funcionamiento de las instituciones penitenciarias. Palabras clave: seguridad, policía, vigilancia, delincuencia, prisión.": 3,
-                    "SERVICIOS SOCIALES Y PROMOCIÓN SOCIAL. Programas y prestaciones dirigidos a colectivos vulnerables, promoción de la inclusión social, atención a la dependencia, servicios para personas mayores o con discapacidad, y otras iniciativas de bienestar social. Palabras clave: servicios sociales, dependencia, inclusión, personas mayores, discapacidad.": 5,
-                    "SIN INFORMACION ESPECIFICA. Similar a 'INFORMACIÓN NO DISPONIBLE', esta categoría se usa cuando la temática de la subvención no está claramente definida o especificada dentro de las categorías preestablecidas. Palabras clave: sin información, sin especificar, indeterminado, categoría desconocida.": 19,
-                    "SUBVENCIONES AL TRANSPORTE. Ayudas específicas destinadas a fomentar el uso del transporte público, la mejora de infraestructuras de transporte o la subvención de billetes o abonos para usuarios. Palabras clave: transporte público, billete subvencionado, movilidad urbana, bono transporte, accesibilidad vial.": 15
-                }}
-
-                ## INSTRUCCIONES PARA LA SALIDA:
-
-                1.  Analiza la consulta de usuario.
-                2.  Para cada PARAMETRO (regiones, tiposBeneficiario, instrumentos, finalidad), determina la mejor coincidencia. IMPORTANTE: tiposBeneficiario y regiones pueden tener dos opciones como máximo. Las que mejor clasifiquen la query.
-                2.1. Para clasificar la finalidad, identifica primero el SECTOR o ACTIVIDAD PRINCIPAL. Si la consulta menciona una empresa, producto o servicio concreto (ej. librería, granja, clínica, editorial), busca en qué sector de la economía encaja (Cultura, Agricultura, Sanidad, Industria, etc.) antes de considerar el tamaño o el tipo de beneficiario.
-                2.2. Para clasificar instrumentos, prioriza las palabras clave y expresiones exactas de la consulta. Si se mencionan términos como “subvención”, “ayuda directa”, “aportación no reembolsable” asignar a SUBVENCIÓN. Si se mencionan “préstamo”, “crédito”, “leasing”, “renting”, “financiación de activos” asignar a PRÉSTAMO. Si se mencionan “garantía”, “aval”, “fianza” asignar a GARANTÍA. Si se mencionan deducciones, bonificaciones o exenciones fiscales asignar a VENTAJA FISCAL. Si se habla de capital riesgo, inversión o venture capital asignar a APORTACIÓN DE FINANCIACIÓN DE RIESGO. Si no se identifica ninguna palabra clave de las categorías anteriores, asignar OTROS INSTRUMENTOS DE AYUDA. No asumir que “financiación” significa automáticamente subvención; deducir según contexto y sector.
-                3.  Si una consulta sugiere múltiples opciones para un parámetro (por ejemplo, "Castilla y León y Madrid"), incluye todos los IDs relevantes en una lista. Igual para tipos_beneficiario. maximo dos.
-                4.  Si un parámetro (regiones, tiposBeneficiario, instrumentos, finalidad) no se menciona en la consulta y no se puede inferir, no lo agregues al diccionario de salida. finalidad siempre debe tener un valor, no puede ser NULL.
-                5.  También necesito que extraigas una cadena con maximo 10 palabras clave de la query, ignorando stopwords. Usa la clave "descripcion".
-                6.  Si el QUERY contiene un entero de 6 digitos empezando con el numero 8, lo mas probable es que se trate del numero de convocatoria. así que colócalo como el parámetro "numeroConvocatoria". Al mismo tiempo deja los demas parametros(regiones, tiposBeneficiario, instrumentos, finalidad) en None.
-                7.  El formato de salida debe ser un único objeto JSON. NO AGREGUES MÁS INFORMACIÓN. SOLO EL DICCIONARIO.
-                8.  Hay algunos parámetros que son fijos y no cambian, pero quiero que los incluyas siempre:
-                    - "descripcionTipoBusqueda": 2
-                    - "order": "fechaRecepcion"
-                    - "direccion": "desc"
-                    - "vpd": "GE"
-                    - "page": 0
-                    - "pageSize": 5
-
-                EJEMPLO de formato de salida:
-
-                {{
-                  "descripcion": "beca doctorado estudiante",
-                  "numeroConvocatoria": 812345,
-                  "regiones": [27],
-                  "finalidad": 8,
-                  "instrumentos": 1,
-                  "tiposBeneficiario": [1, 3]
-                  "descripcionTipoBusqueda": 2,
-                  "order": "fechaRecepcion",
-                  "direccion": "desc",
-                  "vpd": "GE",
-                  "page": 0,
-                  "pageSize": 25
-                }}
-
-
-                '''
+    mapas = "\n\n".join(
+        f"{comentario}\n{nombre} = {_formatear_mapa(mapa)}"
+        for parametro, comentario, nombre, mapa in SECCIONES_PROMPT if parametro in parametros
+    )
+    lista = ", ".join(parametros)
+    reglas_extra = ""
+    if "finalidad" in parametros:
+        reglas_extra += """
+2.1. Para clasificar la finalidad, identifica primero el SECTOR o ACTIVIDAD PRINCIPAL. Si la consulta menciona una empresa, producto o servicio concreto (ej. librería, granja, clínica, editorial), busca en qué sector de la economía encaja (Cultura, Agricultura, Sanidad, Industria, etc.) antes de considerar el tamaño o el tipo de beneficiario."""
+    if "instrumentos" in parametros:
+        reglas_extra += """
+2.2. Para clasificar instrumentos, prioriza las palabras clave y expresiones exactas de la consulta. Si se mencionan términos como “subvención”, “ayuda directa”, “aportación no reembolsable” asignar a SUBVENCIÓN. Si se mencionan “préstamo”, “crédito”, “leasing”, “renting”, “financiación de activos” asignar a PRÉSTAMO. Si se mencionan “garantía”, “aval”, “fianza” asignar a GARANTÍA. Si se mencionan deducciones, bonificaciones o exenciones fiscales asignar a VENTAJA FISCAL. Si se habla de capital riesgo, inversión o venture capital asignar a APORTACIÓN DE FINANCIACIÓN DE RIESGO. Si no se identifica ninguna palabra clave de las categorías anteriores, asignar OTROS INSTRUMENTOS DE AYUDA. No asumir que “financiación” significa automáticamente subvención; deducir según contexto y sector."""
+    finalidad_obligatoria = " finalidad siempre debe tener un valor, no puede ser NULL." if "finalidad" in parametros else ""
+    otros = [p for p in PARAMETROS_LLM if p not in parametros]
+    regla_otros = f" No incluyas los parámetros {', '.join(otros)}." if otros else ""
+    ejemplo = {k: v for k, v in EJEMPLO_SALIDA.items() if k in parametros or k in ("descripcion", "numeroConvocatoria")}
+    ejemplo.update(PARAMETROS_FIJOS)
+    fijos = "\n".join(f'    - "{k}": {json.dumps(v)}' for k, v in PARAMETROS_FIJOS.items())
+
+    return f"""Eres un asistente experto en la clasificación de subvenciones. Tu tarea es analizar una consulta de un usuario y extraer parámetros clave para refinar una búsqueda de subvenciones.
+A continuación, se te proporcionan varios diccionarios de mapeo. Cada diccionario contiene descripciones y palabras clave asociadas a un ID numérico o un código.
+Debes leer la QUERY del usuario, identificar qué clasificaciones son relevantes para cada PARAMETRO y devolver el ID o código correspondiente.
+##
+
+{mapas}
+
+## INSTRUCCIONES PARA LA SALIDA:
+
+1.  Analiza la consulta de usuario.
+2.  Para cada PARAMETRO ({lista}), determina la mejor coincidencia. IMPORTANTE: tiposBeneficiario y regiones pueden tener dos opciones como máximo. Las que mejor clasifiquen la query.{reglas_extra}
+3.  Si una consulta sugiere múltiples opciones para un parámetro (por ejemplo, "Castilla y León y Madrid"), incluye todos los IDs relevantes en una lista. Igual para tipos_beneficiario. maximo dos.
+4.  Si un parámetro ({lista}) no se menciona en la consulta y no se puede inferir, no lo agregues al diccionario de salida.{finalidad_obligatoria}{regla_otros}
+5.  También necesito que extraigas una cadena con maximo 10 palabras clave de la query, ignorando stopwords. Usa la clave "descripcion".
+6.  Si el QUERY contiene un entero de 6 digitos empezando con el numero 8, lo mas probable es que se trate del numero de convocatoria. así que colócalo como el parámetro "numeroConvocatoria". Al mismo tiempo deja los demas parametros({lista}) en None.
+7.  El formato de salida debe ser un único objeto JSON. NO AGREGUES MÁS INFORMACIÓN. SOLO EL DICCIONARIO.
+8.  Hay algunos parámetros que son fijos y no cambian, pero quiero que los incluyas siempre:
+{fijos}
+
+EJEMPLO de formato de salida:
+
+{json.dumps(ejemplo, ensure_ascii=False, indent=2)}
+"""
+
 
+def parser_llm(query: str, parametros: List[str] = PARAMETROS_LLM) -> Optional[Dict[str, Any]]:
+    """
+    Llamada directa al LLM (sin cachés ni atajos locales) para extraer los
+    filtros de `parametros` de la consulta. Devuelve None si la llamada falla.
+    """
+    content = None
     try:
         response = client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": construir_system_prompt(parametros)},
                 {"role": "user", "content": f"QUERY: {query}"}
             ],
             temperature=0.0
@@ -214,40 +256,120 @@ def parser_openai(query: str) -> Optional[Dict[str, Any]]:
         print(f"Ocurrió un error inesperado: {e}")
         return None
 
+
+def parser_openai(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Analiza una consulta de lenguaje natural para subvenciones usando la API de OpenAI.
+
+    Antes de llamar al LLM se prueban, en orden: el gazetteer de regiones
+    (consultas triviales), la caché de filtros y el clasificador por embeddings.
+    El LLM solo recibe los mapas de las categorías que quedan dudosas.
+
+    Args:
+        query (str): La consulta de búsqueda del usuario en lenguaje natural.
+
+    Returns:
+        Optional[Dict[str, Any]]: Un diccionario con los parámetros de búsqueda extraídos,
+                                  o None si la llamada a la API falla.
+    """
+    # Regiones resueltas localmente; si no hay nada más en la consulta, no hace falta el LLM
+    regiones = extraer_regiones(query)
+    rapido = filtros_sin_llm(query, regiones)
+    if rapido is not None:
+        return rapido
+
+    # Consultas repetidas o parafraseadas no vuelven a pasar por el LLM.
+    # Las regiones locales forman parte de la guardia: "... madrid" no acierta con "... sevilla".
+    filtros_cacheados = LLM_CACHE.obtener(query, guardia=regiones)
+    if filtros_cacheados is not None:
+        return filtros_cacheados
+
+    # Clasificador por embeddings (no aplica si la consulta trae un número de convocatoria)
+    clasificacion = None
+    normalizada = normalizar_texto(query)
+    if not PATRON_NUMERO_CONVOCATORIA.search(normalizada):
+        try:
+            clasificacion = CLASIFICADOR_MAPAS.clasificar(normalizada)
+        except Exception as e:
+            print(f"Clasificador por embeddings no disponible: {e}")
+
+    if clasificacion is not None and not clasificacion["dudosas"]:
+        filtros = {"descripcion": palabras_clave(query), **clasificacion["valores"], **PARAMETROS_FIJOS}
+        if regiones:
+            filtros["regiones"] = regiones
+    else:
+        parametros = PARAMETROS_LLM if clasificacion is None else ["regiones"] + clasificacion["dudosas"]
+        filtros = parser_llm(query, parametros)
+        if filtros is None:
+            return None
+        if clasificacion is not None:
+            filtros.update(clasificacion["valores"])
+        filtros = combinar_regiones(filtros, regiones)
+
+    filtros = {k: v for k, v in filtros.items() if v is not None}
+    LLM_CACHE.guardar(query, filtros, guardia=regiones)
+    return filtros
+
 '''Aqui hay algunas funciones auxiliares basadas en el trabajo de Carmen para comunicarnos con el sitio web de subvenciones.
 
 '''
 
-def buscar_convocatorias(**params): #esta funcion toma el diccionario de palabras obtenido de la función "parsear_busqueda_subvenciones" y hace un request con la API al sitio de subvenciones.
+# ======== CLIENTE HTTP COMPARTIDO PARA LA BDNS ========
+MAX_PAGINAS = 3
+
+
+def get_bdns(url, params=None, headers=None):
+    """
+    GET síncrono a la BDNS por el cliente compartido (`cliente_http.CLIENTE_BDNS`):
+    pool keep-alive, limitador por host, timeouts, reintentos y singleflight.
+    """
+    return CLIENTE_BDNS.get_sync(url, params=params, headers=headers)
+
+
+def buscar_convocatorias(max_paginas=MAX_PAGINAS, **params): #esta funcion toma el diccionario de palabras obtenido de la función "parsear_busqueda_subvenciones" y hace un request con la API al sitio de subvenciones.
 #se obtiene un DF con las convocatorias que satisfacen los argumentos del diccionario.
+#La primera página se pide sola (indica si hay más) y el resto en paralelo; el ritmo lo marca el limitador del host.
     base_url = "https://www.pap.hacienda.gob.es/bdnstrans/api/convocatorias/busqueda"
-    headers = {"Accept": "application/json"}
     page_size = params.get("pageSize", 5)
-    max_paginas = 3
-    resultados = []
     params.setdefault("vpd", "GE")
     params.setdefault("pageSize", page_size)
-    for pagina in range(0, max_paginas):
-        params["page"] = pagina
+
+    def _pagina(pagina):
         try:
-            response = requests.get(base_url, params=params, headers=headers)
+            response = get_bdns(base_url, params={**params, "page": pagina})
             response.raise_for_status()
             if "application/json" in response.headers.get("Content-Type", ""):
                 data = response.json()
-                convocatorias = data.get("convocatorias", data.get("content", []))
+                return data.get("convocatorias", data.get("content", [])), data
+        except Exception as e:
+            print(f"Error pidiendo la página {pagina} de la búsqueda: {e}")
+        return [], {}
+
+    primera, data = _pagina(0)
+    if not primera:
+        return pd.DataFrame()
+    resultados = list(primera)
+
+    total_paginas = data.get("totalPages")
+    restantes = max_paginas if total_paginas is None else min(max_paginas, int(total_paginas))
+    restantes = 0 if len(primera) < int(page_size) else restantes - 1
+    if restantes > 0:
+        with ThreadPoolExecutor(max_workers=restantes) as pool:
+            # map conserva el orden: se corta en la primera página vacía, como antes
+            for convocatorias, _ in pool.map(_pagina, range(1, restantes + 1)):
                 if not convocatorias:
                     break
                 resultados.extend(convocatorias)
-                time.sleep(0.5)
-        except Exception as e:
-            break
     return pd.DataFrame(resultados)
 
-def obtener_convocatoria_por_id(num_conv): #esta funcion toma un numero especifico de convocatoria y realiza un request a la API, la cual devuelve un diccionario con información específica de la convocatoria.
+def obtener_convocatoria_por_id(num_conv): #esta funcion toma un numero especifico de convocatoria y devuelve un diccionario con información específica de la convocatoria.
+    # Pasa por la caché persistente; solo se llama a la API en fallo o revalidación
+    return CACHE_CONVOCATORIAS.obtener(num_conv, _descargar_convocatoria_por_id)
+
+def _descargar_convocatoria_por_id(num_conv): #realiza el request a la API de la BDNS sin pasar por la caché.
     base_url = "https://www.infosubvenciones.es/bdnstrans/api/convocatorias"
     params = {"vpd": "GE", "numConv": str(num_conv)}
-    headers = {"Accept": "application/json"}
-    r = requests.get(base_url, params=params, headers=headers)
+    r = get_bdns(base_url, params=params)
     if r.status_code == 200 and "application/json" in r.headers.get("Content-Type", ""):
         return r.json()
     else:
@@ -291,43 +413,60 @@ def obtener_ids_y_nombres(numconv):
 
 
 
-BASE_DOC_URL = "https://www.infosubvenciones.es/bdnstrans/api/convocatorias/documentos?idDocumento={}"
+BASE_DOC_URL = URL_DOCUMENTO
+MAX_DESCARGAS_PARALELAS = int(os.getenv("BDNS_MAX_DESCARGAS", "4"))
+
+def _descargar_documento(d):
+    t0 = time.perf_counter()
+    try:
+        info = ALMACEN_DOCUMENTOS.obtener(d["id"], nombre=d["name"])
+    except Exception as e:
+        print(f"❌ Error descargando {d['name']}: {e}")
+        info = None
+    return info, time.perf_counter() - t0
 
-def descargar_documentos_a_disco(numconv, dest_dir="data/documentos_convocatoria"):
+def descargar_documentos_a_disco(numconv, max_workers=MAX_DESCARGAS_PARALELAS):
     """
-    Descarga todos los PDFs a dest_dir y devuelve una lista con metadatos útiles.
+    Asegura que todos los documentos de la convocatoria están en el almacén
+    local y devuelve una lista con metadatos útiles, en el orden de la BDNS.
+    Los que faltan se descargan en paralelo (como mucho `max_workers`), en
+    `.part` reanudables que solo se publican completos (ver `almacen_documentos`).
+    Cada entrada indica cuánto tardó y cuántos bytes se descargaron (0 si ya estaba).
     """
-    os.makedirs(dest_dir, exist_ok=True)
-
     docs = obtener_ids_y_nombres(numconv)
     resultados = []
+    t0 = time.perf_counter()
 
-    with requests.Session() as s:
-        s.headers.update({"User-Agent": "Mozilla/5.0"})
-        for d in docs:
-            url = BASE_DOC_URL.format(d["id"])
-            r = s.get(url, stream=True, timeout=30)
-            if not r.ok:
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(docs) or 1))) as ex:
+        for d, (info, segundos) in zip(docs, ex.map(_descargar_documento, docs)):
+            if info is None:
                 continue
-            path = os.path.join(dest_dir, d["name"])
-            with open(path, "wb") as f:
-                for chunk in r.iter_content(65536):
-                    if chunk:
-                        f.write(chunk)
             resultados.append({
                 "id": d["id"],
                 "name": d["name"],
-                "path": path,                    # interno (no lo expongas al front)
-                "size": os.path.getsize(path)
+                "path": info["ruta"],            # interno (no lo expongas al front)
+                "size": info["tamano"],
+                "sha256": info["sha256"],
+                "bytes_descargados": info["bytes_descargados"],
+                "segundos": round(segundos, 3),
             })
+
+    total = time.perf_counter() - t0
+    descargados = sum(r["bytes_descargados"] for r in resultados)
+    print(f"📥 Convocatoria {numconv}: {len(resultados)}/{len(docs)} documentos, "
+          f"{descargados / 1e6:.1f} MB descargados en {total:.2f}s "
+          f"({descargados / 1e6 / total if total else 0:.1f} MB/s)")
     return resultados
 
 
 
 
 
-def extraer_datos_convocatoria(numero, client):
-    dic = obtener_convocatoria_por_id(numero)  # tu función que devuelve el dict
+def extraer_datos_convocatoria(numero, client, dic=None):
+    # Si el llamador ya descargó el detalle (ver enriquecer_convocatorias) lo reutilizamos
+    if dic is None:
+        dic = obtener_convocatoria_por_id(numero)  # tu función que devuelve el dict
+    dic = dic or {}
     presupuesto = dic.get('presupuestoTotal')
 
     if isinstance(presupuesto, (int, float)):
@@ -350,114 +489,188 @@ def extraer_datos_convocatoria(numero, client):
 
 
 
-def data_frame_resumen(query):
-    try:
-        filtros = parser_openai(query)
-        # Limpia campos con valor None
-        filtros2 = {k: v for k, v in filtros.items() if v is not None}
-        print(filtros2)
-        df = buscar_convocatorias(**filtros2)
+# ======== ENRIQUECIMIENTO CONCURRENTE ========
+COLUMNAS_ENRIQUECIDAS = ['presupuesto_total', 'inicio', 'final', 'bases', 'estado']
+MAX_WORKERS_ENRIQUECIMIENTO = int(os.getenv("MAX_WORKERS_ENRIQUECIMIENTO", "8"))
 
-        if df.empty:
-            print("No se encontraron convocatorias.")
-            return pd.DataFrame()
 
-        df.drop(columns=['mrr', 'descripcionLeng', 'nivel3', 'codigoInvente', 'id'], inplace=True)
+def _enriquecer_convocatoria(numero, client):
+    """
+    Descarga UNA sola vez el detalle de la convocatoria y calcula a partir de él
+    presupuesto, fechas y bases. El estado se resuelve aquí si lo decide la caché
+    o el motor de reglas; si no, es None y queda para la clasificación por lotes
+    con el LLM. Devuelve (fila, detalle, estado); el estado va aparte porque en
+    una Series de pandas un None se convertiría en NaN.
+    """
+    try:
+        dic = obtener_convocatoria_por_id(numero)
+        datos = extraer_datos_convocatoria(numero, client, dic=dic)
+        if not dic:
+            return datos, dic, "desconocido"
+        return datos, dic, estado_sin_llm(numero, dic)
+    except Exception as e:
+        # Una fila que falla no debe tirar la búsqueda completa
+        print(f"Error enriqueciendo la convocatoria {numero}: {e}")
+        return pd.Series([None, None, None, None], index=COLUMNAS_ENRIQUECIDAS[:-1]), None, "desconocido"
 
-        df['fechaRecepcion'] = pd.to_datetime(df['fechaRecepcion'], errors='coerce')
-        fecha_limite = pd.Timestamp.now() - pd.DateOffset(years=1)
-        df = df[df['fechaRecepcion'] >= fecha_limite]
 
-        if 'numeroConvocatoria' not in df.columns or df['numeroConvocatoria'].isnull().all():
-            print("No hay datos válidos de número de convocatoria.")
-            return pd.DataFrame()
+def iterar_enriquecimiento(numeros, client, max_workers=MAX_WORKERS_ENRIQUECIMIENTO):
+    """
+    Generador del enriquecimiento fila a fila: produce (numeroConvocatoria, campos)
+    a medida que termina cada convocatoria, con `estado` None si el motor de
+    reglas no lo decide. Al final se clasifican por lotes con el LLM las
+    pendientes y se produce (numeroConvocatoria, {"estado": ...}) para cada una.
+    """
+    unicos = list(dict.fromkeys(numeros))
+    if not unicos:
+        return
+    pendientes = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unicos)))) as pool:
+        futuros = {pool.submit(_enriquecer_convocatoria, n, client): n for n in unicos}
+        for futuro in as_completed(futuros):
+            numero = futuros[futuro]
+            fila, dic, estado = futuro.result()
+            campos = dict(zip(COLUMNAS_ENRIQUECIDAS[:-1], fila.reindex(COLUMNAS_ENRIQUECIDAS[:-1]).tolist()))
+            campos["estado"] = estado
+            if estado is None:
+                pendientes[numero] = dic
+            yield numero, campos
+
+    clasificados = {}
+    try:
+        clasificados = clasificar_estados_lote(pendientes, client)
+    except Exception as e:
+        print(f"Error clasificando {len(pendientes)} convocatorias por lotes: {e}")
+    for numero, dic in pendientes.items():
+        estado = clasificados.get(numero) or "desconocido"
+        _guardar_estado(numero, dic, estado, regla="llm")
+        yield numero, {"estado": estado}
 
-        df[['presupuesto_total', 'inicio', 'final','bases']] = df['numeroConvocatoria'].apply(
-            lambda x: pd.Series(extraer_datos_convocatoria(x,client))
-        )
-        df['estado'] = df['numeroConvocatoria'].apply(obtener_edo_LLM, args=(client,))
 
-         # Sort the DataFrame as requested
-        df = df.sort_values(by=['estado','fechaRecepcion'], ascending=[True, False])
+def enriquecer_convocatorias(numeros, client, max_workers=MAX_WORKERS_ENRIQUECIMIENTO):
+    """
+    Enriquece una serie de números de convocatoria con concurrencia acotada.
 
+    Cada número distinto se procesa una única vez (un GET de detalle compartido
+    por extraer_datos_convocatoria y el cálculo del estado) y las filas se
+    reparten entre `max_workers` hilos. Las convocatorias cuyo estado no decide
+    el motor de reglas se clasifican juntas con `clasificar_estados_lote`.
+    Devuelve un DataFrame con COLUMNAS_ENRIQUECIDAS alineado con el índice de `numeros`.
+    """
+    numeros = pd.Series(numeros)
+    campos = {}
+    for numero, nuevos in iterar_enriquecimiento(numeros.tolist(), client, max_workers):
+        campos.setdefault(numero, {}).update(nuevos)
+    return pd.DataFrame(
+        [[campos[n].get(c) for c in COLUMNAS_ENRIQUECIDAS] for n in numeros],
+        index=numeros.index,
+        columns=COLUMNAS_ENRIQUECIDAS,
+    )
 
-        return df
 
+def buscar_en_espejo(filtros, max_paginas=MAX_PAGINAS):
+    """Misma salida que `buscar_convocatorias` pero desde el espejo local; None si no cubre los filtros."""
+    inicio = time.perf_counter()
+    try:
+        filas = ESPEJO_BDNS.consultar(filtros, limite=int(filtros.get("pageSize", 5)) * max_paginas)
     except Exception as e:
-        print(f"Ocurrió un error procesando los datos: {e}")
-        return pd.DataFrame()
-
-
+        print(f"Error consultando el espejo BDNS: {e}")
+        return None
+    if filas is None:
+        return None
+    print(f"Espejo BDNS: {len(filas)} convocatorias en {1000 * (time.perf_counter() - inicio):.1f} ms")
+    return pd.DataFrame(filas)
 
 
-def obtener_edo_LLM(convocatoria_id, client):
+def buscar_resumen(query, max_paginas=None, page_size=None):
     """
-    Determina si la convocatoria está abierta, cerrada o desconocida usando LLM.
+    Fase de búsqueda de `data_frame_resumen`: filtros -> espejo o API en vivo,
+    sin columnas internas y limitada al último año. DataFrame vacío si no hay datos.
     """
-    dic = obtener_convocatoria_por_id(convocatoria_id)
-    tipo= dic.get('tipoConvocatoria', '').lower()
-    today = datetime.now().date()
-    fecha_recepcion = dic.get("fechaRecepcion")
-    fecha_inicio = dic.get("fechaInicioSolicitud")
-    fecha_fin = dic.get("fechaFinSolicitud")
+    filtros = parser_openai(query)
+    # Limpia campos con valor None
+    filtros2 = {k: v for k, v in filtros.items() if v is not None}
+    if page_size:
+        filtros2["pageSize"] = page_size
+    print(filtros2)
+    max_paginas = max_paginas or MAX_PAGINAS
+    df = buscar_en_espejo(filtros2, max_paginas) if USAR_ESPEJO else None
+    if df is None or df.empty:
+        # Sin cobertura en el espejo (o sin resultados): búsqueda en vivo
+        df = buscar_convocatorias(max_paginas=max_paginas, **filtros2)
+
+    if df.empty:
+        print("No se encontraron convocatorias.")
+        return pd.DataFrame()
 
-    if 'concesión directa' in tipo or 'nominativa' in tipo:
-       return 'cerrada-no-publica'
+    df.drop(columns=['mrr', 'descripcionLeng', 'nivel3', 'codigoInvente', 'id'], inplace=True, errors='ignore')
 
-    # Si ya tenemos fecha de fin estructurada, podemos devolver rápido sin LLM
-    if fecha_fin:
-        try:
-            fecha_fin_dt = datetime.strptime(fecha_fin, "%Y-%m-%d").date()
-            if today > fecha_fin_dt:
-                return "cerrada"
-            else:
-                return "abierta"
-        except:
-            pass
-
-      # Prepara textos relevantes con contexto
-    textos = []
+    df['fechaRecepcion'] = pd.to_datetime(df['fechaRecepcion'], errors='coerce')
+    fecha_limite = pd.Timestamp.now() - pd.DateOffset(years=1)
+    df = df[df['fechaRecepcion'] >= fecha_limite].copy()
 
-    # textFin
-    if dic.get("textFin"):
-        textos.append({
-            "origen": "textFin",
-            "texto": dic["textFin"],
+    if 'numeroConvocatoria' not in df.columns or df['numeroConvocatoria'].isnull().all():
+        print("No hay datos válidos de número de convocatoria.")
+        return pd.DataFrame()
+    return df
 
-        })
 
-    # anuncios
-    for a in dic.get("anuncios", []):
+def ordenar_resumen(df):
+    # Sort the DataFrame as requested
+    return df.sort_values(by=['estado', 'fechaRecepcion'], ascending=[True, False])
 
 
-        if a.get("titulo"):
-            textos.append({
-                "origen": "ANUNCIO",
-                "texto": a["texto"],
-            })
+def data_frame_resumen(query, max_paginas=None, page_size=None):
+    try:
+        df = buscar_resumen(query, max_paginas, page_size)
+        if df.empty:
+            return df
 
-    # documentos
-    for d in dic.get("documentos", []):
-        if d.get("descripcion"):
-            textos.append({
-                "origen": "DOCUMENTO",
-                "texto": d["descripcion"],
+        # Un único GET de detalle por convocatoria, compartido por presupuesto/fechas y estado
+        enriquecido = enriquecer_convocatorias(df['numeroConvocatoria'], client)
+        df[COLUMNAS_ENRIQUECIDAS] = enriquecido[COLUMNAS_ENRIQUECIDAS].to_numpy()
 
-            })
+        return ordenar_resumen(df)
 
+    except Exception as e:
+        print(f"Ocurrió un error procesando los datos: {e}")
+        return pd.DataFrame()
 
 
+def eventos_resumen(query, max_paginas=None, page_size=None):
+    """
+    Versión incremental de `data_frame_resumen` para respuestas en streaming.
+    Produce, en orden:
+    - {"tipo": "resultados", "resultados": [...]}: resultados de la búsqueda sin enriquecer;
+    - {"tipo": "fila", "numeroConvocatoria": ..., <campos>}: por cada convocatoria
+      que termina (presupuesto, fechas, bases, estado; `estado` None si falta el LLM)
+      y una más con solo el `estado` para las que clasifica el LLM;
+    - {"tipo": "orden", "orden": [numeroConvocatoria, ...]}: orden final.
+    Los errores se emiten como {"tipo": "error", "error": ...}.
+    """
+    try:
+        df = buscar_resumen(query, max_paginas, page_size)
+        yield {"tipo": "resultados", "resultados": df.to_dict(orient="records")}
+        if df.empty:
+            return
 
+        campos = {}
+        for numero, nuevos in iterar_enriquecimiento(df['numeroConvocatoria'].tolist(), client):
+            campos.setdefault(numero, {}).update(nuevos)
+            yield {"tipo": "fila", "numeroConvocatoria": numero, **nuevos}
 
-    system_msg = """
-    ## Tarea de análisis de convocatorias
+        for columna in COLUMNAS_ENRIQUECIDAS:
+            df[columna] = [campos.get(n, {}).get(columna) for n in df['numeroConvocatoria']]
+        yield {"tipo": "orden", "orden": ordenar_resumen(df)['numeroConvocatoria'].tolist()}
+    except Exception as e:
+        print(f"Ocurrió un error procesando los datos: {e}")
+        yield {"tipo": "error", "error": str(e)}
 
-    Eres un asistente especializado en determinar el estado de convocatorias de subvenciones.
-    Tu única respuesta debe ser un objeto JSON válido con el estado.
 
-    **Formato de salida:**
-    {"estado": "abierta" | "cerrada" | "desconocido"}
 
+
+# ======== ESTADO DE LA CONVOCATORIA ========
+REGLAS_ESTADO = """
     **Instrucciones de análisis (en estricto orden de prioridad):**
 
     1.  **Cierre explícito en `textFin`**:
@@ -481,38 +694,249 @@ def obtener_edo_LLM(convocatoria_id, client):
 
     5.  **Estado por defecto**:
         Si ninguna de las reglas anteriores permite determinar el estado con certeza -> `"desconocido"`.
+"""
+
+ESTADO_SYSTEM_MSG = """
+    ## Tarea de análisis de convocatorias
 
+    Eres un asistente especializado en determinar el estado de convocatorias de subvenciones.
+    Tu única respuesta debe ser un objeto JSON válido con el estado.
+
+    **Formato de salida:**
+    {"estado": "abierta" | "cerrada" | "desconocido"}
+""" + REGLAS_ESTADO + """
     **Restricciones**:
     - No expliques tu razonamiento.
     - No incluyas campos adicionales en el JSON.
     """
 
+ESTADO_LOTE_SYSTEM_MSG = """
+    ## Tarea de análisis de convocatorias (lote)
+
+    Eres un asistente especializado en determinar el estado de convocatorias de subvenciones.
+    Recibirás una lista de convocatorias, cada una con su `numeroConvocatoria`, su fecha de recepción y sus textos relevantes.
+    Aplica a CADA convocatoria, de forma independiente, las instrucciones siguientes.
+
+    **Formato de salida:** un único array JSON con un elemento por convocatoria recibida:
+    [{"numeroConvocatoria": "...", "estado": "abierta" | "cerrada" | "desconocido"}, ...]
+""" + REGLAS_ESTADO + """
+    **Restricciones**:
+    - No expliques tu razonamiento.
+    - No incluyas campos adicionales en el JSON.
+    - Devuelve exactamente una entrada por cada `numeroConvocatoria` recibido.
+    """
+
+MAX_TOKENS_LOTE_ESTADOS = int(os.getenv("MAX_TOKENS_LOTE_ESTADOS", "6000"))
+MAX_CONVOCATORIAS_LOTE_ESTADOS = int(os.getenv("MAX_CONVOCATORIAS_LOTE_ESTADOS", "20"))
+ESTADOS_VALIDOS = {"abierta", "cerrada", "desconocido"}
+_codificador_tokens = None
+
+
+def _contar_tokens(texto):
+    """Tokens de `texto` con tiktoken; si no está disponible, aproximación de 4 caracteres por token."""
+    global _codificador_tokens
+    try:
+        if _codificador_tokens is None:
+            import tiktoken
+            _codificador_tokens = tiktoken.encoding_for_model("gpt-4o-mini")
+        return len(_codificador_tokens.encode(texto))
+    except Exception:
+        return len(texto) // 4 + 1
+
+
+def _textos_relevantes(dic):
+    # Prepara textos relevantes con contexto
+    textos = []
 
+    # textFin
+    if dic.get("textFin"):
+        textos.append({
+            "origen": "textFin",
+            "texto": dic["textFin"],
+        })
+
+    # anuncios
+    for a in dic.get("anuncios") or []:
+        if a.get("titulo"):
+            textos.append({
+                "origen": "ANUNCIO",
+                "texto": a.get("texto") or a["titulo"],
+            })
+
+    # documentos
+    for d in dic.get("documentos") or []:
+        if d.get("descripcion"):
+            textos.append({
+                "origen": "DOCUMENTO",
+                "texto": d["descripcion"],
+            })
+    return textos
+
+
+def _limpiar_json(content):
+    content = content.strip()
+    # Limpia por si viene con ```json
+    if content.startswith("```"):
+        content = re.sub(r"^```(?:json)?\s*|\s*```$", "", content)
+    return content
+
+
+def estado_por_llm(convocatoria_id, dic, client):
+    """Una llamada al LLM para una sola convocatoria (reglas del prompt ESTADO_SYSTEM_MSG)."""
+    today = datetime.now().date()
     user_msg = f"""
     Hoy: {today}
-    Fecha de recepción: {fecha_recepcion}
+    Fecha de recepción: {dic.get("fechaRecepcion")}
     Textos relevantes:
-    {textos}
+    {_textos_relevantes(dic)}
     """
 
     resp = client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[
-            {"role": "system", "content": system_msg},
+            {"role": "system", "content": ESTADO_SYSTEM_MSG},
             {"role": "user", "content": user_msg}
         ],
         temperature=0.0,
     )
 
-    content = resp.choices[0].message.content.strip()
-
-    # Limpia por si viene con ```json
-    if content.startswith("```"):
-        content = re.sub(r"^```(?:json)?\s*|\s*```$", "", content)
-
     try:
-        data = json.loads(content)
+        data = json.loads(_limpiar_json(resp.choices[0].message.content))
         return data.get("estado", "desconocido")
     except:
         return "desconocido"
 
+
+def obtener_edo_LLM(convocatoria_id, client, dic=None):
+    """
+    Determina si la convocatoria está abierta, cerrada o desconocida. Primero se
+    aplica el motor de reglas de `plazos.decidir_estado` y solo si no decide se usa el LLM.
+    Si se pasa `dic` (detalle ya descargado) no se vuelve a consultar la API.
+    El resultado se guarda en CACHE_ESTADOS.
+    """
+    if dic is None:
+        dic = obtener_convocatoria_por_id(convocatoria_id)
+    if not dic:
+        return "desconocido"
+
+    estado = estado_sin_llm(convocatoria_id, dic)
+    if estado is not None:
+        return estado
+
+    estado = estado_por_llm(convocatoria_id, dic, client)
+    _guardar_estado(convocatoria_id, dic, estado, regla="llm")
+    return estado
+
+
+def _guardar_estado(convocatoria_id, dic, estado, regla, fecha_cierre=None):
+    # Un fallo de la caché (p.ej. SQLite bloqueado) no debe perder el estado ya calculado
+    try:
+        CACHE_ESTADOS.guardar(convocatoria_id, dic, estado, regla, fecha_cierre)
+    except Exception as e:
+        print(f"Error guardando el estado de {convocatoria_id}: {e}")
+
+
+def estado_sin_llm(convocatoria_id, dic):
+    """
+    Estado desde la caché de estados o, si no hay entrada válida, desde el motor
+    de reglas (que se guarda con su fecha de cierre). None si hace falta el LLM.
+    """
+    hoy = datetime.now().date()
+    estado = CACHE_ESTADOS.obtener(convocatoria_id, dic, hoy)
+    if estado is not None:
+        return estado
+
+    # Reglas deterministas (fechas, plazos relativos, frases de cierre...): el LLM solo si no deciden
+    decision = decidir_estado(dic, hoy)
+    if decision["estado"] is not None:
+        print(f"Estado de {convocatoria_id}: {decision['estado']} (regla: {decision['regla']})")
+        _guardar_estado(convocatoria_id, dic, decision["estado"], decision["regla"], decision["fecha_cierre"])
+    return decision["estado"]
+
+
+def _lotes_por_tokens(items, max_tokens, max_items):
+    """Agrupa [(id, payload, tokens)] en lotes que no superan `max_tokens` ni `max_items`."""
+    lotes, actual, tokens_actual = [], [], 0
+    for item in items:
+        if actual and (tokens_actual + item[2] > max_tokens or len(actual) >= max_items):
+            lotes.append(actual)
+            actual, tokens_actual = [], 0
+        actual.append(item)
+        tokens_actual += item[2]
+    if actual:
+        lotes.append(actual)
+    return lotes
+
+
+def _estados_de_un_lote(lote, client, today):
+    payload = [p for _, p, _ in lote]
+    resp = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": ESTADO_LOTE_SYSTEM_MSG},
+            {"role": "user", "content": f"Hoy: {today}\nConvocatorias:\n{json.dumps(payload, ensure_ascii=False, default=str)}"}
+        ],
+        temperature=0.0,
+    )
+    data = json.loads(_limpiar_json(resp.choices[0].message.content))
+    if isinstance(data, dict):
+        # Por si el modelo envuelve el array en un objeto
+        data = next((v for v in data.values() if isinstance(v, list)), [])
+    estados = {}
+    for elemento in data:
+        if isinstance(elemento, dict) and elemento.get("estado") in ESTADOS_VALIDOS:
+            estados[str(elemento.get("numeroConvocatoria")).strip()] = elemento["estado"]
+    return estados
+
+
+def clasificar_estados_lote(pendientes, client, max_tokens=MAX_TOKENS_LOTE_ESTADOS,
+                            max_items=MAX_CONVOCATORIAS_LOTE_ESTADOS):
+    """
+    Clasifica con el LLM varias convocatorias a la vez.
+
+    `pendientes` es {numeroConvocatoria: detalle} de las que el motor de reglas
+    no ha decidido. Se empaquetan en uno o pocos requests (según presupuesto de
+    tokens) que devuelven un array [{numeroConvocatoria, estado}]; los ids que
+    el modelo omita se resuelven con llamadas individuales. Devuelve {id: estado}.
+    """
+    if not pendientes:
+        return {}
+    today = datetime.now().date()
+    items, estados = [], {}
+    for numero, dic in pendientes.items():
+        try:
+            payload = {
+                "numeroConvocatoria": str(numero),
+                "fechaRecepcion": dic.get("fechaRecepcion"),
+                "textos": _textos_relevantes(dic),
+            }
+            items.append((str(numero), payload, _contar_tokens(json.dumps(payload, ensure_ascii=False, default=str))))
+        except Exception as e:
+            # Un detalle mal formado no debe arrastrar al resto del lote
+            print(f"Error preparando la convocatoria {numero} para el lote: {e}")
+            estados[str(numero)] = "desconocido"
+    lotes = _lotes_por_tokens(items, max_tokens, max_items)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS_ENRIQUECIMIENTO, len(lotes)))) as pool:
+        for lote, futuro in [(l, pool.submit(_estados_de_un_lote, l, client, today)) for l in lotes]:
+            try:
+                estados.update(futuro.result())
+            except Exception as e:
+                print(f"Error clasificando un lote de {len(lote)} convocatorias: {e}")
+
+    # Fallback individual para los que el modelo no devolvió
+    faltan = [n for n in pendientes if str(n) not in estados]
+    if faltan:
+        print(f"Clasificación individual de {len(faltan)} convocatorias omitidas en el lote")
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS_ENRIQUECIMIENTO, len(faltan)))) as pool:
+            individuales = pool.map(lambda n: _estado_individual_seguro(n, pendientes[n], client), faltan)
+            estados.update({str(n): e for n, e in zip(faltan, individuales)})
+    return {n: estados.get(str(n), "desconocido") for n in pendientes}
+
+
+def _estado_individual_seguro(numero, dic, client):
+    try:
+        return estado_por_llm(numero, dic, client)
+    except Exception as e:
+        print(f"Error clasificando la convocatoria {numero}: {e}")
+        return "desconocido"
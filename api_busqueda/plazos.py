@@ -0,0 +1,297 @@
+"""
+Motor de reglas determinista para el estado (abierta/cerrada) de una convocatoria.
+
+Aplica, en el mismo orden de prioridad que el prompt de `obtener_edo_LLM`:
+
+0. Concesión directa / nominativa                       -> "cerrada-no-publica"
+0. `fechaFinSolicitud` estructurada                      -> compara con HOY
+1. Fecha de cierre explícita en `textFin` ("hasta el 15 de marzo de 2026",
+   "finaliza el 15/03/2026"); no cuentan las de apertura o publicación -> compara con HOY
+2. "plazo finalizado", "convocatoria cerrada"... en documentos/anuncios -> "cerrada"
+3. Plazo relativo ("20 días hábiles", "un mes") de presentación de solicitudes
+   en anuncios/textFin, contado desde la publicación citada en el texto ("BOE
+   de 10 de octubre de 2026"), la apertura o la fecha de recepción. En los
+   anuncios tiene que ir precedido de una pista de presentación ("plazo de
+   presentación de solicitudes..."); en textFin se sobreentiende. Los de
+   resolución, notificación, justificación... no cuentan -> compara con HOY
+4. "hasta agotar fondos/crédito" en `textFin`            -> "abierta"
+
+Los días hábiles excluyen sábados, domingos y festivos nacionales (Ley 39/2015,
+art. 30); si un plazo en días naturales o meses vence en inhábil se traslada
+al siguiente hábil. Si ninguna regla decide, `estado` es None y el llamador
+recurre al LLM. El resultado indica siempre qué regla se aplicó.
+"""
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+from normalizacion import normalizar_texto
+
+MESES = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+
+NUMEROS = {
+    "un": 1, "uno": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5, "seis": 6,
+    "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "once": 11, "doce": 12, "trece": 13,
+    "catorce": 14, "quince": 15, "dieciseis": 16, "diecisiete": 17, "dieciocho": 18,
+    "diecinueve": 19, "veinte": 20, "veintiun": 21, "veintiuno": 21, "veintidos": 22,
+    "veintitres": 23, "veinticuatro": 24, "veinticinco": 25, "veintiseis": 26,
+    "veintisiete": 27, "veintiocho": 28, "veintinueve": 29, "treinta": 30, "cuarenta": 40,
+    "cuarenta y cinco": 45, "sesenta": 60, "noventa": 90,
+}
+
+# Los patrones se aplican sobre texto normalizado (minúsculas y sin acentos)
+_NUM = r"(\d{1,3}|" + "|".join(sorted(map(re.escape, NUMEROS), key=len, reverse=True)) + r")"
+PATRON_FECHA_TEXTO = re.compile(
+    r"\b(\d{1,2})(?:º|o)?\s+de\s+(" + "|".join(MESES) + r")(?:\s+(?:de|del)\s+(\d{4}))?\b")
+PATRON_FECHA_NUMERICA = re.compile(r"\b(\d{1,2})[/.\-](\d{1,2})[/.\-](\d{4}|\d{2})\b")
+PATRON_FECHA_ISO = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+PATRON_NORMA = re.compile(r"(ley|decreto|orden|resolucion|reglamento)\b[^.;]{0,25}$")
+PATRON_PLAZO_DIAS = re.compile(r"\b" + _NUM + r"\s*(?:\(\d+\)\s*)?dias?\b\s*(habiles|naturales)?")
+PATRON_PLAZO_MESES = re.compile(r"\b" + _NUM + r"\s*(?:\(\d+\)\s*)?mes(?:es)?\b")
+# Contexto de una fecha: la última pista antes de ella decide si es de cierre o de apertura/publicación
+PISTA_CIERRE = r"hasta|finaliza\w*|fin del? plazo|plazo|termina\w*|concluye|concluira|vence|vencimiento|cierre|cierra|ultimo dia|limite"
+PISTA_INICIO = r"desde|a partir|comienza\w*|inicio|apertura|abre"
+PISTA_PUBLICACION = r"publicacion|publicad[oa]|boe|bop|boja|bocm|bocyl|bopa|borm|boib|boc|boa|bon|bor|doe|docv|dogc|dogv|dog|diario oficial|boletin oficial"
+PATRON_PISTA = re.compile(r"\b(?:(?P<cierre>%s)|(?P<inicio>%s)|(?P<publicacion>%s))\b"
+                          % (PISTA_CIERRE, PISTA_INICIO, PISTA_PUBLICACION))
+PATRON_AL = re.compile(r"\bal\s+(?:dia\s+)?$")  # "del 1 al 31 de marzo"
+# Contexto de un plazo relativo: de presentación de solicitudes o de otro trámite ("se resolverá en 30 días")
+PATRON_PISTA_PRESENTACION = re.compile(r"\b(?:presenta\w*|solicitud\w*|solicitar\w*|inscripcion\w*|inscribir\w*)\b")
+PATRON_PISTA_OTRO_TRAMITE = re.compile(
+    r"\b(?:resol\w*|resuelv\w*|notific\w*|justific\w*|subsan\w*|alegacion\w*|recurso\w*|ejecu\w*|pago\w*|"
+    r"abon\w*|reintegr\w*|silencio|vigencia|duracion)\b")
+PATRON_FIN_FRASE = re.compile(r";|\.(?!\d)")
+FRASES_CIERRE = (
+    "plazo finalizado", "convocatoria cerrada", "resolucion de cierre", "plazo concluido",
+    "plazo cerrado", "finalizado el plazo", "concluido el plazo",
+)
+PATRON_AGOTAR_FONDOS = re.compile(
+    r"hasta (?:el )?(?:agotar|agotamiento)(?: de| del)?(?: los| el| la)? (?:fondos|credito|presupuesto|disponibilidad)")
+
+
+# ---------- calendario ----------
+def _domingo_de_pascua(anio):
+    # Algoritmo anónimo gregoriano (Meeus/Jones/Butcher)
+    a, b, c = anio % 19, anio // 100, anio % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes = (h + l - 7 * m + 114) // 31
+    dia = (h + l - 7 * m + 114) % 31 + 1
+    return date(anio, mes, dia)
+
+
+@lru_cache(maxsize=64)
+def festivos_nacionales(anio):
+    """Festivos nacionales comunes a todo el territorio (sin los autonómicos ni locales)."""
+    fijos = [(1, 1), (1, 6), (5, 1), (8, 15), (10, 12), (11, 1), (12, 6), (12, 8), (12, 25)]
+    festivos = {date(anio, m, d) for m, d in fijos}
+    festivos.add(_domingo_de_pascua(anio) - timedelta(days=2))  # Viernes Santo
+    return frozenset(festivos)
+
+
+def es_habil(fecha):
+    return fecha.weekday() < 5 and fecha not in festivos_nacionales(fecha.year)
+
+
+def siguiente_habil(fecha):
+    while not es_habil(fecha):
+        fecha += timedelta(days=1)
+    return fecha
+
+
+def sumar_dias_habiles(inicio, dias):
+    """Último día de un plazo de `dias` hábiles contados desde el día siguiente a `inicio`."""
+    fecha = inicio
+    while dias > 0:
+        fecha += timedelta(days=1)
+        if es_habil(fecha):
+            dias -= 1
+    return fecha
+
+
+def sumar_dias_naturales(inicio, dias):
+    return siguiente_habil(inicio + timedelta(days=dias))
+
+
+def sumar_meses(inicio, meses):
+    """Vence el mismo día del mes de vencimiento (o el último si no existe)."""
+    total = inicio.month - 1 + meses
+    anio, mes = inicio.year + total // 12, total % 12 + 1
+    siguiente = date(anio + (mes == 12), mes % 12 + 1, 1)
+    dia = min(inicio.day, (siguiente - timedelta(days=1)).day)
+    return siguiente_habil(date(anio, mes, dia))
+
+
+# ---------- extracción ----------
+def _a_fecha(valor):
+    if not valor:
+        return None
+    if isinstance(valor, date):
+        return valor
+    for formato in ("%Y-%m-%d", "%d/%m/%Y", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.strptime(str(valor)[:19], formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _numero(texto):
+    return int(texto) if texto.isdigit() else NUMEROS.get(texto)
+
+
+def _limpiar(texto):
+    # Los anuncios pueden venir en HTML
+    return normalizar_texto(re.sub(r"<[^>]+>", " ", texto or ""))
+
+
+def contexto_fecha(texto, inicio):
+    """
+    "cierre", "inicio" o "publicacion" según la última pista que precede a la
+    fecha que empieza en `inicio` (texto normalizado); None si no hay ninguna.
+    """
+    ventana = texto[max(0, inicio - 80):inicio]
+    if PATRON_AL.search(ventana):
+        return "cierre"
+    pistas = list(PATRON_PISTA.finditer(ventana))
+    return pistas[-1].lastgroup if pistas else None
+
+
+def extraer_fechas(texto, referencia=None, contexto=None):
+    """
+    Fechas explícitas de un texto: "15 de marzo de 2025", "15-03-2025",
+    "15/03/25", "2025-03-15". Sin año se usa el de `referencia`. Se ignoran
+    las fechas de normas citadas ("Ley 38/2003, de 17 de noviembre").
+    Con `contexto` ("cierre", "inicio", "publicacion") solo se devuelven las
+    fechas precedidas por una pista de ese tipo (ver `contexto_fecha`).
+    """
+    texto = _limpiar(texto)
+    fechas = []
+
+    def _anadir(anio, mes, dia, inicio):
+        if PATRON_NORMA.search(texto[max(0, inicio - 40):inicio]):
+            return
+        if contexto is not None and contexto_fecha(texto, inicio) != contexto:
+            return
+        if anio is None:
+            if referencia is None:
+                return
+            anio = referencia.year
+            if date(anio, mes, 1) < date(referencia.year, referencia.month, 1):
+                anio += 1
+        elif anio < 100:
+            anio += 2000
+        try:
+            fechas.append(date(anio, mes, dia))
+        except ValueError:
+            pass
+
+    for m in PATRON_FECHA_TEXTO.finditer(texto):
+        _anadir(int(m.group(3)) if m.group(3) else None, MESES[m.group(2)], int(m.group(1)), m.start())
+    for m in PATRON_FECHA_NUMERICA.finditer(texto):
+        _anadir(int(m.group(3)), int(m.group(2)), int(m.group(1)), m.start())
+    for m in PATRON_FECHA_ISO.finditer(texto):
+        _anadir(int(m.group(1)), int(m.group(2)), int(m.group(3)), m.start())
+    return fechas
+
+
+def es_plazo_de_presentacion(texto, inicio, exigir_pista=False):
+    """
+    True si el plazo que empieza en `inicio` (texto normalizado) es el de
+    presentación: en su frase no hay antes una pista de otro trámite
+    (resolución, notificación, justificación...) y, con `exigir_pista`, sí
+    una de presentación de solicitudes.
+    """
+    ventana = texto[max(0, inicio - 150):inicio]
+    fines = list(PATRON_FIN_FRASE.finditer(ventana))
+    if fines:
+        ventana = ventana[fines[-1].end():]
+    if PATRON_PISTA_OTRO_TRAMITE.search(ventana):
+        return False
+    return not exigir_pista or bool(PATRON_PISTA_PRESENTACION.search(ventana))
+
+
+def calcular_plazo_relativo(texto, inicio, exigir_pista=False):
+    """
+    Fecha de cierre para "N días hábiles/naturales" o "N meses" contados desde
+    la publicación citada en el propio texto o, si no la hay, desde `inicio`.
+    Se usa el primer plazo del texto que sea de presentación (ver
+    `es_plazo_de_presentacion`), sea en días o en meses.
+    """
+    publicaciones = extraer_fechas(texto, inicio, contexto="publicacion")
+    if publicaciones:
+        inicio = max(publicaciones)
+    texto = _limpiar(texto)
+    plazos = [m for patron in (PATRON_PLAZO_DIAS, PATRON_PLAZO_MESES) for m in patron.finditer(texto)
+              if _numero(m.group(1)) and es_plazo_de_presentacion(texto, m.start(), exigir_pista)]
+    if not plazos:
+        return None
+    m = min(plazos, key=lambda m: m.start())
+    n = _numero(m.group(1))
+    if m.re is PATRON_PLAZO_MESES:
+        return sumar_meses(inicio, n)
+    # Ley 39/2015: si no se dice otra cosa, los días son hábiles
+    return sumar_dias_naturales(inicio, n) if m.group(2) == "naturales" else sumar_dias_habiles(inicio, n)
+
+
+# ---------- motor de reglas ----------
+def _resultado(estado, regla, fecha_cierre=None):
+    return {"estado": estado, "regla": regla, "fecha_cierre": fecha_cierre}
+
+
+def _por_fecha(fecha_cierre, hoy, regla):
+    return _resultado("cerrada" if hoy > fecha_cierre else "abierta", regla, fecha_cierre)
+
+
+def decidir_estado(dic, hoy=None):
+    """
+    Aplica las reglas al detalle de una convocatoria. Devuelve
+    {"estado": "abierta" | "cerrada" | "cerrada-no-publica" | None,
+     "regla": nombre de la regla aplicada, "fecha_cierre": date | None}.
+    """
+    hoy = hoy or datetime.now().date()
+    tipo = (dic.get("tipoConvocatoria") or "").lower()
+    if "concesión directa" in tipo or "nominativa" in tipo:
+        return _resultado("cerrada-no-publica", "concesion_directa")
+
+    fecha_fin = _a_fecha(dic.get("fechaFinSolicitud"))
+    if fecha_fin:
+        return _por_fecha(fecha_fin, hoy, "fecha_fin_estructurada")
+
+    referencia = _a_fecha(dic.get("fechaInicioSolicitud")) or _a_fecha(dic.get("fechaRecepcion"))
+    text_fin = dic.get("textFin") or ""
+    anuncios = [a.get("texto") or "" for a in dic.get("anuncios") or [] if a.get("titulo")]
+    documentos = [d.get("descripcion") or "" for d in dic.get("documentos") or []]
+
+    # 1. Fecha de cierre explícita en textFin (la más tardía si hay varias).
+    #    Las fechas de apertura o de publicación ("desde el...", "BOE de...") no cuentan.
+    fechas = extraer_fechas(text_fin, referencia, contexto="cierre")
+    if fechas:
+        return _por_fecha(max(fechas), hoy, "fecha_explicita_textFin")
+
+    # 2. Cierre por texto en documentos o anuncios
+    for texto in documentos + anuncios:
+        limpio = _limpiar(texto)
+        if any(frase in limpio for frase in FRASES_CIERRE):
+            return _resultado("cerrada", "frase_cierre")
+
+    # 3. Plazo relativo de presentación en anuncios (con pista explícita) o textFin
+    if referencia:
+        for texto, exigir_pista in [(a, True) for a in anuncios] + [(text_fin, False)]:
+            fecha_cierre = calcular_plazo_relativo(texto, referencia, exigir_pista)
+            if fecha_cierre:
+                return _por_fecha(fecha_cierre, hoy, "plazo_relativo")
+
+    # 4. Hasta agotar fondos
+    if PATRON_AGOTAR_FONDOS.search(_limpiar(text_fin)):
+        return _resultado("abierta", "agotar_fondos")
+
+    return _resultado(None, "indeterminado")
@@ -1,31 +1,57 @@
 # rag.py
 import os
-import pdfplumber
+import numpy as np
 import torch
 import gc
+import queue
+import threading
 from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (AutoTokenizer, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList,
+                          TextIteratorStreamer)
+from indices_rag import indice_documento
+from registro_indices import RAG_REGISTRO_DIR, RegistroIndices, id_indice_por_contenido
+from cache_embeddings import CacheEmbeddings
 
 # ======== CONFIGURACIÓN ========
 MODEL_ID_LLM = "microsoft/phi-2"
 MODEL_ID_EMBEDDINGS = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
 PDF_FOLDER = "data/documentos_convocatoria"
-TEXT_FILE = "TextoConvocatoria.txt"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+MARCA_FIN_RESPUESTA = "Instrucción:"   # phi-2 sigue escribiendo otra instrucción tras la respuesta
+RAG_STREAM_TIMEOUT = float(os.getenv("RAG_STREAM_TIMEOUT", "120"))   # s sin texto del modelo antes de abandonar
 
 # ======== VARIABLES GLOBALES PARA LAZY LOADING ========
 embedding_model = None
 tokenizer_llm = None
 model_llm = None
 device_embeddings = "cuda" if torch.cuda.is_available() else "cpu"
-text_chunks = []
-chunk_embeddings = None
 
 # ======== FUNCIONES DE CARGA LAZY ========
+class EmbeddingsLocalesConCache:
+    """SentenceTransformer que consulta antes la caché global de fragmentos (`cache_embeddings`)."""
+
+    def __init__(self, base, cache):
+        self.base = base
+        self.cache = cache
+
+    def encode(self, sentences, convert_to_tensor=False, **kwargs):
+        if isinstance(sentences, str):
+            # Preguntas: no se repiten lo bastante como para cachearlas
+            return self.base.encode(sentences, convert_to_tensor=convert_to_tensor, **kwargs)
+        kwargs.pop("convert_to_numpy", None)
+        vectores = self.cache.embeber(
+            sentences, lambda faltan: self.base.encode(faltan, convert_to_numpy=True, **kwargs)
+        )
+        return torch.from_numpy(vectores).to(device_embeddings) if convert_to_tensor else vectores
+
 def get_embedding_model():
     global embedding_model
     if embedding_model is None:
         print("🔹 Cargando modelo de embeddings...")
-        embedding_model = SentenceTransformer(MODEL_ID_EMBEDDINGS, device=device_embeddings)
+        embedding_model = EmbeddingsLocalesConCache(
+            SentenceTransformer(MODEL_ID_EMBEDDINGS, device=device_embeddings), CacheEmbeddings(MODEL_ID_EMBEDDINGS)
+        )
     return embedding_model
 
 def get_llm_model():
@@ -45,6 +71,15 @@ def get_llm_model():
         tokenizer_llm.padding_side = 'left'
     return tokenizer_llm, model_llm
 
+# ======== REGISTRO DE ÍNDICES (uno por documento subido o convocatoria) ========
+def _crear_tensor(vectores, fragmentos, metadatos):
+    return torch.from_numpy(np.ascontiguousarray(vectores)).to(device_embeddings)
+
+def _anadir_tensor(chunk_embeddings, vectores, fragmentos, metadatos):
+    return torch.cat([chunk_embeddings, _crear_tensor(vectores, fragmentos, metadatos)])
+
+REGISTRO_INDICES = RegistroIndices(_crear_tensor, _anadir_tensor, directorio=os.path.join(RAG_REGISTRO_DIR, "local"))
+
 # ======== FUNCIONES AUXILIARES ========
 def split_text_into_chunks(text, max_chunk_size=500, overlap_size=50):
     chunks = []
@@ -59,21 +94,24 @@ def split_text_into_chunks(text, max_chunk_size=500, overlap_size=50):
     return chunks
 
 # ======== FUNCIONES PRINCIPALES ========
-def procesar_documentos_convocatoria(documentos):
+def procesar_documentos_convocatoria(documentos, indice_id=None, progreso=None):
     """
     Procesa PDFs locales de la convocatoria y genera embeddings.
-    `documentos` debe ser una lista de dicts con 'id' y 'nombreFic'.
+    `documentos` debe ser una lista de dicts con 'id' y 'nombreFic', y opcionalmente
+    'ruta' (fichero en el almacén de documentos, ver `descargar_documentos_a_disco`)
+    y 'sha256'. Los añade al índice `indice_id` del registro; sin `indice_id` se
+    usa uno derivado del contenido. `progreso(etapa, hechos, total)` recibe el
+    avance (ver `indice_documento`). Devuelve el id del índice, o None si no hay texto.
     """
-    global text_chunks, chunk_embeddings
     embedding_model = get_embedding_model()  # lazy loading
 
     os.makedirs(PDF_FOLDER, exist_ok=True)
-    all_text = []
+    partes = []
 
-    # Leer PDFs locales
+    # Un índice por documento, guardado en disco por SHA-256 + modelo + troceado
     for doc in documentos:
         nombre = doc.get('nombreFic', f"documento_{doc['id']}.pdf")
-        pdf_path = os.path.join(PDF_FOLDER, nombre)
+        pdf_path = doc.get('ruta') or os.path.join(PDF_FOLDER, nombre)
 
         if not os.path.exists(pdf_path):
             print(f"❌ Archivo no encontrado: {pdf_path}")
@@ -81,54 +119,65 @@ def procesar_documentos_convocatoria(documentos):
 
         print(f"📄 Procesando {nombre} ...")
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        all_text.append(text)
+            indice = indice_documento(
+                {**doc, "ruta": pdf_path, "nombreFic": nombre}, MODEL_ID_EMBEDDINGS, CHUNK_SIZE, CHUNK_OVERLAP,
+                trocear=lambda texto: split_text_into_chunks(texto, max_chunk_size=CHUNK_SIZE, overlap_size=CHUNK_OVERLAP),
+                embeber=lambda trozos: embedding_model.encode(trozos, convert_to_numpy=True, show_progress_bar=True),
+                progreso=progreso,
+            )
         except Exception as e:
             print(f"❌ Error procesando {nombre}: {e}")
+            continue
+        if indice is not None:
+            partes.append(indice)
 
-    if not all_text:
+    if not partes:
         print("❌ No se extrajo texto de los PDFs.")
-        return
-
-    unified_text = "\n".join(all_text)
-    with open(TEXT_FILE, "w", encoding="utf-8") as f:
-        f.write(unified_text)
+        return None
 
-    # Dividir en chunks y generar embeddings
-    text_chunks = split_text_into_chunks(unified_text, max_chunk_size=500, overlap_size=50)
-    chunk_embeddings = embedding_model.encode(text_chunks, convert_to_tensor=True, show_progress_bar=True)
+    indice_id = indice_id or id_indice_por_contenido([m[0]["sha256"] for _, _, _, m in partes])
+    indice = REGISTRO_INDICES.anadir_documentos(indice_id, partes)
 
-    print(f"✅ Procesamiento completo: {len(text_chunks)} fragmentos, embeddings listos.")
+    print(f"✅ Procesamiento completo: índice {indice_id} con {len(indice.fragmentos)} fragmentos, embeddings listos.")
+    return indice_id
 
-def preguntar_al_modelo_rag(pregunta_usuario, top_k=3, max_new_tokens=200, temperature=0.7):
+def _contexto(pregunta_usuario, indice_id, top_k, modo):
     """
-    Busca en los embeddings el contexto más relevante y responde usando el LLM.
+    ([(texto, metadatos)] de los fragmentos más relevantes, None) o (None, mensaje de aviso) si no hay índice.
+    `modo`: "hibrido" (denso + BM25), "denso" o "lexico" (sin embedding de la pregunta).
     """
-    global text_chunks, chunk_embeddings
-    embedding_model = get_embedding_model()  # lazy loading
-    tokenizer, model = get_llm_model()      # lazy loading
-
-    if not text_chunks or chunk_embeddings is None:
-        return "⚠️ No hay documentos procesados aún. Por favor, procesa primero una convocatoria."
+    if not indice_id:
+        return None, "⚠️ No hay documentos procesados aún. Por favor, procesa primero una convocatoria."
+    indice = REGISTRO_INDICES.obtener(indice_id)
+    if indice is None:
+        return None, f"⚠️ No existe el índice '{indice_id}'. Por favor, procesa de nuevo el documento."
+    text_chunks, chunk_embeddings = indice.fragmentos, indice.objeto
 
-    # Embedding de la pregunta
-    pregunta_embedding = embedding_model.encode(pregunta_usuario, convert_to_tensor=True).to(device_embeddings)
+    def buscar_denso(k):
+        embedding_model = get_embedding_model()  # lazy loading
+        # Embedding de la pregunta
+        pregunta_embedding = embedding_model.encode(pregunta_usuario, convert_to_tensor=True).to(device_embeddings)
+        similarities = torch.nn.functional.cosine_similarity(pregunta_embedding.unsqueeze(0), chunk_embeddings)
+        return torch.topk(similarities, min(k, len(text_chunks))).indices.tolist()
 
     # Buscar fragmentos más relevantes
-    similarities = torch.nn.functional.cosine_similarity(pregunta_embedding.unsqueeze(0), chunk_embeddings)
-    top_k_indices = torch.topk(similarities, top_k).indices.tolist()
-    relevant_chunks = [text_chunks[i] for i in top_k_indices]
-    context = "\n\n".join(relevant_chunks)
+    top_k_indices = indice.recuperar(pregunta_usuario, top_k, buscar_denso, modo=modo)
+    relevant_chunks = [(text_chunks[i], indice.metadatos[i]) for i in top_k_indices]
 
     if device_embeddings == "cuda":
         torch.cuda.empty_cache()
     gc.collect()
+    return relevant_chunks, None
 
-    # Prompt para el LLM
-    prompt = f"""Instrucción: Basándote ÚNICAMENTE en el siguiente texto de contexto, responde a la pregunta.
+def _con_cita(texto, metadatos):
+    # Documento y página delante de cada fragmento, para que el modelo pueda citarlos
+    if metadatos.get("pagina") is None:
+        return texto
+    return f"[{metadatos.get('documento')}, pág. {metadatos['pagina']}]\n{texto}"
+
+def _prompt(pregunta_usuario, relevant_chunks):
+    context = "\n\n".join(_con_cita(texto, metadatos) for texto, metadatos in relevant_chunks)
+    return f"""Instrucción: Basándote ÚNICAMENTE en el siguiente texto de contexto, responde a la pregunta.
 Si la información no está en el contexto, indica que no tienes suficiente información.
 
 Contexto:
@@ -137,26 +186,131 @@ Contexto:
 Pregunta: {pregunta_usuario}
 Respuesta: """
 
+def _parametros_generacion(tokenizer, max_new_tokens, temperature):
+    return dict(
+        max_new_tokens=max_new_tokens,
+        do_sample=True,
+        temperature=temperature,
+        top_p=0.9,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id
+    )
+
+def preguntar_al_modelo_rag(pregunta_usuario, indice_id, top_k=3, max_new_tokens=200, temperature=0.7, modo=None):
+    """
+    Busca en el índice `indice_id` (el devuelto al procesar el documento) el contexto
+    más relevante (búsqueda `modo`, por defecto RAG_MODO_BUSQUEDA) y responde
+    usando el LLM.
+    """
+    tokenizer, model = get_llm_model()      # lazy loading
+
+    relevant_chunks, aviso = _contexto(pregunta_usuario, indice_id, top_k, modo)
+    if relevant_chunks is None:
+        return aviso
+
+    # Prompt para el LLM
+    prompt = _prompt(pregunta_usuario, relevant_chunks)
+
     # Generar respuesta
     input_ids = tokenizer(prompt, return_tensors="pt", return_attention_mask=False).to(model.device)
     with torch.no_grad():
-        output = model.generate(
-            **input_ids,
-            max_new_tokens=max_new_tokens,
-            do_sample=True,
-            temperature=temperature,
-            top_p=0.9,
-            pad_token_id=tokenizer.pad_token_id,
-            eos_token_id=tokenizer.eos_token_id
-        )
+        output = model.generate(**input_ids, **_parametros_generacion(tokenizer, max_new_tokens, temperature))
 
     response = tokenizer.decode(output[0], skip_special_tokens=False)
 
     if "Respuesta: " in response:
         cleaned_response = response.split("Respuesta: ", 1)[1].strip()
         cleaned_response = cleaned_response.replace("<|endoftext|>", "").strip()
-        cleaned_response = cleaned_response.split("Instrucción:", 1)[0].strip()
+        cleaned_response = cleaned_response.split(MARCA_FIN_RESPUESTA, 1)[0].strip()
     else:
         cleaned_response = response
 
     return cleaned_response
+
+class _ParadaPorCliente(StoppingCriteria):
+    """Corta `generate` cuando el cliente del streaming se ha desconectado."""
+
+    def __init__(self):
+        self.parar = threading.Event()
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.parar.is_set()
+
+def _hasta_la_marca(trozos, marca=MARCA_FIN_RESPUESTA):
+    """
+    Reenvía el texto de `trozos` hasta `marca`, sin incluirla. La marca puede
+    llegar partida entre trozos ("Instru" + "cción:"), así que se retiene la
+    cola que podría ser su comienzo hasta que el trozo siguiente lo aclare.
+    """
+    pendiente = ""
+    for trozo in trozos:
+        pendiente += trozo
+        if marca in pendiente:
+            antes = pendiente.split(marca, 1)[0]
+            if antes.strip():
+                yield antes
+            return
+        retener = next((n for n in range(min(len(marca) - 1, len(pendiente)), 0, -1)
+                        if marca.startswith(pendiente[-n:])), 0)
+        if len(pendiente) > retener:
+            yield pendiente[:len(pendiente) - retener]
+            pendiente = pendiente[len(pendiente) - retener:]
+    if pendiente:
+        yield pendiente
+
+def eventos_respuesta_rag(pregunta_usuario, indice_id, top_k=3, max_new_tokens=200, temperature=0.7, modo=None):
+    """
+    Como `preguntar_al_modelo_rag` pero incremental, para /preguntar_rag/stream.
+    Genera eventos: "contexto" (fragmentos recuperados), "token" por cada trozo
+    de texto que produce el LLM y "fin"; o un único "aviso" si no hay índice.
+    `model.generate` corre en un hilo y entrega el texto por un TextIteratorStreamer;
+    si falla, o no entrega nada en RAG_STREAM_TIMEOUT segundos, termina con un
+    evento "error" en lugar de "fin".
+    """
+    tokenizer, model = get_llm_model()      # lazy loading
+
+    relevant_chunks, aviso = _contexto(pregunta_usuario, indice_id, top_k, modo)
+    if relevant_chunks is None:
+        yield {"tipo": "aviso", "texto": aviso}
+        return
+    yield {"tipo": "contexto", "indice": indice_id,
+           "fragmentos": [{"documento": m.get("documento"), "pagina": m.get("pagina"), "texto": t}
+                          for t, m in relevant_chunks]}
+
+    input_ids = tokenizer(_prompt(pregunta_usuario, relevant_chunks), return_tensors="pt",
+                          return_attention_mask=False).to(model.device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=RAG_STREAM_TIMEOUT)
+    parada = _ParadaPorCliente()
+    errores = []
+
+    def generar():
+        try:
+            with torch.no_grad():
+                model.generate(**input_ids, streamer=streamer, stopping_criteria=StoppingCriteriaList([parada]),
+                               **_parametros_generacion(tokenizer, max_new_tokens, temperature))
+        except Exception as e:
+            errores.append(e)
+        finally:
+            # Sin esto, si generate falla el consumidor se queda esperando el fin del stream
+            streamer.end()
+
+    hilo = threading.Thread(target=generar, daemon=True)
+    hilo.start()
+    try:
+        for texto in _hasta_la_marca(streamer):
+            yield {"tipo": "token", "texto": texto}
+    except queue.Empty:
+        errores.append(TimeoutError(f"El modelo no ha generado texto en {RAG_STREAM_TIMEOUT:.0f} s"))
+    finally:
+        parada.parar.set()
+        try:
+            for _ in streamer:   # vacía la cola para que el hilo de generación termine
+                pass
+        except queue.Empty:
+            pass
+        hilo.join(timeout=RAG_STREAM_TIMEOUT)
+    if errores:
+        print(f"❌ Error generando la respuesta RAG: {errores[0]}")
+        yield {"tipo": "error", "error": str(errores[0])}
+        return
+    yield {"tipo": "fin"}
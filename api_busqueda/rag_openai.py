@@ -1,22 +1,24 @@
 import os
-import pdfplumber
 import gc
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings.openai import OpenAIEmbeddings
+from langchain.embeddings.base import Embeddings
 from langchain.vectorstores import FAISS
 from openai import OpenAI
+from indices_rag import indice_documento
+from registro_indices import RAG_REGISTRO_DIR, RegistroIndices, id_indice_por_contenido
+from cache_embeddings import CacheEmbeddings
+from embeddings_openai import EmbedderOpenAI
 
 # ======== CONFIGURACIÓN ========
 PDF_FOLDER = "data/documentos_convocatoria"
-TEXT_FILE = "TextoConvocatoria.txt"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
 OPENAI_MODEL = "gpt-4o-mini"
 OPENAI_EMBED_MODEL = "text-embedding-3-small"
 API_KEY_FILE = "openai_api_key.txt"
 
 # ======== VARIABLES GLOBALES PARA LAZY LOADING ========
 embedding_model = None
-vectorstore = None
-text_chunks = []
 client = None
 api_key_cache = None
 
@@ -33,12 +35,28 @@ def load_api_key():
     return api_key_cache
 
 # ======== FUNCIONES DE CARGA LAZY ========
+class EmbeddingsConCache(Embeddings):
+    """Embeddings de OpenAI (`EmbedderOpenAI`) que consultan antes la caché global de fragmentos (`cache_embeddings`)."""
+
+    def __init__(self, base, cache):
+        self.base = base
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        # Solo los fragmentos que faltan van a OpenAI, en una única llamada
+        return self.cache.embeber(texts, self.base.embed_documents).tolist()
+
+    def embed_query(self, text):
+        return self.base.embed_query(text)
+
 def get_embedding_model():
     global embedding_model
     if embedding_model is None:
         print("🔹 Cargando modelo de embeddings OpenAI...")
-        api_key = load_api_key()
-        embedding_model = OpenAIEmbeddings(model=OPENAI_EMBED_MODEL, openai_api_key=api_key)
+        # Lotes por tokens, peticiones concurrentes bajo EMBED_RPM/EMBED_TPM y reintentos ante 429/5xx
+        embedding_model = EmbeddingsConCache(
+            EmbedderOpenAI(get_openai_client(), OPENAI_EMBED_MODEL), CacheEmbeddings(OPENAI_EMBED_MODEL)
+        )
     return embedding_model
 
 def get_openai_client():
@@ -49,27 +67,50 @@ def get_openai_client():
         client = OpenAI(api_key=api_key)
     return client
 
+# ======== REGISTRO DE ÍNDICES (uno por documento subido o convocatoria) ========
+def _pares(vectores, fragmentos):
+    return list(zip(fragmentos, (v.tolist() for v in vectores)))
+
+def _con_posicion(metadatos, inicio):
+    # Posición del fragmento en el índice con nombre: la misma que usa el índice léxico
+    return [{**m, "posicion": inicio + i} for i, m in enumerate(metadatos)]
+
+def _crear_faiss(vectores, fragmentos, metadatos):
+    # FAISS a partir de los vectores ya calculados (o cargados de disco)
+    return FAISS.from_embeddings(_pares(vectores, fragmentos), get_embedding_model(),
+                                 metadatas=_con_posicion(metadatos, 0))
+
+def _anadir_faiss(vectorstore, vectores, fragmentos, metadatos):
+    vectorstore.add_embeddings(_pares(vectores, fragmentos), metadatas=_con_posicion(metadatos, vectorstore.index.ntotal))
+    return vectorstore
+
+REGISTRO_INDICES = RegistroIndices(_crear_faiss, _anadir_faiss, directorio=os.path.join(RAG_REGISTRO_DIR, "openai"))
+
 # ======== FUNCIONES AUXILIARES ========
 def split_text_into_chunks(text, max_chunk_size=1000, overlap_size=200):
     splitter = RecursiveCharacterTextSplitter(chunk_size=max_chunk_size, chunk_overlap=overlap_size)
     return splitter.split_text(text)
 
 # ======== FUNCIONES PRINCIPALES ========
-def procesar_documentos_convocatoria(documentos):
+def procesar_documentos_convocatoria(documentos, indice_id=None, progreso=None):
     """
     Procesa PDFs locales de la convocatoria y genera embeddings con OpenAI.
-    `documentos` debe ser una lista de dicts con 'id' y 'nombreFic'.
+    `documentos` debe ser una lista de dicts con 'id' y 'nombreFic', y opcionalmente
+    'ruta' (fichero en el almacén de documentos, ver `descargar_documentos_a_disco`)
+    y 'sha256'. Los añade al índice `indice_id` del registro (si ya existe, solo
+    se añaden los documentos nuevos); sin `indice_id` se usa uno derivado del
+    contenido. `progreso(etapa, hechos, total)` recibe el avance (ver `indice_documento`).
+    Devuelve el id del índice, o None si no se extrajo texto.
     """
-    global text_chunks, vectorstore
     embedding_model = get_embedding_model()  # lazy loading
 
     os.makedirs(PDF_FOLDER, exist_ok=True)
-    all_text = []
+    partes = []
 
-    # Leer PDFs locales
+    # Un índice por documento, guardado en disco por SHA-256 + modelo + troceado
     for doc in documentos:
         nombre = doc.get('nombreFic', f"documento_{doc['id']}.pdf")
-        pdf_path = os.path.join(PDF_FOLDER, nombre)
+        pdf_path = doc.get('ruta') or os.path.join(PDF_FOLDER, nombre)
 
         if not os.path.exists(pdf_path):
             print(f"❌ Archivo no encontrado: {pdf_path}")
@@ -77,45 +118,29 @@ def procesar_documentos_convocatoria(documentos):
 
         print(f"📄 Procesando {nombre} ...")
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text:
-                        all_text.append(text)
+            indice = indice_documento(
+                {**doc, "ruta": pdf_path, "nombreFic": nombre}, OPENAI_EMBED_MODEL, CHUNK_SIZE, CHUNK_OVERLAP,
+                trocear=lambda texto: split_text_into_chunks(texto, max_chunk_size=CHUNK_SIZE, overlap_size=CHUNK_OVERLAP),
+                embeber=embedding_model.embed_documents,
+                progreso=progreso,
+            )
         except Exception as e:
             print(f"❌ Error procesando {nombre}: {e}")
+            continue
+        if indice is not None:
+            partes.append(indice)
 
-    if not all_text:
+    if not partes:
         print("❌ No se extrajo texto de los PDFs.")
-        return
-
-    unified_text = "\n".join(all_text)
-    with open(TEXT_FILE, "w", encoding="utf-8") as f:
-        f.write(unified_text)
-
-    # Dividir en chunks y generar embeddings + FAISS
-    text_chunks = split_text_into_chunks(unified_text, max_chunk_size=1000, overlap_size=200)
-    vectorstore = FAISS.from_texts(text_chunks, embedding_model)
-
-    print(f"✅ Procesamiento completo: {len(text_chunks)} fragmentos, FAISS listo.")
+        return None
 
-def preguntar_al_modelo_rag(pregunta_usuario, top_k=3, max_tokens=600, temperature=0.3):
-    """
-    Busca en los embeddings el contexto más relevante y responde usando GPT-4o-mini.
-    """
-    global text_chunks, vectorstore
-    embedding_model = get_embedding_model()
-    client = get_openai_client()
+    indice_id = indice_id or id_indice_por_contenido([m[0]["sha256"] for _, _, _, m in partes])
+    indice = REGISTRO_INDICES.anadir_documentos(indice_id, partes)
 
-    if not text_chunks or vectorstore is None:
-        return "⚠️ No hay documentos procesados aún. Por favor, procesa primero una convocatoria."
-
-    # Buscar contexto relevante
-    docs = vectorstore.similarity_search(pregunta_usuario, k=top_k)
-    context = "\n\n".join([doc.page_content for doc in docs])
+    print(f"✅ Procesamiento completo: índice {indice_id} con {len(indice.fragmentos)} fragmentos, FAISS listo.")
+    return indice_id
 
-    # Prompt
-    prompt = """
+PROMPT_SISTEMA = """
 Eres un asistente experto en ayudas públicas en España. Responde en tono claro y amigable, basado únicamente en el contexto que se te proporciona. 
 Si no encuentras la respuesta a la consulta en el documento, debes decir que no has podido encontrar la información relevante e invitar 
 al usuario a que revise el documento.
@@ -135,17 +160,93 @@ Termina siempre preguntando al usuario en tono amable si le puedes ayudar an alg
     
 """
 
+def _contexto(pregunta_usuario, indice_id, top_k, modo):
+    """
+    ([(texto, metadatos)] de los fragmentos recuperados, None) o (None, aviso) si no hay índice.
+    `modo`: "hibrido" (denso + BM25), "denso" o "lexico" (sin embedding de la pregunta).
+    """
+    if not indice_id:
+        return None, "⚠️ No hay documentos procesados aún. Por favor, procesa primero una convocatoria."
+    indice = REGISTRO_INDICES.obtener(indice_id)
+    if indice is None:
+        return None, f"⚠️ No existe el índice '{indice_id}'. Por favor, procesa de nuevo el documento."
+
+    def buscar_denso(k):
+        docs = indice.objeto.similarity_search(pregunta_usuario, k=k)
+        return [doc.metadata["posicion"] for doc in docs]
+
+    # Buscar contexto relevante
+    posiciones = indice.recuperar(pregunta_usuario, top_k, buscar_denso, modo=modo)
+    return [(indice.fragmentos[p], indice.metadatos[p]) for p in posiciones], None
+
+def _con_cita(texto, metadatos):
+    # Documento y página delante de cada fragmento, para que el modelo pueda citarlos
+    if metadatos.get("pagina") is None:
+        return texto
+    return f"[{metadatos.get('documento')}, pág. {metadatos['pagina']}]\n{texto}"
+
+def _mensajes(pregunta_usuario, docs):
+    context = "\n\n".join([_con_cita(texto, metadatos) for texto, metadatos in docs])
+    return [
+        {"role": "system", "content": PROMPT_SISTEMA},
+        {"role": "user", "content": f"Contexto:\n{context}\n\nPregunta:\n{pregunta_usuario}"}
+    ]
+
+def _fragmentos_usados(docs):
+    return [{"documento": metadatos.get("documento"), "pagina": metadatos.get("pagina"), "texto": texto}
+            for texto, metadatos in docs]
+
+def preguntar_al_modelo_rag(pregunta_usuario, indice_id, top_k=3, max_tokens=600, temperature=0.3, modo=None):
+    """
+    Busca en el índice `indice_id` (el devuelto al procesar el documento) el contexto
+    más relevante (búsqueda `modo`, por defecto RAG_MODO_BUSQUEDA) y responde
+    usando GPT-4o-mini.
+    """
+    client = get_openai_client()
+
+    docs, aviso = _contexto(pregunta_usuario, indice_id, top_k, modo)
+    if docs is None:
+        return aviso
+
     # Llamar a GPT-4o-mini
     response = client.chat.completions.create(
         model=OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": f"Contexto:\n{context}\n\nPregunta:\n{pregunta_usuario}"}
-        ],
+        messages=_mensajes(pregunta_usuario, docs),
         temperature=temperature,
         max_tokens=max_tokens
     )
 
     gc.collect()
 
-    return response.choices[0].message.content.strip()
\ No newline at end of file
+    return response.choices[0].message.content.strip()
+
+def eventos_respuesta_rag(pregunta_usuario, indice_id, top_k=3, max_tokens=600, temperature=0.3, modo=None):
+    """
+    Como `preguntar_al_modelo_rag` pero incremental, para /preguntar_rag/stream.
+    Genera eventos: "contexto" (fragmentos recuperados, antes de llamar al
+    modelo), "token" por cada trozo de texto que devuelve OpenAI en streaming,
+    y "fin"; o un único "aviso" si no hay índice.
+    """
+    client = get_openai_client()
+
+    docs, aviso = _contexto(pregunta_usuario, indice_id, top_k, modo)
+    if docs is None:
+        yield {"tipo": "aviso", "texto": aviso}
+        return
+    yield {"tipo": "contexto", "indice": indice_id, "fragmentos": _fragmentos_usados(docs)}
+
+    stream = client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=_mensajes(pregunta_usuario, docs),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+    )
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield {"tipo": "token", "texto": chunk.choices[0].delta.content}
+    finally:
+        # Si el cliente se desconecta se cierra la conexión con OpenAI (deja de generar tokens)
+        stream.close()
+    yield {"tipo": "fin"}
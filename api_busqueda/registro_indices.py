@@ -0,0 +1,209 @@
+"""
+Registro de índices RAG con nombre (uno por documento subido o por convocatoria).
+
+Sustituye al estado global único de `rag_openai.py` / `rag.py`, que cada
+`/procesar_documento` sobrescribía. Cada índice con nombre es una lista de
+índices por documento (`indices_rag`, por SHA-256 + modelo + troceado):
+- la lista se persiste en `RAG_REGISTRO_DIR/<indice_id>.json`;
+- en memoria se mantiene el objeto de búsqueda (FAISS, tensor...) construido
+  por el backend, con expulsión LRU bajo un presupuesto de memoria
+  (`RAG_MEMORIA_MAX_BYTES`) y recarga perezosa desde disco al pedirlo;
+- añadir documentos a un índice existente es incremental: solo se añaden los
+  vectores nuevos al objeto en memoria;
+- junto al objeto de búsqueda densa se mantiene un índice léxico BM25
+  (`indice_lexico.py`) de los mismos fragmentos, para la recuperación híbrida.
+
+El backend aporta `crear(vectores, fragmentos, metadatos)` y
+`anadir(objeto, vectores, fragmentos, metadatos)`.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from indice_lexico import MODOS_BUSQUEDA, RAG_CANDIDATOS, RAG_MODO_BUSQUEDA, IndiceBM25, fusionar, seleccionar
+from indices_rag import RAG_INDICES_DIR, cargar_indice
+
+# ======== CONFIGURACIÓN ========
+RAG_REGISTRO_DIR = os.getenv("RAG_REGISTRO_DIR", "data/cache/registro_indices")
+RAG_MEMORIA_MAX_BYTES = int(os.getenv("RAG_MEMORIA_MAX_BYTES", str(512 * 1024 ** 2)))
+
+_ID_VALIDO = re.compile(r"^[A-Za-z0-9_.-]{1,80}$")
+
+
+def id_indice_por_contenido(sha256s):
+    """Id por defecto: el del documento si es uno solo, o un hash del conjunto."""
+    if len(sha256s) == 1:
+        return f"doc-{sha256s[0][:16]}"
+    datos = "\n".join(sorted(set(sha256s))).encode("utf-8")
+    return f"docs-{hashlib.sha256(datos).hexdigest()[:16]}"
+
+
+def _tamano(vectores, fragmentos):
+    # Estimación de la memoria del índice: vectores + textos
+    return int(np.asarray(vectores).nbytes) + sum(len(f.encode("utf-8")) for f in fragmentos)
+
+
+class IndiceEnMemoria:
+    def __init__(self, objeto, fragmentos, metadatos, claves, vectores):
+        self.objeto = objeto
+        self.fragmentos = fragmentos
+        self.metadatos = metadatos
+        self.claves = claves
+        self.lexico = IndiceBM25(fragmentos)
+        self.tamano = _tamano(vectores, fragmentos) + self.lexico.tamano()
+
+    def anadir(self, objeto, vectores, fragmentos, metadatos):
+        self.objeto = objeto
+        self.fragmentos = self.fragmentos + fragmentos
+        self.metadatos = self.metadatos + metadatos
+        tamano_lexico = self.lexico.tamano()
+        self.lexico.anadir(fragmentos)
+        self.tamano += _tamano(vectores, fragmentos) + self.lexico.tamano() - tamano_lexico
+
+    def recuperar(self, pregunta, top_k, buscar_denso, modo=None, candidatos=RAG_CANDIDATOS):
+        """
+        Posiciones de los fragmentos más relevantes para `pregunta` según `modo`:
+        "denso" (`buscar_denso(k)` -> posiciones ordenadas), "lexico" (solo BM25,
+        sin embedding de la pregunta) o "hibrido" (fusión RRF de ambos, que puede
+        devolver menos de `top_k` si los demás quedan muy por debajo del mejor).
+        """
+        modo = modo or RAG_MODO_BUSQUEDA
+        if modo not in MODOS_BUSQUEDA:
+            raise ValueError(f"Modo de búsqueda no válido: {modo!r}")
+        if modo == "denso":
+            return buscar_denso(top_k)
+        lexicos = [posicion for posicion, _ in self.lexico.buscar(pregunta, k=candidatos)]
+        if modo == "lexico":
+            return lexicos[:top_k]
+        return seleccionar(fusionar(buscar_denso(candidatos), lexicos), top_k)
+
+
+class RegistroIndices:
+    """`indice_id -> índice` con persistencia, LRU por memoria y altas incrementales."""
+
+    def __init__(self, crear, anadir, directorio=RAG_REGISTRO_DIR, max_bytes=RAG_MEMORIA_MAX_BYTES,
+                 dir_indices=RAG_INDICES_DIR):
+        self._crear = crear
+        self._anadir = anadir
+        self.directorio = directorio
+        self.dir_indices = dir_indices
+        self.max_bytes = max_bytes
+        self._memoria = OrderedDict()
+        self._lock = threading.RLock()
+        os.makedirs(directorio, exist_ok=True)
+
+    @staticmethod
+    def validar_id(indice_id):
+        if not _ID_VALIDO.match(indice_id or ""):
+            raise ValueError(f"Identificador de índice no válido: {indice_id!r}")
+        return indice_id
+
+    # ---------- disco ----------
+    def _ruta(self, indice_id):
+        return os.path.join(self.directorio, f"{indice_id}.json")
+
+    def _claves_en_disco(self, indice_id):
+        ruta = self._ruta(indice_id)
+        if not os.path.exists(ruta):
+            return None
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)["documentos"]
+
+    def _guardar_claves(self, indice_id, claves):
+        fd, tmp = tempfile.mkstemp(dir=self.directorio, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"documentos": claves, "actualizado_en": time.time()}, f)
+        os.replace(tmp, self._ruta(indice_id))
+
+    def _cargar(self, indice_id, claves):
+        vectores, fragmentos, metadatos = [], [], []
+        for clave in claves:
+            guardado = cargar_indice(clave, self.dir_indices)
+            if guardado is None:
+                print(f"⚠️ Índice de documento {clave} no encontrado; se omite de {indice_id}")
+                continue
+            vectores.append(guardado[0])
+            fragmentos.extend(guardado[1])
+            metadatos.extend(guardado[2])
+        if not fragmentos:
+            return None
+        vectores = np.concatenate(vectores)
+        return IndiceEnMemoria(self._crear(vectores, fragmentos, metadatos), fragmentos, metadatos, list(claves),
+                               vectores)
+
+    # ---------- memoria ----------
+    def _poner(self, indice_id, indice):
+        self._memoria[indice_id] = indice
+        self._memoria.move_to_end(indice_id)
+        total = sum(i.tamano for i in self._memoria.values())
+        # LRU: se descargan los menos usados (siguen en disco); el actual nunca
+        while total > self.max_bytes and len(self._memoria) > 1:
+            viejo_id, viejo = self._memoria.popitem(last=False)
+            total -= viejo.tamano
+            print(f"♻️ Índice {viejo_id} descargado de memoria ({viejo.tamano / 1e6:.1f} MB)")
+
+    # ---------- API pública ----------
+    def obtener(self, indice_id):
+        """
+        Índice `indice_id` en memoria (recargándolo de disco si hace falta); None
+        si no existe. No hay índice "por defecto": con varios usuarios, el último
+        usado puede ser el documento de otro.
+        """
+        with self._lock:
+            indice = self._memoria.get(indice_id)
+            if indice is None:
+                claves = self._claves_en_disco(self.validar_id(indice_id))
+                if claves is None:
+                    return None
+                t0 = time.perf_counter()
+                indice = self._cargar(indice_id, claves)
+                if indice is None:
+                    return None
+                print(f"⚡ Índice {indice_id} recargado de disco en {(time.perf_counter() - t0) * 1000:.0f} ms")
+            self._poner(indice_id, indice)
+            return indice
+
+    def anadir_documentos(self, indice_id, partes):
+        """
+        Añade a `indice_id` (creándolo si no existe) los documentos `partes`,
+        lista de (clave, vectores, fragmentos, metadatos) de `indices_rag`.
+        Los que ya estaban en el índice se ignoran.
+        """
+        self.validar_id(indice_id)
+        with self._lock:
+            indice = self.obtener(indice_id)
+            claves = list(indice.claves) if indice else (self._claves_en_disco(indice_id) or [])
+            nuevas = [p for p in partes if p[0] not in claves and len(p[2])]
+            if nuevas:
+                vectores = np.concatenate([np.asarray(p[1], dtype=np.float32) for p in nuevas])
+                fragmentos = [f for p in nuevas for f in p[2]]
+                metadatos = [m for p in nuevas for m in p[3]]
+                if indice is None:
+                    indice = IndiceEnMemoria(self._crear(vectores, fragmentos, metadatos), fragmentos, metadatos, [],
+                                             vectores)
+                else:
+                    # Incremental: solo los vectores (y términos) nuevos
+                    indice.anadir(self._anadir(indice.objeto, vectores, fragmentos, metadatos), vectores, fragmentos,
+                                  metadatos)
+                indice.claves = claves + [p[0] for p in nuevas]
+                self._guardar_claves(indice_id, indice.claves)
+            if indice is not None:
+                self._poner(indice_id, indice)
+            return indice
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "en_memoria": {i: {"fragmentos": len(x.fragmentos), "documentos": len(x.claves), "bytes": x.tamano}
+                               for i, x in self._memoria.items()},
+                "bytes": sum(x.tamano for x in self._memoria.values()),
+                "max_bytes": self.max_bytes,
+                "en_disco": sorted(f[:-5] for f in os.listdir(self.directorio) if f.endswith(".json")),
+            }
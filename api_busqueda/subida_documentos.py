@@ -0,0 +1,149 @@
+"""
+Subida de documentos en streaming para `/procesar_documento`.
+
+Con `UploadFile` Starlette recibe el cuerpo entero antes de llamar al endpoint,
+y el endpoint lo volvía a leer completo en memoria (`await file.read()`). Aquí
+se lee el multipart según llega:
+- el fichero se escribe en el almacén de documentos por trozos de
+  `SUBIDA_TROZO_BYTES` y se hashea mientras se escribe, así que la memoria por
+  subida es constante y el SHA-256 queda disponible sin volver a leer el
+  fichero (para deduplicar y buscar el índice RAG);
+- se guarda con su hash como nombre (`AlmacenDocumentos`), así que dos subidas
+  con el mismo nombre de fichero no se pisan;
+- por encima de `SUBIDA_MAX_BYTES` se corta la subida (HTTP 413) y se borra
+  lo recibido; si el Content-Length ya lo supera, sin leer el cuerpo.
+"""
+import os
+
+from fastapi.concurrency import run_in_threadpool
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# ======== CONFIGURACIÓN ========
+SUBIDA_MAX_BYTES = int(os.getenv("SUBIDA_MAX_BYTES", str(50 * 1024 ** 2)))
+SUBIDA_TROZO_BYTES = int(os.getenv("SUBIDA_TROZO_BYTES", str(1024 ** 2)))
+MAX_BYTES_CAMPO = 4096               # campos de texto del formulario (p. ej. `indice`)
+MARGEN_MULTIPART = 64 * 1024         # cabeceras y campos de texto además del fichero
+
+
+class SubidaNoValida(ValueError):
+    """Formulario multipart mal formado o sin fichero (HTTP 400)."""
+
+
+class SubidaDemasiadoGrande(ValueError):
+    """El fichero supera `SUBIDA_MAX_BYTES` (HTTP 413)."""
+
+
+class _LectorMultipart:
+    """Callbacks de `MultipartParser`: el fichero va al almacén, los campos de texto a `campos`."""
+
+    def __init__(self, almacen, campo_fichero, max_bytes):
+        self._almacen = almacen
+        self._campo_fichero = campo_fichero
+        self._max_bytes = max_bytes
+        self.campos = {}
+        self.escritura = None
+        self.nombre = None
+        self.mime = None
+        self.pendiente = bytearray()   # trozo del fichero aún sin escribir
+        self._cabeceras = {}
+        self._cabecera = [bytearray(), bytearray()]
+        self._parte = None             # nombre del campo en curso
+        self._es_fichero = False
+        self._texto = bytearray()
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self._inicio_parte,
+            "on_header_field": lambda datos, i, f: self._cabecera[0].extend(datos[i:f]),
+            "on_header_value": lambda datos, i, f: self._cabecera[1].extend(datos[i:f]),
+            "on_header_end": self._fin_cabecera,
+            "on_headers_finished": self._fin_cabeceras,
+            "on_part_data": self._datos,
+            "on_part_end": self._fin_parte,
+        }
+
+    def _inicio_parte(self):
+        self._cabeceras, self._parte, self._es_fichero = {}, None, False
+        self._texto = bytearray()
+
+    def _fin_cabecera(self):
+        campo, valor = self._cabecera
+        self._cabeceras[bytes(campo).lower()] = bytes(valor)
+        self._cabecera = [bytearray(), bytearray()]
+
+    def _fin_cabeceras(self):
+        _, opciones = parse_options_header(self._cabeceras.get(b"content-disposition", b""))
+        self._parte = opciones.get(b"name", b"").decode("utf-8", "replace")
+        nombre_fichero = opciones.get(b"filename")
+        if self._parte != self._campo_fichero or nombre_fichero is None:
+            return
+        if self.escritura is not None:
+            raise SubidaNoValida("Solo se admite un fichero por subida")
+        self._es_fichero = True
+        # El nombre original solo se guarda como metadato; en disco manda el hash
+        self.nombre = os.path.basename(nombre_fichero.decode("utf-8", "replace").replace("\\", "/")) or None
+        self.mime = self._cabeceras.get(b"content-type", b"").decode("latin-1") or None
+        self.escritura = self._almacen.nueva_escritura()
+
+    def _datos(self, datos, inicio, fin):
+        if not self._es_fichero:
+            self._texto.extend(datos[inicio:fin])
+            if len(self._texto) > MAX_BYTES_CAMPO:
+                raise SubidaNoValida(f"Campo '{self._parte}' demasiado largo")
+            return
+        self.pendiente.extend(datos[inicio:fin])
+        if self.escritura.tamano + len(self.pendiente) > self._max_bytes:
+            raise SubidaDemasiadoGrande(f"El fichero supera el máximo de {self._max_bytes // 1024 ** 2} MB")
+
+    def _fin_parte(self):
+        if not self._es_fichero and self._parte:
+            self.campos[self._parte] = self._texto.decode("utf-8", "replace")
+
+    def volcar(self):
+        """Escribe (y hashea) lo pendiente del fichero."""
+        if self.pendiente:
+            self.escritura.write(bytes(self.pendiente))
+            self.pendiente.clear()
+
+
+async def recibir_documento(request, almacen, campo_fichero="file", max_bytes=SUBIDA_MAX_BYTES, fijar=False):
+    """
+    Lee en streaming el formulario multipart de `request` y guarda el fichero del
+    campo `campo_fichero` en `almacen` (un `AlmacenDocumentos`).
+    Devuelve (entrada del almacén con 'ruta' y 'sha256', campos de texto del formulario).
+    Con `fijar` el fichero no se expulsa hasta `almacen.soltar(info["lectura"])`.
+    Lanza `SubidaDemasiadoGrande` o `SubidaNoValida`; en ese caso no queda nada en disco.
+    """
+    tipo, opciones = parse_options_header(request.headers.get("content-type", ""))
+    if tipo != b"multipart/form-data" or not opciones.get(b"boundary"):
+        raise SubidaNoValida("Se esperaba un formulario multipart/form-data")
+    longitud = request.headers.get("content-length", "")
+    if longitud.isdigit() and int(longitud) > max_bytes + MARGEN_MULTIPART:
+        raise SubidaDemasiadoGrande(f"El fichero supera el máximo de {max_bytes // 1024 ** 2} MB")
+
+    lector = _LectorMultipart(almacen, campo_fichero, max_bytes)
+    parser = MultipartParser(opciones[b"boundary"], lector.callbacks())
+    try:
+        async for trozo in request.stream():
+            parser.write(trozo)
+            # Escritura a disco fuera del bucle de eventos, por trozos de tamaño fijo
+            if len(lector.pendiente) >= SUBIDA_TROZO_BYTES:
+                await run_in_threadpool(lector.volcar)
+        parser.finalize()
+        if lector.escritura is None:
+            raise SubidaNoValida(f"Falta el fichero '{campo_fichero}'")
+        await run_in_threadpool(lector.volcar)
+        info = await run_in_threadpool(lector.escritura.confirmar, mime=lector.mime, nombre=lector.nombre,
+                                       fijar=fijar)
+    except MultipartParseError as e:
+        if lector.escritura is not None:
+            lector.escritura.descartar()
+        raise SubidaNoValida(f"Formulario multipart mal formado: {e}")
+    except BaseException:
+        # Incluye la desconexión del cliente a mitad de subida
+        if lector.escritura is not None:
+            lector.escritura.descartar()
+        raise
+    print(f"📥 Subida {lector.nombre}: {info['tamano'] / 1e6:.1f} MB, sha256 {info['sha256'][:12]}")
+    return info, lector.campos
@@ -0,0 +1,229 @@
+"""Pruebas de `almacen_documentos.py`. Ejecutar con `python -m pytest -q`."""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+
+import almacen_documentos
+from almacen_documentos import AlmacenDocumentos, EscrituraAsincrona
+
+
+def _almacen(tmp_path, **kwargs):
+    return AlmacenDocumentos(directorio=str(tmp_path), **kwargs)
+
+
+def test_escritura_asincrona_fuera_del_bucle(tmp_path, monkeypatch):
+    monkeypatch.setattr(almacen_documentos, "TROZO_ESCRITURA_ASYNC", 1000)
+    almacen = _almacen(tmp_path)
+    contenido = os.urandom(5_500)
+    hilos = []
+
+    async def guardar():
+        bucle = threading.get_ident()
+        escritura = await EscrituraAsincrona.abrir(almacen)
+        original = escritura.escritura.write
+        escritura.escritura.write = lambda datos: (hilos.append((threading.get_ident(), len(datos))), original(datos))
+        for i in range(0, len(contenido), 300):
+            await escritura.write(contenido[i:i + 300])
+        info = await escritura.confirmar("42", mime="application/pdf", tamano_esperado=len(contenido))
+        return bucle, info
+
+    bucle, info = asyncio.run(guardar())
+    # Se escribe por bloques de al menos TROZO_ESCRITURA_ASYNC, y nunca desde el bucle
+    assert all(hilo != bucle for hilo, _ in hilos)
+    assert [n for _, n in hilos] == [1200, 1200, 1200, 1200, 700]
+    assert info["sha256"] == hashlib.sha256(contenido).hexdigest()
+    assert almacen.buscar("42")["tamano"] == len(contenido)
+
+
+def test_escritura_asincrona_incompleta_no_se_publica(tmp_path):
+    almacen = _almacen(tmp_path)
+
+    async def cortada():
+        escritura = await EscrituraAsincrona.abrir(almacen)
+        await escritura.write(b"pdf a medias")
+        assert await escritura.confirmar("43", tamano_esperado=1000) is None
+        await escritura.descartar()
+
+    asyncio.run(cortada())
+    assert almacen.buscar("43") is None
+    assert os.listdir(almacen.dir_tmp) == []
+
+
+def _guardar(almacen, id_documento, contenido):
+    escritura = almacen.nueva_escritura()
+    escritura.write(contenido)
+    return escritura.confirmar(id_documento)
+
+
+def test_expulsion_lru_por_tamano(tmp_path, monkeypatch):
+    monkeypatch.setattr(almacen_documentos, "MARGEN_EXPULSION", 0)
+    almacen = _almacen(tmp_path, max_bytes=2500)
+    for i in (1, 2):
+        _guardar(almacen, i, bytes([i]) * 1000)
+    almacen.buscar(1)   # el 2 pasa a ser el menos usado
+    _guardar(almacen, 3, b"\x03" * 1000)
+    assert almacen.buscar(2) is None
+    assert almacen.buscar(1) is not None and almacen.buscar(3) is not None
+    assert almacen.estadisticas()["expulsados"] == 1
+
+
+def test_no_se_expulsa_un_blob_en_uso(tmp_path, monkeypatch):
+    monkeypatch.setattr(almacen_documentos, "MARGEN_EXPULSION", 0)
+    almacen = _almacen(tmp_path, max_bytes=2500)
+    _guardar(almacen, 1, b"\x01" * 1000)
+    _guardar(almacen, 2, b"\x02" * 1000)
+    info = almacen.buscar(1, fijar=True)
+    almacen.buscar(2)
+    # El 1 es el menos usado, pero se está leyendo: sale el 2
+    _guardar(almacen, 3, b"\x03" * 1000)
+    assert os.path.exists(info["ruta"]) and almacen.buscar(2) is None
+    assert almacen.estadisticas()["lecturas_en_curso"] == 1
+
+    # Todo en uso: se supera el presupuesto en lugar de borrar un fichero que se está leyendo
+    info3 = almacen.buscar(3, fijar=True)
+    _guardar(almacen, 4, b"\x04" * 1000)
+    assert almacen.buscar(1) is not None and almacen.buscar(3) is not None
+    assert almacen.estadisticas()["expulsiones_aplazadas"] == 1
+
+    almacen.soltar(info["lectura"])
+    almacen.soltar(info3["lectura"])
+    _guardar(almacen, 5, b"\x05" * 1000)
+    assert almacen.estadisticas()["bytes"] <= 2500
+
+
+def test_lecturas_caducadas_y_margen_de_uso_reciente(tmp_path, monkeypatch):
+    monkeypatch.setattr(almacen_documentos, "MARGEN_EXPULSION", 0)
+    monkeypatch.setattr(almacen_documentos, "LECTURA_MAX_SEGUNDOS", -1)
+    almacen = _almacen(tmp_path, max_bytes=1500)
+    _guardar(almacen, 1, b"\x01" * 1000)
+    # Un proceso que murió sin soltar la lectura no bloquea el blob para siempre
+    almacen.buscar(1, fijar=True)
+    _guardar(almacen, 2, b"\x02" * 1000)
+    assert almacen.buscar(1) is None
+
+    # Sin fijar, lo usado hace menos del margen tampoco se expulsa
+    monkeypatch.setattr(almacen_documentos, "MARGEN_EXPULSION", 300)
+    _guardar(almacen, 3, b"\x03" * 1000)
+    assert almacen.buscar(2) is not None
+
+
+def test_en_uso_suelta_al_salir(tmp_path):
+    almacen = _almacen(tmp_path)
+    _guardar(almacen, 7, b"bases")
+    with almacen.en_uso(7) as info:
+        assert almacen.estadisticas()["lecturas_en_curso"] == 1
+        with open(info["ruta"], "rb") as f:
+            assert f.read() == b"bases"
+    assert almacen.estadisticas()["lecturas_en_curso"] == 0
+
+
+class _Respuesta:
+    def __init__(self, estado, cuerpo=b"", cabeceras=None, cortar_tras=None):
+        self.status_code = estado
+        self.headers = {"Content-Type": "application/pdf", **(cabeceras or {})}
+        self._cuerpo = cuerpo
+        self._cortar_tras = cortar_tras
+
+    @property
+    def is_success(self):
+        return 200 <= self.status_code < 300
+
+    def iter_bytes_sync(self):
+        for i in range(0, len(self._cuerpo), 1000):
+            if self._cortar_tras is not None and i >= self._cortar_tras:
+                raise OSError("conexión cortada")
+            yield self._cuerpo[i:i + 1000]
+
+    def cerrar_sync(self):
+        pass
+
+
+class _BDNS:
+    """`abrir_stream_sync` de prueba: sirve `contenido` (con o sin Range) y corta la primera respuesta si se pide."""
+
+    def __init__(self, contenido, admite_rango=True, cortar_tras=None):
+        self.contenido = contenido
+        self.admite_rango = admite_rango
+        self.cortar_tras = cortar_tras
+        self.rangos = []
+
+    def abrir_stream_sync(self, url, headers=None):
+        rango = (headers or {}).get("Range")
+        self.rangos.append(rango)
+        cortar, self.cortar_tras = self.cortar_tras, None
+        total = len(self.contenido)
+        if rango and self.admite_rango:
+            inicio = int(rango.removeprefix("bytes=").rstrip("-"))
+            if inicio >= total:
+                return _Respuesta(416)
+            return _Respuesta(206, self.contenido[inicio:], {
+                "Content-Length": str(total - inicio), "Content-Range": f"bytes {inicio}-{total - 1}/{total}"})
+        return _Respuesta(200, self.contenido, {"Content-Length": str(total)}, cortar_tras=cortar)
+
+
+def _con_bdns(monkeypatch, bdns):
+    monkeypatch.setattr(almacen_documentos, "CLIENTE_BDNS", bdns)
+    return bdns
+
+
+def test_descarga_cortada_se_reanuda_con_range(tmp_path, monkeypatch):
+    contenido = os.urandom(10_000)
+    bdns = _con_bdns(monkeypatch, _BDNS(contenido, cortar_tras=4000))
+    almacen = _almacen(tmp_path)
+    info = almacen.obtener(5, nombre="bases.pdf")
+    assert bdns.rangos == [None, "bytes=4000-"]
+    assert info["sha256"] == hashlib.sha256(contenido).hexdigest()
+    assert info["bytes_descargados"] == 10_000 and almacen.estadisticas()["reanudadas"] == 1
+    assert not os.path.exists(os.path.join(almacen.dir_tmp, "5.part"))
+
+
+def test_part_que_no_cuadra_o_sin_soporte_de_range(tmp_path, monkeypatch):
+    contenido = os.urandom(3000)
+    almacen = _almacen(tmp_path)
+    # .part más largo que el documento actual: 416 y se empieza de cero
+    with open(os.path.join(almacen.dir_tmp, "6.part"), "wb") as f:
+        f.write(b"x" * 5000)
+    bdns = _con_bdns(monkeypatch, _BDNS(contenido))
+    assert almacen.obtener(6)["sha256"] == hashlib.sha256(contenido).hexdigest()
+    assert bdns.rangos == ["bytes=5000-", None]
+
+    # Servidor sin Range: responde 200 con el fichero entero y se descarta lo parcial
+    with open(os.path.join(almacen.dir_tmp, "7.part"), "wb") as f:
+        f.write(contenido[:1000])
+    bdns = _con_bdns(monkeypatch, _BDNS(contenido, admite_rango=False))
+    info = almacen.obtener(7)
+    assert bdns.rangos == ["bytes=1000-"]
+    assert info["sha256"] == hashlib.sha256(contenido).hexdigest() and info["tamano"] == 3000
+    assert almacen.estadisticas()["reanudadas"] == 0
+
+
+def _retener_lock(directorio, listo, segundos):
+    with AlmacenDocumentos(directorio=directorio)._lock_documento(8):
+        listo.set()
+        time.sleep(segundos)
+
+
+def test_lock_del_part_entre_procesos_e_hilos(tmp_path, monkeypatch):
+    almacen = _almacen(tmp_path)
+    contexto = multiprocessing.get_context("fork")
+    listo = contexto.Event()
+    otro = contexto.Process(target=_retener_lock, args=(str(tmp_path), listo, 0.3))
+    otro.start()
+    assert listo.wait(5)
+    inicio = time.monotonic()
+    with almacen._lock_documento(8):
+        assert time.monotonic() - inicio >= 0.2
+    otro.join()
+
+    # Dos hilos piden el mismo documento: una sola descarga
+    bdns = _con_bdns(monkeypatch, _BDNS(os.urandom(5000)))
+    hilos = [threading.Thread(target=almacen.obtener, args=(8,)) for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert bdns.rangos == [None]
+    assert os.listdir(almacen.dir_tmp) == []
@@ -0,0 +1,79 @@
+"""Pruebas de `cache_convocatorias.py`. Ejecutar con `python -m pytest -q`."""
+import threading
+import time
+
+import httpx
+
+from cache_convocatorias import CacheConvocatorias
+
+
+def _cache(tmp_path, **kwargs):
+    return CacheConvocatorias(ruta=str(tmp_path / "convocatorias.sqlite"), **kwargs)
+
+
+def _envejecer(cache, num_conv, segundos):
+    with cache._conexion() as con:
+        con.execute("UPDATE convocatorias SET guardado_en = guardado_en - ? WHERE num_conv = ?", (segundos, num_conv))
+
+
+def test_acierto_dentro_del_ttl_no_llama_al_origen(tmp_path):
+    cache = _cache(tmp_path, ttl=60, stale=60)
+    llamadas = []
+    cargar = lambda n: llamadas.append(n) or {"numConv": n}
+    assert cache.obtener("800001", cargar) == {"numConv": "800001"}
+    assert cache.obtener(" 800001 ", cargar) == {"numConv": "800001"}
+    assert llamadas == ["800001"]
+    stats = cache.estadisticas()
+    assert stats["fallos"] == 1 and stats["aciertos"] == 1 and stats["llamadas_ahorradas"] == 1
+
+
+def test_caducado_se_sirve_y_se_revalida_una_vez(tmp_path):
+    cache = _cache(tmp_path, ttl=10, stale=60)
+    cache.guardar("800002", {"version": 1})
+    _envejecer(cache, "800002", 20)
+    liberar, refrescado = threading.Event(), threading.Event()
+    llamadas = []
+
+    def cargar(n):
+        llamadas.append(n)
+        liberar.wait(5)
+        refrescado.set()
+        return {"version": 2}
+
+    # Mientras se revalida se sigue sirviendo el dato antiguo y no se lanza otra revalidación
+    assert cache.obtener("800002", cargar) == {"version": 1}
+    assert cache.obtener("800002", cargar) == {"version": 1}
+    liberar.set()
+    assert refrescado.wait(5)
+    for _ in range(100):
+        if cache.obtener("800002", cargar) == {"version": 2}:
+            break
+        time.sleep(0.01)
+    assert llamadas == ["800002"]
+    assert cache.estadisticas()["revalidaciones"] == 1
+
+
+def test_stale_if_error_fuera_de_la_ventana(tmp_path):
+    cache = _cache(tmp_path, ttl=10, stale=10)
+    cache.guardar("800003", {"version": 1})
+    _envejecer(cache, "800003", 100)
+
+    def caido(n):
+        raise httpx.ConnectTimeout("sin respuesta")
+
+    # Fuera de la ventana stale se va al origen; si falla, mejor el dato antiguo que nada
+    assert cache.obtener("800003", caido) == {"version": 1}
+    assert cache.obtener("800003", lambda n: None) == {"version": 1}
+    assert cache.obtener("800004", caido) is None
+    assert cache.estadisticas()["errores_origen"] == 3
+
+
+def test_expulsion_lru(tmp_path):
+    cache = _cache(tmp_path, max_entradas=2)
+    cache.guardar("1", {"n": 1})
+    cache.guardar("2", {"n": 2})
+    cache.obtener("1", lambda n: None)   # "1" pasa a ser el más reciente
+    cache.guardar("3", {"n": 3})
+    llamadas = []
+    assert cache.obtener("2", lambda n: llamadas.append(n)) is None
+    assert llamadas == ["2"] and cache.estadisticas()["entradas"] == 2
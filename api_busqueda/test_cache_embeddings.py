@@ -0,0 +1,32 @@
+"""Pruebas de `cache_embeddings.py`. Ejecutar con `python -m pytest -q`."""
+import numpy as np
+
+from cache_embeddings import CacheEmbeddings
+
+
+def _embeber_contando(llamadas):
+    def embeber(textos):
+        llamadas.append(list(textos))
+        return np.array([[len(t), t.count("a"), 1.0] for t in textos], dtype=np.float32)
+    return embeber
+
+
+def test_solo_se_embeben_los_que_faltan_en_un_lote(tmp_path):
+    cache = CacheEmbeddings("modelo/prueba", directorio=str(tmp_path))
+    llamadas = []
+    primero = cache.embeber(["Ley 38/2003", "cláusula", "Ley 38/2003"], _embeber_contando(llamadas))
+    assert llamadas == [["Ley 38/2003", "cláusula"]]
+    assert np.array_equal(primero[0], primero[2])
+
+    segundo = cache.embeber(["cláusula", " Ley  38/2003 ", "nuevo"], _embeber_contando(llamadas))
+    assert llamadas[-1] == ["nuevo"]
+    assert np.array_equal(segundo[0], primero[1]) and np.array_equal(segundo[1], primero[0])
+
+
+def test_persistencia_entre_instancias(tmp_path):
+    CacheEmbeddings("m", directorio=str(tmp_path)).embeber(["uno", "dos"], _embeber_contando([]))
+    llamadas = []
+    vectores = CacheEmbeddings("m", directorio=str(tmp_path)).embeber(["dos", "uno"], _embeber_contando(llamadas))
+    assert llamadas == []
+    assert vectores.tolist() == [[3, 0, 1], [3, 0, 1]]
+    assert CacheEmbeddings("otro", directorio=str(tmp_path)).dimension is None
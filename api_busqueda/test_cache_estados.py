@@ -0,0 +1,54 @@
+"""Pruebas de `cache_estados.py`. Ejecutar con `python -m pytest -q`."""
+import time
+from datetime import date
+
+from cache_estados import CacheEstados
+
+DETALLE = {"textFin": "Hasta el 31 de octubre de 2026", "anuncios": [], "documentos": [], "descripcion": "x"}
+
+
+def _cache(tmp_path, **kwargs):
+    return CacheEstados(ruta=str(tmp_path / "estados.sqlite"), **kwargs)
+
+
+def test_acierto_y_huella(tmp_path):
+    cache = _cache(tmp_path)
+    cache.guardar("800001", DETALLE, "abierta", regla="fecha_explicita_textFin", fecha_cierre=date(2026, 10, 31))
+    assert cache.obtener("800001", DETALLE, hoy=date(2026, 10, 18)) == "abierta"
+    # Un campo que no interviene en el estado no invalida
+    assert cache.obtener("800001", {**DETALLE, "descripcion": "otra"}, hoy=date(2026, 10, 18)) == "abierta"
+    # Cambia textFin: hay que recalcular, y la entrada se borra
+    assert cache.obtener("800001", {**DETALLE, "textFin": "Hasta agotar fondos"}, hoy=date(2026, 10, 18)) is None
+    assert cache.obtener("800001", DETALLE, hoy=date(2026, 10, 18)) is None
+    stats = cache.estadisticas()
+    assert stats["aciertos"] == 2 and stats["invalidadas_huella"] == 1 and stats["fallos"] == 1
+
+
+def test_abierta_caduca_al_pasar_la_fecha_de_cierre(tmp_path):
+    cache = _cache(tmp_path)
+    cache.guardar("800002", DETALLE, "abierta", regla="fecha_explicita_textFin", fecha_cierre=date(2026, 10, 31))
+    assert cache.obtener("800002", DETALLE, hoy=date(2026, 10, 31)) == "abierta"
+    assert cache.obtener("800002", DETALLE, hoy=date(2026, 11, 1)) is None
+    assert cache.estadisticas()["invalidadas_fecha"] == 1
+
+
+def test_caducidad_segun_como_se_decidio(tmp_path):
+    cache = _cache(tmp_path, ttl_desconocido=100, ttl_sin_fecha=200, ttl_cerrada=300)
+    ahora = time.time()
+    cache.guardar("1", DETALLE, "desconocido")
+    cache.guardar("2", DETALLE, "abierta", regla="llm")
+    cache.guardar("3", DETALLE, "cerrada", regla="frase_cierre")
+    cache.guardar("4", DETALLE, "cerrada", regla="fecha_fin_estructurada", fecha_cierre=date(2026, 1, 1))
+    cache.guardar("5", DETALLE, "abierta", regla="fecha_fin_estructurada", fecha_cierre=date(2026, 12, 1))
+    caducidades = dict(cache._conexion().execute("SELECT num_conv, caduca_en FROM estados").fetchall())
+    assert round(caducidades["1"] - ahora) == 100
+    assert round(caducidades["2"] - ahora) == 200
+    assert round(caducidades["3"] - ahora) == 300
+    # Decididas por datos estructurados: no caducan por tiempo
+    assert caducidades["4"] is None and caducidades["5"] is None
+
+    with cache._conexion() as con:
+        con.execute("UPDATE estados SET caduca_en = ? WHERE num_conv = '3'", (ahora - 1,))
+    assert cache.obtener("3", DETALLE) is None
+    assert cache.obtener("4", DETALLE) == "cerrada"
+    assert cache.estadisticas()["caducadas"] == 1
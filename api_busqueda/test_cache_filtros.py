@@ -0,0 +1,49 @@
+"""Pruebas de `cache_filtros.py`. Ejecutar con `python -m pytest -q`."""
+import numpy as np
+
+from cache_filtros import CacheFiltros
+
+# Embedder de prueba: consultas con las mismas palabras "de contenido" dan el mismo vector
+VOCABULARIO = ["ayudas", "autonomos", "madrid", "empresas", "jovenes"]
+
+
+def _embedder(texto):
+    vector = np.array([float(p in texto) for p in VOCABULARIO], dtype=np.float32)
+    return vector / max(np.linalg.norm(vector), 1e-9)
+
+
+def _cache(tmp_path, **kwargs):
+    return CacheFiltros(ruta=str(tmp_path / "filtros.sqlite"), embedder=_embedder, **kwargs)
+
+
+def test_exacto_semantico_y_guardia(tmp_path):
+    cache = _cache(tmp_path)
+    cache.guardar("Ayudas autónomos Madrid", {"regiones": [26]}, guardia=[26])
+    assert cache.obtener("  ayudas AUTONOMOS   madrid ", guardia=[26]) == {"regiones": [26]}
+    # Casi idéntica: acierto semántico
+    assert cache.obtener("ayudas para autonomos en madrid", guardia=[26]) == {"regiones": [26]}
+    # Misma similitud pero otra guardia (región o número distinto): no se reutiliza
+    assert cache.obtener("ayudas para autonomos en madrid", guardia=[71]) is None
+    assert cache.obtener("ayudas autonomos madrid 812345", guardia=[26]) is None
+    stats = cache.estadisticas()
+    assert (stats["aciertos_exactos"], stats["aciertos_semanticos"], stats["fallos"]) == (1, 1, 2)
+
+
+def test_devuelve_copias(tmp_path):
+    cache = _cache(tmp_path)
+    cache.guardar("ayudas jovenes", {"beneficiarios": [1]})
+    cache.obtener("ayudas jovenes")["beneficiarios"].append(2)
+    assert cache.obtener("ayudas jovenes") == {"beneficiarios": [1]}
+
+
+def test_compartida_entre_instancias_y_lru(tmp_path):
+    cache = _cache(tmp_path, max_entradas=2)
+    cache.guardar("ayudas autonomos", {"n": 1})
+    cache.guardar("ayudas empresas", {"n": 2})
+    # Otra instancia (otro worker) ve lo guardado y sus accesos cuentan para la LRU
+    otro_worker = _cache(tmp_path, max_entradas=2)
+    assert otro_worker.obtener("ayudas autonomos") == {"n": 1}
+    otro_worker.guardar("ayudas jovenes", {"n": 3})
+    assert len(cache) == 2
+    assert cache.obtener("ayudas empresas") is None
+    assert cache.obtener("ayudas autonomos") == {"n": 1}
@@ -0,0 +1,84 @@
+"""Pruebas de `clasificador_embeddings.py`. Ejecutar con `python -m pytest -q`."""
+import json
+
+import numpy as np
+
+from clasificador_embeddings import CATEGORIAS, ClasificadorMapas, calibrar_categoria, decidir
+
+UMBRAL = {"confianza": 0.5, "margen": 0.05, "ausencia": 0.3}
+OPCIONAL = {"maximo": 1, "obligatoria": False, "lista": False}
+VALORES = [10, 20, 30]
+
+
+def test_decidir_segura_ausente_o_dudosa():
+    assert decidir(np.array([0.7, 0.4, 0.1]), VALORES, OPCIONAL, UMBRAL) == (True, 10)
+    # Supera la confianza pero sin margen sobre la siguiente: decide el LLM
+    assert decidir(np.array([0.7, 0.68, 0.1]), VALORES, OPCIONAL, UMBRAL) == (False, None)
+    # Nada se parece: la consulta no habla de esta categoría
+    assert decidir(np.array([0.2, 0.1, 0.0]), VALORES, OPCIONAL, UMBRAL) == (True, None)
+    # Entre ausencia y confianza: dudosa
+    assert decidir(np.array([0.4, 0.1, 0.0]), VALORES, OPCIONAL, UMBRAL) == (False, None)
+    # Una categoría obligatoria nunca se da por ausente
+    assert decidir(np.array([0.2, 0.1, 0.0]), VALORES, {**OPCIONAL, "obligatoria": True}, UMBRAL) == (False, None)
+
+
+def test_decidir_lista_con_dos_valores():
+    conf = {"maximo": 2, "obligatoria": False, "lista": True}
+    valores = [[1], [2], [3]]
+    assert decidir(np.array([0.6, 0.7, 0.2]), valores, conf, UMBRAL) == (True, [2, 1])
+    # El segundo elegido tiene que sacar margen al siguiente
+    assert decidir(np.array([0.6, 0.57, 0.55]), valores, conf, UMBRAL) == (False, None)
+
+
+def test_calibrar_maximiza_cobertura_con_precision():
+    valores = list(CATEGORIAS["instrumentos"]["mapa"].values())
+    n = len(valores)
+
+    def caso(mejor, similitud, etiqueta):
+        similitudes = np.full(n, 0.2)
+        similitudes[mejor] = similitud
+        return similitudes, etiqueta
+
+    # Las similitudes altas aciertan; la de 0.55 se equivoca y las bajas son "ausente"
+    casos = [caso(0, 0.8, valores[0]), caso(1, 0.75, valores[1]), caso(0, 0.55, valores[1]),
+             caso(0, 0.25, None), caso(1, 0.22, None)]
+    umbral, metricas = calibrar_categoria(casos, "instrumentos", valores, precision_minima=1.0)
+    assert 0.55 < umbral["confianza"] <= 0.75 and umbral["ausencia"] > 0.25
+    assert metricas == {"cobertura": 0.8, "acierto": 1.0, "decididas": 4, "consultas": 5}
+    # Imposible llegar a la precisión pedida
+    assert calibrar_categoria([caso(0, 0.9, valores[1])], "instrumentos", valores)[0] is None
+
+
+def _embedder_lote(llamadas):
+    # Cada descripción es un eje: la similitud de la consulta con ella es su coordenada
+    def embeber(textos):
+        llamadas.append(len(textos))
+        return np.eye(len(textos), dtype=np.float32)
+    return embeber
+
+
+def test_matriz_y_umbrales_calibrados_persistidos(tmp_path):
+    rutas = {"ruta": str(tmp_path / "mapas.npz"), "ruta_umbrales": str(tmp_path / "umbrales.json")}
+    llamadas = []
+    clasificador = ClasificadorMapas(None, _embedder_lote(llamadas), "modelo", **rutas)
+    total = sum(len(c["mapa"]) for c in CATEGORIAS.values())
+    vector = np.zeros(total, dtype=np.float32)
+    vector[0] = 0.41   # primer tipo de beneficiario, por debajo de la confianza por defecto (0.42)
+    assert "tiposBeneficiario" in clasificador.clasificar("consulta", vector=vector)["dudosas"]
+
+    calibrado = {"confianza": 0.40, "margen": 0.04, "ausencia": 0.30}
+    clasificador.guardar_umbrales({"tiposBeneficiario": calibrado}, {"tiposBeneficiario": {"cobertura": 1.0}})
+    assert clasificador.clasificar("consulta", vector=vector)["valores"]["tiposBeneficiario"] == [1]
+
+    # Otro proceso: reutiliza la matriz y carga los umbrales calibrados
+    otro = ClasificadorMapas(None, _embedder_lote(llamadas), "modelo", **rutas)
+    assert otro.clasificar("consulta", vector=vector)["valores"]["tiposBeneficiario"] == [1]
+    assert llamadas == [total]
+
+    # Calibración de otro modelo: no vale para esta matriz
+    with open(rutas["ruta_umbrales"], encoding="utf-8") as f:
+        guardados = json.load(f)
+    with open(rutas["ruta_umbrales"], "w", encoding="utf-8") as f:
+        json.dump({**guardados, "huella": "otra"}, f)
+    nuevo = ClasificadorMapas(None, _embedder_lote([]), "modelo", **rutas)
+    assert "tiposBeneficiario" in nuevo.clasificar("consulta", vector=vector)["dudosas"]
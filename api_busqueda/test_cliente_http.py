@@ -0,0 +1,142 @@
+"""Pruebas de `cliente_http.py`. Ejecutar con `python -m pytest -q`."""
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+import cliente_http
+from cliente_http import ClienteBDNS
+from limitador import TokenBucket
+
+URL = "https://bdns.prueba/api/convocatorias"
+
+
+@pytest.fixture(autouse=True)
+def sin_esperas(monkeypatch):
+    monkeypatch.setattr(cliente_http, "_espera_backoff", lambda intento, respuesta=None: 0)
+    monkeypatch.setattr(cliente_http, "limitador_para", lambda host: TokenBucket(10_000, 10_000))
+
+
+def _cliente(manejador, **kwargs):
+    """ClienteBDNS real con un transporte simulado (`manejador(request)` async -> httpx.Response)."""
+    cliente = ClienteBDNS(**kwargs)
+
+    async def crear():
+        await cliente._cliente.aclose()
+        return httpx.AsyncClient(transport=httpx.MockTransport(manejador))
+
+    cliente._cliente = cliente._ejecutar(crear())
+    return cliente
+
+
+def test_reintenta_5xx_y_errores_de_conexion():
+    respuestas = [httpx.ConnectError("caída"), 503, 200]
+    llamadas = []
+
+    async def manejador(request):
+        llamadas.append(request.url.path)
+        siguiente = respuestas.pop(0)
+        if isinstance(siguiente, Exception):
+            raise siguiente
+        return httpx.Response(siguiente, json={"ok": siguiente == 200})
+
+    cliente = _cliente(manejador, reintentos=3)
+    assert cliente.get_sync(URL).json() == {"ok": True}
+    assert len(llamadas) == 3 and cliente.estadisticas["reintentos"] == 2
+    cliente.cerrar()
+
+
+def test_agotados_los_reintentos():
+    async def siempre_503(request):
+        return httpx.Response(503)
+
+    async def sin_conexion(request):
+        raise httpx.ConnectTimeout("sin respuesta")
+
+    cliente = _cliente(siempre_503, reintentos=2)
+    # Agotados los reintentos, el último 503 se devuelve tal cual
+    assert cliente.get_sync(URL).status_code == 503
+    assert cliente.estadisticas["peticiones"] == 3
+    cliente.cerrar()
+
+    cliente = _cliente(sin_conexion, reintentos=1)
+    with pytest.raises(httpx.ConnectTimeout):
+        cliente.get_sync(URL)
+    assert cliente.estadisticas["errores"] == 1
+    cliente.cerrar()
+
+
+def test_singleflight_comparte_peticiones_identicas():
+    llamadas = []
+
+    async def lento(request):
+        llamadas.append(str(request.url))
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"n": request.url.params.get("numConv")})
+
+    cliente = _cliente(lento)
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(cliente.get_sync(URL, params={"numConv": "1"}).json()))
+             for _ in range(5)]
+    hilos.append(threading.Thread(target=lambda: resultados.append(cliente.get_sync(URL, params={"numConv": "2"}).json())))
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert len(llamadas) == 2 and cliente.estadisticas["coalescidas"] == 4
+    assert sorted(r["n"] for r in resultados) == ["1"] * 5 + ["2"]
+    cliente.cerrar()
+
+
+def test_stream_libera_el_hueco_del_host():
+    async def pdf(request):
+        return httpx.Response(200, content=b"x" * 200_000)
+
+    cliente = _cliente(pdf, max_por_host=1)
+    semaforo = lambda: cliente._semaforos["bdns.prueba"]
+    r = cliente.abrir_stream_sync(URL)
+    assert semaforo().locked()
+    assert sum(len(t) for t in r.iter_bytes_sync()) == 200_000
+    assert not semaforo().locked()
+
+    # Cerrado sin leer el cuerpo (y dos veces): el hueco se libera una sola vez
+    r = cliente.abrir_stream_sync(URL)
+    r.cerrar_sync()
+    r.cerrar_sync()
+    assert cliente._semaforos["bdns.prueba"]._value == 1
+    cliente.cerrar()
+
+
+def test_stream_huerfano_se_cierra():
+    liberar = threading.Event()
+
+    async def lento(request):
+        while not liberar.is_set():
+            await asyncio.sleep(0.01)
+        return httpx.Response(200, content=b"pdf")
+
+    cliente = _cliente(lento, max_por_host=1)
+
+    async def pedir_y_desconectar():
+        tarea = asyncio.create_task(cliente.abrir_stream(URL))
+        await asyncio.sleep(0.05)
+        # El stream se abre en el bucle del cliente mientras este bucle está ocupado,
+        # y la petición se cancela antes de recibirlo
+        liberar.set()
+        time.sleep(0.2)
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+
+    asyncio.run(pedir_y_desconectar())
+    for _ in range(100):
+        if not cliente._semaforos["bdns.prueba"].locked():
+            break
+        time.sleep(0.01)
+    # El hueco del host no se pierde: el siguiente stream no se queda esperando
+    assert not cliente._semaforos["bdns.prueba"].locked()
+    r = cliente.abrir_stream_sync(URL)
+    assert b"".join(r.iter_bytes_sync()) == b"pdf"
+    cliente.cerrar()
@@ -0,0 +1,33 @@
+"""Pruebas de `embeddings_openai.py` con un cliente falso. Ejecutar con `python -m pytest -q`."""
+import types
+
+import httpx
+import openai
+
+import embeddings_openai
+from embeddings_openai import EmbedderOpenAI, lotes_por_tokens
+
+
+def test_lotes_por_tokens_y_entradas():
+    assert lotes_por_tokens([5, 5, 5, 5], max_tokens=10) == [[0, 1], [2, 3]]
+    assert lotes_por_tokens([1, 1, 1], max_tokens=10, max_entradas=2) == [[0, 1], [2]]
+    assert lotes_por_tokens([20, 1], max_tokens=10) == [[0], [1]]   # una entrada grande va sola
+
+
+def test_reintenta_429_y_conserva_el_orden(monkeypatch):
+    monkeypatch.setattr(embeddings_openai, "_codificador", lambda modelo: None)
+    llamadas = []
+
+    def crear(model, input):
+        llamadas.append(len(input))
+        if len(llamadas) == 1:
+            respuesta = httpx.Response(429, headers={"retry-after": "0"}, request=httpx.Request("POST", "http://x"))
+            raise openai.RateLimitError("429", response=respuesta, body=None)
+        datos = [types.SimpleNamespace(index=i, embedding=[float(len(t))]) for i, t in enumerate(input)]
+        return types.SimpleNamespace(data=datos[::-1])
+
+    cliente = types.SimpleNamespace(embeddings=types.SimpleNamespace(create=crear))
+    embedder = EmbedderOpenAI(cliente, "modelo", concurrencia=2, max_tokens_peticion=100)
+    textos = ["x" * (i * 10 + 1) for i in range(30)]
+    assert embedder.embed_documents(textos) == [[float(len(t))] for t in textos]
+    assert len(llamadas) > 2
@@ -0,0 +1,103 @@
+"""Pruebas de `espejo_bdns.py`. Ejecutar con `python -m pytest -q`."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from espejo_bdns import TODAS, EspejoBDNS
+
+CONVOCATORIAS = [
+    {"numeroConvocatoria": "800001", "fechaRecepcion": "2026-09-01", "descripcion": "Ayudas a la digitalización de pymes"},
+    {"numeroConvocatoria": "800002", "fechaRecepcion": "2026-09-15", "descripcion": "Rehabilitación de vivienda"},
+    {"numeroConvocatoria": "800003", "fechaRecepcion": "2026-10-01", "descripcion": "Digitalización del comercio"},
+]
+SEVILLA = {"800002", "800003"}
+
+
+class _Respuesta:
+    def __init__(self, datos, estado=200):
+        self._datos = datos
+        self.estado = estado
+
+    def raise_for_status(self):
+        if self.estado >= 400:
+            raise RuntimeError(f"HTTP {self.estado}")
+
+    def json(self):
+        return self._datos
+
+
+class _BDNS:
+    """`get` de prueba: pagina las convocatorias del filtro y registra los parámetros de cada petición."""
+
+    def __init__(self, convocatorias=CONVOCATORIAS, fallar=()):
+        self.convocatorias = convocatorias
+        self.fallar = fallar
+        self.peticiones = []
+
+    def __call__(self, url, params):
+        self.peticiones.append(params)
+        if params.get("regiones") in self.fallar:
+            return _Respuesta({}, estado=503)
+        filas = [c for c in self.convocatorias if "regiones" not in params or c["numeroConvocatoria"] in SEVILLA]
+        inicio = params["page"] * params["pageSize"]
+        return _Respuesta({"content": filas[inicio:inicio + params["pageSize"]],
+                           "totalPages": -(-len(filas) // params["pageSize"])})
+
+
+def _espejo(tmp_path, **kwargs):
+    return EspejoBDNS(ruta=str(tmp_path / "espejo.sqlite"), **kwargs)
+
+
+def _sincronizar(espejo, bdns, **kwargs):
+    espejo.sincronizar_particion(bdns, TODAS, "", page_size=2, **kwargs)
+    espejo.sincronizar_particion(bdns, "regiones", 71, page_size=2, **kwargs)
+
+
+def test_sin_cobertura_devuelve_none(tmp_path):
+    espejo = _espejo(tmp_path)
+    assert espejo.consultar({}) is None
+    _sincronizar(espejo, _BDNS())
+    # Región sin partición sincronizada: el llamador tiene que ir a la API
+    assert espejo.consultar({"regiones": [26]}) is None
+    assert espejo.estadisticas()["sin_cobertura"] == 2
+
+
+def test_consulta_por_region_y_texto(tmp_path):
+    espejo = _espejo(tmp_path)
+    bdns = _BDNS()
+    _sincronizar(espejo, bdns)
+    # Dos páginas de 2 para "todas"
+    assert [p["page"] for p in bdns.peticiones if "regiones" not in p] == [0, 1]
+    numeros = lambda filas: [c["numeroConvocatoria"] for c in filas]
+    assert numeros(espejo.consultar({})) == ["800003", "800002", "800001"]
+    assert numeros(espejo.consultar({"regiones": [71], "direccion": "asc"})) == ["800002", "800003"]
+    # FTS sin acentos; "alguna de las palabras" por defecto
+    assert numeros(espejo.consultar({"descripcion": "digitalizacion"})) == ["800003", "800001"]
+    assert numeros(espejo.consultar({"descripcion": "digitalización", "regiones": [71]})) == ["800003"]
+    assert espejo.consultar({"descripcion": "teletrabajo"}) == []
+
+
+def test_desactualizado_devuelve_none(tmp_path):
+    espejo = _espejo(tmp_path, max_antiguedad=3600)
+    _sincronizar(espejo, _BDNS())
+    with espejo._conexion() as con:
+        con.execute("UPDATE particiones SET ultima_sync = ultima_sync - 7200 WHERE categoria = ?", (TODAS,))
+    assert espejo.consultar({"regiones": [71]}) is None
+
+
+def test_incremental_y_particion_fallida_no_avanza(tmp_path):
+    espejo = _espejo(tmp_path)
+    bdns = _BDNS()
+    _sincronizar(espejo, bdns, dias_iniciales=30)
+    hoy = datetime.now().date()
+    assert bdns.peticiones[0]["fechaDesde"] == (hoy - timedelta(days=30)).strftime("%d/%m/%Y")
+    # La siguiente sincronización solo pide desde la marca (hoy)
+    bdns.peticiones.clear()
+    _sincronizar(espejo, bdns)
+    assert {p["fechaDesde"] for p in bdns.peticiones} == {hoy.strftime("%d/%m/%Y")}
+
+    roto = _BDNS(fallar=(26,))
+    with pytest.raises(RuntimeError):
+        espejo.sincronizar_particion(roto, "regiones", 26)
+    fila = espejo._conexion().execute("SELECT 1 FROM particiones WHERE categoria = 'regiones' AND valor = '26'")
+    assert fila.fetchone() is None
@@ -0,0 +1,26 @@
+"""Pruebas de `extraccion_pdf.py` con los PDFs de ejemplo de notebooks/. Ejecutar con `python -m pytest -q`."""
+import os
+
+import pytest
+
+from extraccion_pdf import CARPETA_BENCHMARK, extraer_paginas, numero_paginas
+
+PDF = os.path.join(CARPETA_BENCHMARK, "documento_1268535.pdf")
+pytestmark = pytest.mark.skipif(not os.path.exists(PDF), reason="sin PDFs de ejemplo")
+
+
+def test_salida_identica_con_cualquier_numero_de_workers():
+    serie = extraer_paginas(PDF, workers=1)
+    assert serie == extraer_paginas(PDF, workers=2, paginas_por_tarea=2)
+
+
+def test_paginas_numeradas_desde_uno_y_en_orden():
+    paginas = extraer_paginas(PDF, workers=1)
+    numeros = [n for n, _ in paginas]
+    assert numeros == sorted(numeros)
+    assert 1 <= numeros[0] and numeros[-1] <= numero_paginas(PDF)
+    assert all(texto.strip() for _, texto in paginas)
+
+
+def test_pdfplumber_como_backend():
+    assert extraer_paginas(PDF, backend="pdfplumber", workers=1)
@@ -0,0 +1,38 @@
+"""Pruebas de `gazetteer_regiones.py`. Ejecutar con `python -m pytest -q`."""
+from gazetteer_regiones import consulta_trivial, extraer_regiones, palabras_clave
+
+
+def test_nombre_mas_largo_gana():
+    assert extraer_regiones("ayudas en Sevilla") == [71]
+    assert extraer_regiones("ayudas Comunidad de Madrid") == [26]
+    assert extraer_regiones("subvenciones en Madrid") == [27]
+    assert extraer_regiones("Ciudad Autónoma de Ceuta") == [74]
+    # Como el LLM: como mucho dos regiones, en orden de aparición
+    assert extraer_regiones("ayudas Madrid y Barcelona y Sevilla") == [27, 50]
+
+
+def test_nombres_ambiguos_solo_con_pista_de_lugar():
+    assert extraer_regiones("ayudas Granada") == []
+    assert extraer_regiones("provincia de Granada") == [67]
+    assert extraer_regiones("cuenca minera") == []
+    assert extraer_regiones("ayudas en Cuenca") == [42]
+    assert extraer_regiones("la palma de la mano") == []
+    assert extraer_regiones("ayudas en La Palma") == [84]
+    # Agrupaciones NUTS que son palabras corrientes no se buscan
+    assert extraer_regiones("ayudas zona este") == []
+
+
+def test_consulta_trivial():
+    assert consulta_trivial("ayudas en Sevilla")
+    assert consulta_trivial("quiero ver convocatorias 812345")
+    # Hay filtros que deducir además de la región: decide el LLM
+    assert not consulta_trivial("ayudas para jóvenes en Madrid")
+    # Sin región ni número no basta con que todo sean palabras triviales
+    assert not consulta_trivial("ayudas")
+    # Un nombre ambiguo sin pista no es región, así que queda como palabra no trivial
+    assert not consulta_trivial("ayudas Granada")
+
+
+def test_palabras_clave_sin_regiones_ni_stopwords():
+    assert palabras_clave("Ayudas para jóvenes en Madrid") == "jóvenes"
+    assert palabras_clave("cuenca minera de León") == "cuenca minera león"
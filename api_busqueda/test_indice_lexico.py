@@ -0,0 +1,38 @@
+"""Pruebas de `indice_lexico.py`. Ejecutar con `python -m pytest -q`."""
+from indice_lexico import IndiceBM25, fusionar, seleccionar, tokenizar
+
+FRAGMENTOS = [
+    "El artículo 12 regula la justificación de la subvención.",
+    "Según la Ley 38/2003, de 17 de noviembre, General de Subvenciones.",
+    "El plazo de presentación de solicitudes es de 15 días hábiles.",
+    "Los beneficiarios deberán justificar los gastos antes del 30 de junio.",
+]
+
+
+def test_tokenizar_conserva_referencias():
+    terminos = tokenizar("Según el art. 12º de la Ley 38/2003, importe de 1.500,00 €")
+    assert "38/2003" in terminos and "12" in terminos and "1.500,00" in terminos
+    assert "el" not in terminos and "de" not in terminos
+    # Abreviatura, tildes y flexión llevan al mismo término
+    assert tokenizar("art.") == tokenizar("artículo") == tokenizar("articulos")
+
+
+def test_bm25_encuentra_referencias_exactas():
+    indice = IndiceBM25(FRAGMENTOS)
+    assert indice.buscar("¿Qué dice la Ley 38/2003?")[0][0] == 1
+    assert indice.buscar("art. 12")[0][0] == 0
+    assert {p for p, _ in indice.buscar("justificación")} == {0, 3}
+    assert indice.buscar("teletrabajo") == []
+
+
+def test_anadir_incremental_igual_que_de_una_vez():
+    incremental = IndiceBM25(FRAGMENTOS[:2])
+    incremental.anadir(FRAGMENTOS[2:])
+    assert incremental.buscar("plazo solicitudes") == IndiceBM25(FRAGMENTOS).buscar("plazo solicitudes")
+
+
+def test_fusion_con_menos_fragmentos_si_coinciden():
+    # Ambas búsquedas ponen primero el 7: los que solo aparecen en una quedan fuera
+    assert seleccionar(fusionar([7, 1, 2], [7, 5]), top_k=3) == [7]
+    # Sin coincidencias se mantienen los `top_k` mejores
+    assert len(seleccionar(fusionar([1, 2, 3], []), top_k=3)) == 3
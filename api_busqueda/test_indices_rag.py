@@ -0,0 +1,53 @@
+"""Pruebas de `indices_rag.py`. Ejecutar con `python -m pytest -q`."""
+import numpy as np
+import pytest
+
+import indices_rag
+from indices_rag import cargar_indice, clave_indice, guardar_indice, indice_documento, paginas_de_fragmentos
+
+
+def test_clave_depende_de_modelo_y_troceado():
+    base = clave_indice("abc", "modelo", 1000, 200)
+    assert base == clave_indice("abc", "modelo", 1000, 200)
+    assert base != clave_indice("abc", "otro", 1000, 200)
+    assert base != clave_indice("abc", "modelo", 500, 50)
+
+
+def test_guardar_y_cargar(tmp_path):
+    vectores = np.arange(6, dtype=np.float32).reshape(2, 3)
+    guardar_indice("k", vectores, ["uno", "dos"], [{"documento": "a"}] * 2, {"modelo": "m"}, directorio=str(tmp_path))
+    cargados, fragmentos, metadatos, meta = cargar_indice("k", directorio=str(tmp_path))
+    assert np.array_equal(cargados, vectores)
+    assert fragmentos == ["uno", "dos"] and metadatos[0] == {"documento": "a"} and meta == {"modelo": "m"}
+    assert cargar_indice("otra", directorio=str(tmp_path)) is None
+
+
+def _trocear(texto, tamano=40, solape=10):
+    return [texto[i:i + tamano] for i in range(0, len(texto), tamano - solape)]
+
+
+def test_pagina_de_cada_fragmento():
+    paginas = [(1, "a" * 50), (3, "b" * 30), (4, "c" * 45)]
+    fragmentos = _trocear("\n".join(t for _, t in paginas))
+    # Inicios: 0, 30 (pág. 1), 60 (pág. 3), 90, 120 (pág. 4)
+    assert paginas_de_fragmentos(paginas, fragmentos) == [1, 1, 3, 4, 4]
+
+
+def test_indice_documento_guarda_la_pagina(tmp_path, monkeypatch):
+    paginas = [(1, "Objeto de la convocatoria. " * 3), (2, "Plazo de presentación de solicitudes. " * 3)]
+    monkeypatch.setattr(indices_rag, "extraer_paginas", lambda ruta, progreso=None: paginas)
+    doc = {"ruta": str(tmp_path / "bases.pdf"), "nombreFic": "bases.pdf", "sha256": "abc"}
+    embeber = lambda fragmentos: np.ones((len(fragmentos), 2))
+    clave, _, fragmentos, metadatos = indice_documento(doc, "modelo", 40, 10, _trocear, embeber,
+                                                       directorio=str(tmp_path))
+    assert metadatos[0] == {"documento": "bases.pdf", "sha256": "abc", "pagina": 1}
+    assert metadatos[-1]["pagina"] == 2
+    esperadas = [m["pagina"] for m in metadatos]
+
+    # Índice guardado antes de las páginas: se completan al cargarlo, sin volver a embeber
+    indices_rag._actualizar_metadatos(clave, [{"documento": "bases.pdf", "sha256": "abc"}] * len(fragmentos),
+                                      directorio=str(tmp_path))
+    sin_embeber = lambda fragmentos: pytest.fail("no se debe volver a embeber")
+    _, _, _, metadatos = indice_documento(doc, "modelo", 40, 10, _trocear, sin_embeber, directorio=str(tmp_path))
+    assert [m["pagina"] for m in metadatos] == esperadas
+    assert cargar_indice(clave, directorio=str(tmp_path))[2] == metadatos
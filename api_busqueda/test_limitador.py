@@ -0,0 +1,61 @@
+"""Pruebas de `limitador.py`. Ejecutar con `python -m pytest -q`."""
+import asyncio
+import threading
+import time
+
+import limitador
+from limitador import TokenBucket, limitador_para
+
+
+class _Reloj:
+    """Sustituye a `time.monotonic` para avanzar el tiempo a mano."""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+def test_rafaga_y_esperas_escalonadas(monkeypatch):
+    reloj = _Reloj()
+    monkeypatch.setattr(limitador.time, "monotonic", reloj)
+    cubo = TokenBucket(tasa=2, capacidad=3)
+    # La ráfaga sale sin esperar; después cada llamada reserva su hueco (0.5 s a 2/s)
+    assert [cubo.reservar() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert [cubo.reservar() for _ in range(3)] == [0.5, 1.0, 1.5]
+    # Al pasar el tiempo se recuperan fichas, nunca más allá de la capacidad
+    reloj.ahora += 100
+    assert [cubo.reservar() for _ in range(4)] == [0.0, 0.0, 0.0, 0.5]
+
+
+def test_tasa_sostenida_entre_hilos():
+    cubo = TokenBucket(tasa=50, capacidad=1)
+    inicio = time.monotonic()
+    hilos = [threading.Thread(target=cubo.esperar) for _ in range(11)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    # 1 de ráfaga + 10 a 50/s: al menos 0.2 s aunque se lancen a la vez
+    assert time.monotonic() - inicio >= 0.19
+
+
+def test_esperar_async_comparte_cubo():
+    cubo = TokenBucket(tasa=100, capacidad=1)
+
+    async def varias():
+        inicio = time.monotonic()
+        await asyncio.gather(*(cubo.esperar_async() for _ in range(6)))
+        return time.monotonic() - inicio
+
+    assert asyncio.run(varias()) >= 0.045
+
+
+def test_un_cubo_por_host(monkeypatch):
+    monkeypatch.setattr(limitador, "_limitadores", {})
+    a = limitador_para("https://www.infosubvenciones.es/bdnstrans/api/convocatorias?numConv=1")
+    assert a is limitador_para("www.infosubvenciones.es")
+    assert (a.tasa, a.capacidad) == limitador.LIMITES_POR_HOST["www.infosubvenciones.es"]
+    otro = limitador_para("https://ejemplo.org/x")
+    assert otro is not a and (otro.tasa, otro.capacidad) == limitador.LIMITE_POR_DEFECTO
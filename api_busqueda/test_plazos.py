@@ -0,0 +1,134 @@
+"""Pruebas del motor de reglas de plazos (`plazos.py`). Ejecutar con `python -m pytest -q`."""
+from datetime import date
+
+from plazos import (
+    calcular_plazo_relativo,
+    decidir_estado,
+    es_habil,
+    extraer_fechas,
+    festivos_nacionales,
+    sumar_dias_habiles,
+    sumar_dias_naturales,
+    sumar_meses,
+)
+
+HOY = date(2026, 10, 18)
+
+
+# ---------- calendario ----------
+def test_viernes_santo_es_festivo():
+    # Domingo de Pascua: 20/04/2025 y 05/04/2026
+    assert date(2025, 4, 18) in festivos_nacionales(2025)
+    assert date(2026, 4, 3) in festivos_nacionales(2026)
+    assert not es_habil(date(2026, 4, 3))
+
+
+def test_fin_de_semana_y_festivos_fijos_no_son_habiles():
+    assert not es_habil(date(2026, 10, 17))  # sábado
+    assert not es_habil(date(2026, 10, 12))  # Fiesta Nacional
+    assert es_habil(date(2026, 10, 13))
+
+
+def test_sumar_dias_habiles_salta_semana_santa():
+    assert sumar_dias_habiles(date(2025, 3, 20), 20) == date(2025, 4, 17)
+    assert sumar_dias_habiles(date(2025, 4, 16), 2) == date(2025, 4, 21)
+
+
+def test_sumar_dias_naturales_traslada_a_habil():
+    # 10 días desde el 2 de octubre de 2026 caen en lunes 12 (festivo) -> martes 13
+    assert sumar_dias_naturales(date(2026, 10, 2), 10) == date(2026, 10, 13)
+
+
+def test_sumar_meses():
+    assert sumar_meses(date(2025, 3, 20), 1) == date(2025, 4, 21)  # 20/04 es domingo
+    assert sumar_meses(date(2025, 1, 31), 1) == date(2025, 2, 28)
+
+
+# ---------- extracción ----------
+def test_extraer_fechas_formatos():
+    texto = "del 1 de marzo de 2026 al 31-03-2026; corrección 2026-04-02 y 5/4/26"
+    assert extraer_fechas(texto) == [date(2026, 3, 1), date(2026, 3, 31), date(2026, 4, 5), date(2026, 4, 2)]
+
+
+def test_extraer_fechas_ignora_normas_citadas():
+    assert extraer_fechas("Ley 38/2003, de 17 de noviembre, General de Subvenciones", date(2026, 1, 1)) == []
+
+
+def test_extraer_fechas_solo_cierre():
+    texto = "Desde el 1 de enero de 2026 hasta el 15 de marzo de 2026"
+    assert extraer_fechas(texto, contexto="cierre") == [date(2026, 3, 15)]
+
+
+def test_plazo_relativo_desde_publicacion_citada():
+    texto = "Quince días hábiles desde el día siguiente a la publicación del extracto en el BOE de 10 de octubre de 2026"
+    assert calcular_plazo_relativo(texto, date(2026, 1, 1)) == date(2026, 11, 2)
+
+
+def test_diario_no_es_plazo_en_dias():
+    assert calcular_plazo_relativo("publicado en un diario oficial", date(2026, 10, 1)) is None
+
+
+# ---------- motor de reglas ----------
+def test_fecha_de_inicio_no_es_cierre():
+    decision = decidir_estado({"textFin": "Desde el 1 de enero de 2026 hasta agotar fondos"}, HOY)
+    assert decision["estado"] == "abierta"
+    assert decision["regla"] == "agotar_fondos"
+
+
+def test_fecha_de_publicacion_no_es_cierre():
+    dic = {
+        "textFin": "Quince días hábiles desde el día siguiente a la publicación del extracto "
+                   "en el BOE de 10 de octubre de 2026",
+        "fechaRecepcion": "2026-10-09",
+    }
+    decision = decidir_estado(dic, HOY)
+    assert decision["estado"] == "abierta"
+    assert decision["regla"] == "plazo_relativo"
+    assert decision["fecha_cierre"] == date(2026, 11, 2)
+
+
+def test_diario_oficial_no_decide():
+    dic = {"textFin": "El extracto se ha publicado en un diario oficial", "fechaRecepcion": "2026-10-01"}
+    assert decidir_estado(dic, HOY)["estado"] is None
+
+
+def test_fecha_de_cierre_explicita():
+    assert decidir_estado({"textFin": "Hasta el 15 de marzo de 2026"}, HOY)["estado"] == "cerrada"
+    decision = decidir_estado({"textFin": "Del 1 al 31 de diciembre de 2026"}, HOY)
+    assert decision["estado"] == "abierta"
+    assert decision["fecha_cierre"] == date(2026, 12, 31)
+
+
+def test_fecha_fin_estructurada_y_concesion_directa():
+    assert decidir_estado({"fechaFinSolicitud": "2026-10-17"}, HOY)["regla"] == "fecha_fin_estructurada"
+    assert decidir_estado({"fechaFinSolicitud": "2026-10-17"}, HOY)["estado"] == "cerrada"
+    assert decidir_estado({"tipoConvocatoria": "Concesión directa - instrumental"}, HOY)["estado"] == "cerrada-no-publica"
+
+
+def test_frase_de_cierre_en_documentos():
+    dic = {"documentos": [{"descripcion": "Resolución de cierre del plazo"}]}
+    assert decidir_estado(dic, HOY)["regla"] == "frase_cierre"
+
+
+# ---------- plazos relativos que no son de presentación ----------
+def test_plazo_de_otro_tramite_no_cuenta():
+    assert calcular_plazo_relativo("La solicitud se resolverá en 30 días", date(2026, 10, 1)) is None
+    assert calcular_plazo_relativo("Justificación: tres meses desde el pago", date(2026, 10, 1)) is None
+
+
+def test_plazo_de_presentacion_antes_que_otros_dias():
+    # El plazo en meses es el de presentación; los 30 días son de resolución
+    texto = "Un mes desde la publicación del extracto. La resolución se notificará en 30 días."
+    assert calcular_plazo_relativo(texto, date(2026, 3, 2)) == date(2026, 4, 2)
+    texto = "Se resolverá en el plazo de 30 días; el plazo de presentación de solicitudes será de dos meses"
+    assert calcular_plazo_relativo(texto, date(2026, 3, 2), exigir_pista=True) == date(2026, 5, 4)
+
+
+def test_anuncio_sin_pista_de_presentacion_no_decide():
+    dic = {"anuncios": [{"titulo": "Corrección", "texto": "Se amplía en 30 días la ejecución de los proyectos"},
+                        {"titulo": "Ampliación", "texto": "El importe se abonará en 15 días"}],
+           "fechaRecepcion": "2026-01-10"}
+    assert decidir_estado(dic, HOY)["estado"] is None
+    dic["anuncios"].append({"titulo": "Extracto", "texto": "Plazo de presentación de solicitudes: 20 días hábiles"})
+    assert decidir_estado(dic, HOY) == {"estado": "cerrada", "regla": "plazo_relativo",
+                                        "fecha_cierre": date(2026, 2, 6)}
@@ -0,0 +1,66 @@
+"""Pruebas de `registro_indices.py`. Ejecutar con `python -m pytest -q`."""
+import numpy as np
+import pytest
+
+from indices_rag import guardar_indice
+from registro_indices import RegistroIndices
+
+
+def _registro(tmp_path, max_bytes=10 ** 9):
+    # Backend de prueba: el "objeto de búsqueda" es la matriz de vectores
+    return RegistroIndices(lambda v, f, m: np.array(v), lambda o, v, f, m: np.concatenate([o, v]),
+                           directorio=str(tmp_path / "registro"), max_bytes=max_bytes,
+                           dir_indices=str(tmp_path / "indices"))
+
+
+def _parte(tmp_path, clave, n):
+    vectores = np.full((n, 4), len(clave), dtype=np.float32)
+    fragmentos = [f"{clave}-{i}" for i in range(n)]
+    metadatos = [{"sha256": clave}] * n
+    guardar_indice(clave, vectores, fragmentos, metadatos, {}, directorio=str(tmp_path / "indices"))
+    return clave, vectores, fragmentos, metadatos
+
+
+def test_anadir_incremental_e_ignora_repetidos(tmp_path):
+    registro = _registro(tmp_path)
+    registro.anadir_documentos("conv-1", [_parte(tmp_path, "a", 2)])
+    indice = registro.anadir_documentos("conv-1", [_parte(tmp_path, "a", 2), _parte(tmp_path, "bb", 3)])
+    assert indice.claves == ["a", "bb"]
+    assert indice.objeto.shape == (5, 4) and len(indice.fragmentos) == 5
+    assert registro.obtener("conv-1") is indice
+    # Sin índice por defecto: nunca se responde con el último que se usó
+    with pytest.raises(ValueError):
+        registro.obtener(None)
+    assert "ultimo" not in registro.estadisticas()
+
+
+def test_lru_y_recarga_desde_disco(tmp_path):
+    registro = _registro(tmp_path, max_bytes=100)
+    registro.anadir_documentos("uno", [_parte(tmp_path, "a", 3)])
+    registro.anadir_documentos("dos", [_parte(tmp_path, "bb", 3)])
+    assert list(registro.estadisticas()["en_memoria"]) == ["dos"]
+
+    # Otro proceso (registro nuevo) recarga el índice a partir de la lista persistida
+    recargado = _registro(tmp_path).obtener("uno")
+    assert recargado.fragmentos == ["a-0", "a-1", "a-2"] and recargado.objeto.shape == (3, 4)
+    assert registro.obtener("no-existe") is None
+
+
+def test_id_no_valido(tmp_path):
+    with pytest.raises(ValueError):
+        _registro(tmp_path).anadir_documentos("../fuera", [])
+
+
+def test_recuperar_lexico_no_usa_busqueda_densa(tmp_path):
+    registro = _registro(tmp_path)
+    clave, vectores, _, metadatos = _parte(tmp_path, "a", 2)
+    indice = registro.anadir_documentos("conv", [(clave, vectores, ["Ley 38/2003 de Subvenciones", "Plazo de 15 días"],
+                                                  metadatos)])
+
+    def sin_denso(k):
+        raise AssertionError("el modo léxico no debe calcular el embedding de la pregunta")
+
+    assert indice.recuperar("ley 38/2003", 3, sin_denso, modo="lexico") == [0]
+    assert indice.recuperar("plazo", 3, lambda k: [1, 0], modo="hibrido") == [1]
+    with pytest.raises(ValueError):
+        indice.recuperar("plazo", 3, sin_denso, modo="otro")
@@ -0,0 +1,64 @@
+"""Pruebas de `subida_documentos.py`. Ejecutar con `python -m pytest -q`."""
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from almacen_documentos import AlmacenDocumentos
+from subida_documentos import SubidaDemasiadoGrande, SubidaNoValida, recibir_documento
+
+FRONTERA = "xYzFrontera"
+
+
+class _Peticion:
+    """Lo que usa `recibir_documento` de una Request de Starlette: cabeceras y `stream()`."""
+
+    def __init__(self, cuerpo, trozo=1000, content_length=True):
+        self.headers = {"content-type": f"multipart/form-data; boundary={FRONTERA}"}
+        if content_length:
+            self.headers["content-length"] = str(len(cuerpo))
+        self._trozos = [cuerpo[i:i + trozo] for i in range(0, len(cuerpo), trozo)]
+
+    async def stream(self):
+        for trozo in self._trozos:
+            yield trozo
+
+
+def _formulario(contenido, nombre="bases.pdf", indice=None):
+    partes = []
+    if indice is not None:
+        partes.append(f'--{FRONTERA}\r\nContent-Disposition: form-data; name="indice"\r\n\r\n{indice}\r\n'.encode())
+    partes.append(f'--{FRONTERA}\r\nContent-Disposition: form-data; name="file"; filename="{nombre}"\r\n'
+                  f'Content-Type: application/pdf\r\n\r\n'.encode() + contenido + b"\r\n")
+    return b"".join(partes) + f"--{FRONTERA}--\r\n".encode()
+
+
+def test_guarda_por_hash_con_campos(tmp_path):
+    almacen = AlmacenDocumentos(directorio=str(tmp_path))
+    contenido = os.urandom(50_000)
+    info, campos = asyncio.run(recibir_documento(_Peticion(_formulario(contenido, indice="conv-1")), almacen))
+    assert info["sha256"] == hashlib.sha256(contenido).hexdigest()
+    assert info["nombre"] == "bases.pdf" and info["mime"] == "application/pdf"
+    assert campos == {"indice": "conv-1"}
+    with open(info["ruta"], "rb") as f:
+        assert f.read() == contenido
+
+
+def test_demasiado_grande_no_deja_nada(tmp_path):
+    almacen = AlmacenDocumentos(directorio=str(tmp_path))
+    cuerpo = _formulario(b"x" * 5000)
+    # Sin Content-Length se corta al pasar del máximo mientras se lee
+    with pytest.raises(SubidaDemasiadoGrande):
+        asyncio.run(recibir_documento(_Peticion(cuerpo, content_length=False), almacen, max_bytes=1000))
+    assert os.listdir(almacen.dir_tmp) == []
+    # Con Content-Length se rechaza antes de leer
+    with pytest.raises(SubidaDemasiadoGrande):
+        asyncio.run(recibir_documento(_Peticion(cuerpo + b" " * 70_000), almacen, max_bytes=1000))
+
+
+def test_sin_fichero(tmp_path):
+    almacen = AlmacenDocumentos(directorio=str(tmp_path))
+    cuerpo = f'--{FRONTERA}\r\nContent-Disposition: form-data; name="indice"\r\n\r\nx\r\n--{FRONTERA}--\r\n'.encode()
+    with pytest.raises(SubidaNoValida):
+        asyncio.run(recibir_documento(_Peticion(cuerpo), almacen))
@@ -0,0 +1,64 @@
+"""Pruebas de `trabajos_ingesta.py`. Ejecutar con `python -m pytest -q`."""
+import threading
+import time
+
+from trabajos_ingesta import GestorTrabajos
+
+
+def _esperar(gestor, trabajo_id, estados=("completado", "error")):
+    for _ in range(200):
+        estado = gestor.obtener(trabajo_id)
+        if estado["estado"] in estados:
+            return estado
+        time.sleep(0.01)
+    raise AssertionError(f"El trabajo no terminó: {estado}")
+
+
+def test_progreso_e_indice_al_completar():
+    liberar = threading.Event()
+
+    def procesar(documentos, indice_id=None, progreso=None):
+        progreso("paginas", 10, 10)
+        progreso("fragmentos", 3, 12)
+        liberar.wait(5)
+        progreso("fragmentos", 12, 12)
+        return indice_id or f"doc-{documentos[0]['sha256']}"
+
+    gestor = GestorTrabajos(procesar, workers=1)
+    trabajo = gestor.enviar({"id": "1", "nombreFic": "a.pdf", "sha256": "abc"})
+    estado = _esperar(gestor, trabajo.id, estados=("embebiendo",))
+    assert estado["paginas_extraidas"] == 10 and estado["fragmentos_total"] == 12
+    assert estado["eta_segundos"] is not None
+
+    liberar.set()
+    estado = _esperar(gestor, trabajo.id)
+    assert estado["estado"] == "completado" and estado["indice"] == "doc-abc"
+    gestor.cerrar()
+
+
+def test_mismo_fichero_se_une_al_trabajo_en_curso():
+    liberar = threading.Event()
+    llamadas = []
+
+    def procesar(documentos, indice_id=None, progreso=None):
+        llamadas.append(documentos[0]["sha256"])
+        liberar.wait(5)
+        return "idx"
+
+    gestor = GestorTrabajos(procesar, workers=2)
+    primero = gestor.enviar({"id": "1", "nombreFic": "a.pdf", "sha256": "abc"})
+    segundo = gestor.enviar({"id": "2", "nombreFic": "copia.pdf", "sha256": "abc"})
+    otro = gestor.enviar({"id": "3", "nombreFic": "b.pdf", "sha256": "def"})
+    assert segundo is primero and otro is not primero
+    liberar.set()
+    _esperar(gestor, primero.id)
+    _esperar(gestor, otro.id)
+    assert sorted(llamadas) == ["abc", "def"]
+    gestor.cerrar()
+
+
+def test_error_sin_texto():
+    gestor = GestorTrabajos(lambda documentos, indice_id=None, progreso=None: None, workers=1)
+    estado = _esperar(gestor, gestor.enviar({"id": "1", "nombreFic": "vacio.pdf", "sha256": "x"}).id)
+    assert estado["estado"] == "error" and estado["error"]
+    gestor.cerrar()
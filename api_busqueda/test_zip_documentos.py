@@ -0,0 +1,55 @@
+"""Pruebas de `zip_documentos.py`. Ejecutar con `python -m pytest -q`."""
+import asyncio
+import io
+import os
+import zipfile
+from contextlib import contextmanager
+
+from zip_documentos import zip_en_streaming
+
+
+class _Almacen:
+    """`en_uso` de prueba: documentos en `tmp_path`; el resto falla o no está completo."""
+
+    def __init__(self, tmp_path, contenidos, fallos=()):
+        self.rutas = {}
+        self.fallos = fallos
+        for id_documento, contenido in contenidos.items():
+            ruta = tmp_path / f"{id_documento}.bin"
+            ruta.write_bytes(contenido)
+            self.rutas[id_documento] = str(ruta)
+
+    @contextmanager
+    def en_uso(self, id_documento, nombre=None):
+        if id_documento in self.fallos:
+            raise OSError("conexión cortada")
+        ruta = self.rutas.get(id_documento)
+        yield {"ruta": ruta} if ruta else None
+
+
+def _zip(docs, almacen, **kwargs):
+    async def juntar():
+        return b"".join([trozo async for trozo in zip_en_streaming(docs, almacen, **kwargs)])
+    return zipfile.ZipFile(io.BytesIO(asyncio.run(juntar())))
+
+
+def test_zip_con_todos_los_documentos(tmp_path):
+    pdf, texto = os.urandom(700_000), b"bases " * 50_000
+    almacen = _Almacen(tmp_path, {1: pdf, 2: texto})
+    z = _zip([{"id": 1, "name": "bases.pdf"}, {"id": 2, "name": "extracto.txt"}], almacen, prefetch=1)
+    assert z.testzip() is None
+    assert z.read("bases.pdf") == pdf and z.read("extracto.txt") == texto
+    # Los PDF van sin recomprimir
+    assert z.getinfo("bases.pdf").compress_type == zipfile.ZIP_STORED
+    assert z.getinfo("extracto.txt").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_documentos_fallidos_o_incompletos_se_omiten(tmp_path):
+    # 2: la BDNS corta y se agotan los reintentos; 3: no llega entero (el almacén no lo publica)
+    almacen = _Almacen(tmp_path, {1: b"uno", 4: b"cuatro"}, fallos=(2,))
+    docs = [{"id": i, "name": f"doc{i}.pdf"} for i in (1, 2, 3, 4)]
+    z = _zip(docs, almacen)
+    # Ningún miembro truncado: solo los documentos completos, y el ZIP es válido
+    assert z.testzip() is None
+    assert z.namelist() == ["doc1.pdf", "doc4.pdf"]
+    assert z.read("doc4.pdf") == b"cuatro"
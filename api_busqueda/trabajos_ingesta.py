@@ -0,0 +1,140 @@
+"""
+Ingesta de documentos para el RAG en segundo plano.
+
+`/procesar_documento` extraía el texto y calculaba los embeddings dentro de la
+petición (y desde un `async def`, bloqueando el bucle de eventos para todos los
+usuarios). Ahora solo guarda el fichero y encola un trabajo:
+- los trabajos se ejecutan en un pool de hilos acotado (`INGESTA_WORKERS`);
+- cada trabajo expone su estado y avance (páginas extraídas, fragmentos
+  embebidos, ETA de la etapa en curso) para consultarlo con `/trabajos/{id}`;
+- al terminar, el índice queda registrado (`REGISTRO_INDICES`) y su id se
+  devuelve en el estado;
+- enviar otra vez el mismo fichero (mismo SHA-256 e índice) mientras se procesa
+  devuelve el trabajo en curso en lugar de repetir el trabajo.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# ======== CONFIGURACIÓN ========
+INGESTA_WORKERS = int(os.getenv("INGESTA_WORKERS", "2"))
+INGESTA_MAX_HISTORIAL = int(os.getenv("INGESTA_MAX_HISTORIAL", "200"))   # trabajos terminados que se recuerdan
+
+PENDIENTE, EXTRAYENDO, EMBEBIENDO, COMPLETADO, ERROR = "pendiente", "extrayendo", "embebiendo", "completado", "error"
+TERMINADOS = (COMPLETADO, ERROR)
+
+
+class Trabajo:
+    def __init__(self, documento, indice):
+        self.id = uuid.uuid4().hex
+        self.documento = documento
+        self.indice = indice
+        self.estado = PENDIENTE
+        self.paginas = [0, 0]        # [extraídas, total]
+        self.fragmentos = [0, 0]     # [embebidos, total]
+        self.creado_en = time.time()
+        self.iniciado_en = None
+        self.inicio_etapa = None
+        self.ultimo_aviso = None
+        self.terminado_en = None
+        self.error = None
+        self.envios = 1
+
+    def progreso(self, etapa, hechos, total):
+        # Callback de `indice_documento`: ("paginas" | "fragmentos", hechos, total)
+        nuevo = EXTRAYENDO if etapa == "paginas" else EMBEBIENDO
+        if self.estado != nuevo:
+            # La etapa empezó con el aviso anterior (o al arrancar), no con este
+            self.estado, self.inicio_etapa = nuevo, self.ultimo_aviso or self.iniciado_en
+        self.ultimo_aviso = time.time()
+        (self.paginas if etapa == "paginas" else self.fragmentos)[:] = [hechos, total]
+
+    def _eta(self):
+        # Tiempo restante de la etapa en curso al ritmo observado en ella
+        hechos, total = self.paginas if self.estado == EXTRAYENDO else self.fragmentos
+        if self.estado not in (EXTRAYENDO, EMBEBIENDO) or not hechos:
+            return None
+        return round((time.time() - self.inicio_etapa) / hechos * (total - hechos), 1)
+
+    def a_dict(self):
+        fin = self.terminado_en or time.time()
+        return {
+            "trabajo": self.id,
+            "estado": self.estado,
+            "documento": self.documento.get("nombreFic"),
+            "sha256": self.documento.get("sha256"),
+            "indice": self.indice,
+            "paginas_extraidas": self.paginas[0], "paginas_total": self.paginas[1],
+            "fragmentos_embebidos": self.fragmentos[0], "fragmentos_total": self.fragmentos[1],
+            "eta_segundos": self._eta(),
+            "segundos": round(fin - self.iniciado_en, 1) if self.iniciado_en else None,
+            "en_cola_segundos": round((self.iniciado_en or fin) - self.creado_en, 1),
+            "envios": self.envios,
+            "error": self.error,
+        }
+
+
+class GestorTrabajos:
+    """Cola de ingesta: `procesar(documentos, indice_id=, progreso=) -> indice_id` en un pool acotado."""
+
+    def __init__(self, procesar, workers=INGESTA_WORKERS, max_historial=INGESTA_MAX_HISTORIAL):
+        self._procesar = procesar
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingesta")
+        self._trabajos = OrderedDict()
+        self._en_curso = {}          # (sha256, indice) -> trabajo sin terminar
+        self._lock = threading.Lock()
+        self.max_historial = max_historial
+
+    def enviar(self, documento, indice=None):
+        """Encola `documento` (dict con 'id', 'nombreFic', 'ruta', 'sha256') o devuelve el trabajo en curso del mismo fichero."""
+        clave = (documento["sha256"], indice)
+        with self._lock:
+            trabajo = self._en_curso.get(clave)
+            if trabajo is not None:
+                trabajo.envios += 1
+                print(f"🔁 {documento.get('nombreFic')} ya se está procesando (trabajo {trabajo.id})")
+                return trabajo
+            trabajo = Trabajo(documento, indice)
+            self._trabajos[trabajo.id] = trabajo
+            self._en_curso[clave] = trabajo
+            self._olvidar_terminados()
+        self._pool.submit(self._ejecutar, trabajo, clave)
+        return trabajo
+
+    def _ejecutar(self, trabajo, clave):
+        trabajo.iniciado_en = time.time()
+        try:
+            indice_id = self._procesar([trabajo.documento], indice_id=trabajo.indice, progreso=trabajo.progreso)
+            if indice_id is None:
+                raise ValueError("No se pudo extraer texto del documento")
+            trabajo.indice, trabajo.estado = indice_id, COMPLETADO
+            print(f"✅ Trabajo {trabajo.id}: {trabajo.documento.get('nombreFic')} en el índice {indice_id} "
+                  f"({time.time() - trabajo.iniciado_en:.1f}s)")
+        except Exception as e:
+            trabajo.estado, trabajo.error = ERROR, str(e)
+            print(f"❌ Trabajo {trabajo.id}: {e}")
+        finally:
+            trabajo.terminado_en = time.time()
+            with self._lock:
+                self._en_curso.pop(clave, None)
+
+    def _olvidar_terminados(self):
+        # Solo se recuerdan los `max_historial` trabajos terminados más recientes
+        terminados = [i for i, t in self._trabajos.items() if t.estado in TERMINADOS]
+        for trabajo_id in terminados[:max(0, len(terminados) - self.max_historial)]:
+            del self._trabajos[trabajo_id]
+
+    def obtener(self, trabajo_id):
+        trabajo = self._trabajos.get(trabajo_id)
+        return trabajo.a_dict() if trabajo else None
+
+    def estadisticas(self):
+        with self._lock:
+            estados = [t.estado for t in self._trabajos.values()]
+        return {e: estados.count(e) for e in (PENDIENTE, EXTRAYENDO, EMBEBIENDO, COMPLETADO, ERROR)}
+
+    def cerrar(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
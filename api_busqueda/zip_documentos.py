@@ -0,0 +1,112 @@
+"""
+ZIP en streaming con los documentos de una convocatoria (`/convocatorias/{numconv}/documentos.zip`).
+
+- Los documentos se descargan por delante (hasta `ZIP_PREFETCH` a la vez) a
+  través del almacén de documentos (`AlmacenDocumentos.en_uso`), que reanuda
+  los cortes con Range y solo publica descargas completas. El almacén hace de
+  spool en disco: un miembro se empieza a escribir solo cuando su documento
+  está entero, así que un fallo a mitad de descarga deja el documento fuera
+  del ZIP en lugar de un miembro truncado que el cliente no puede detectar.
+- La lectura del fichero y la compresión van al pool de hilos; el bucle de
+  eventos solo entrega los bytes ya escritos.
+- El destino de zipfile no es buscable, así que cada miembro se escribe con
+  descriptor de datos y la memoria no depende del tamaño total.
+"""
+import asyncio
+import itertools
+import os
+import time
+import zipfile
+
+from fastapi.concurrency import run_in_threadpool
+
+# ======== CONFIGURACIÓN ========
+ZIP_PREFETCH = int(os.getenv("ZIP_PREFETCH", "4"))       # documentos descargándose por delante del que se escribe
+ZIP_TROZO_BYTES = 256 * 1024                              # lectura + compresión por viaje al pool de hilos
+# Formatos ya comprimidos: se guardan sin volver a deflactar
+EXTENSIONES_COMPRIMIDAS = {".pdf", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".zip", ".jpg", ".jpeg", ".png"}
+
+
+class _SalidaZip:
+    """Destino no buscable para zipfile: acumula lo escrito hasta que el generador lo entrega.
+    Al no poder hacer seek, zipfile escribe cada miembro con descriptor de datos."""
+    def __init__(self):
+        self._trozos = []
+
+    def write(self, datos):
+        self._trozos.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self._trozos)
+        self._trozos.clear()
+        return datos
+
+
+def _abrir_documento(almacen, doc):
+    """
+    Documento completo desde el almacén (descargándolo antes si no está),
+    abierto para leer; None si la BDNS no lo sirve o llega incompleto. Basta
+    con fijarlo hasta abrirlo: un fichero abierto se sigue pudiendo leer
+    aunque después se expulse del almacén.
+    """
+    with almacen.en_uso(doc["id"], nombre=doc["name"]) as info:
+        return open(info["ruta"], "rb") if info else None
+
+
+def _copiar_trozo(origen, miembro):
+    trozo = origen.read(ZIP_TROZO_BYTES)
+    miembro.write(trozo)
+    return len(trozo)
+
+
+def _cerrar_al_terminar(tarea):
+    # Descarga abandonada (cliente desconectado): el hilo sigue y el fichero se cierra al acabar
+    if not tarea.cancelled() and tarea.exception() is None and tarea.result() is not None:
+        tarea.result().close()
+
+
+async def zip_en_streaming(docs, almacen, prefetch=ZIP_PREFETCH):
+    """Genera el ZIP de `docs` ([{id, name}]) por trozos; los documentos que fallan se omiten."""
+    salida = _SalidaZip()
+    pendientes = []   # (doc, tarea) en orden; como mucho `prefetch` a la vez
+
+    def lanzar(doc):
+        pendientes.append((doc, asyncio.ensure_future(run_in_threadpool(_abrir_documento, almacen, doc))))
+
+    siguientes = iter(docs)
+    for doc in itertools.islice(siguientes, prefetch):
+        lanzar(doc)
+    try:
+        with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED) as z:
+            while pendientes:
+                doc, tarea = pendientes[0]
+                try:
+                    # shield: si se cancela aquí, la tarea sigue y su fichero se cierra en el finally
+                    origen = await asyncio.shield(tarea)
+                    motivo = "no disponible o incompleto"
+                except Exception as e:
+                    origen, motivo = None, e
+                if origen is None:
+                    # si un doc falla, seguimos con los demás
+                    print(f"⚠️ ZIP: se omite {doc['name']} ({motivo})")
+                else:
+                    comprimido = os.path.splitext(doc["name"])[1].lower() in EXTENSIONES_COMPRIMIDAS
+                    info = zipfile.ZipInfo(doc["name"], date_time=time.localtime()[:6])
+                    info.compress_type = zipfile.ZIP_STORED if comprimido else zipfile.ZIP_DEFLATED
+                    with origen, z.open(info, "w") as miembro:
+                        while await run_in_threadpool(_copiar_trozo, origen, miembro):
+                            if datos := salida.vaciar():
+                                yield datos
+                    yield salida.vaciar()
+                pendientes.pop(0)
+                for doc in itertools.islice(siguientes, 1):
+                    lanzar(doc)
+        yield salida.vaciar()   # directorio central
+    finally:
+        # Cliente desconectado: las descargas en curso terminan en su hilo y sus ficheros se cierran
+        for _, tarea in pendientes:
+            tarea.add_done_callback(_cerrar_al_terminar)
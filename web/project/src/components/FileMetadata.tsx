@@ -102,6 +102,20 @@ export const FileMetadata: React.FC<FileMetadataProps> = ({ file, onDownload, on
               body: formData, // importante: no poner Content-Type manual
             });
             if (res.ok) {
+              // La ingesta corre en segundo plano: se consulta el trabajo hasta que termina
+              let trabajo = await res.json().catch(() => ({}));
+              while (trabajo.trabajo && !['completado', 'error'].includes(trabajo.estado)) {
+                await new Promise(r => setTimeout(r, 1000));
+                const estado = await fetch(`${API_URL}/trabajos/${trabajo.trabajo}`);
+                if (!estado.ok) break;
+                trabajo = await estado.json();
+              }
+              if (trabajo.estado === 'error') {
+                alert(`${t('common.sendDocumentError')} "${file.name}". ${trabajo.error || ''}`);
+                return;
+              }
+              // Índice RAG del documento: las preguntas del chat se hacen sobre él
+              if (trabajo.indice) sessionStorage.setItem('indiceRag', trabajo.indice);
               alert(t('common.documentProcessedSuccess', { fileName: file.name }));
             } else {
               const msg = await res.text().catch(() => '');
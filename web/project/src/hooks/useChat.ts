@@ -1,6 +1,51 @@
 import { useState, useCallback } from 'react';
 import { Message, ChatSession, UploadedFile } from '../types/chat';
 
+// Lee una respuesta NDJSON (una línea JSON por evento) a medida que llega
+const leerNdjson = async (res: Response, onEvento: (evento: any) => void) => {
+  const reader = res.body!.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lineas = buffer.split('\n');
+    buffer = lineas.pop() ?? '';
+    for (const linea of lineas) {
+      if (linea.trim()) onEvento(JSON.parse(linea));
+    }
+  }
+  if (buffer.trim()) onEvento(JSON.parse(buffer));
+};
+
+// Lee una respuesta Server-Sent Events ("event: x" + "data: {...}", separados por línea en blanco)
+const leerSse = async (res: Response, onEvento: (evento: any) => void) => {
+  const reader = res.body!.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  const procesar = (bloque: string) => {
+    const data = bloque
+      .split('\n')
+      .filter(l => l.startsWith('data:'))
+      .map(l => l.slice(5).trimStart())
+      .join('\n');
+    if (data) onEvento(JSON.parse(data));
+  };
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const bloques = buffer.split('\n\n');
+    buffer = bloques.pop() ?? '';
+    bloques.forEach(procesar);
+  }
+  if (buffer.trim()) procesar(buffer);
+};
+
+// Campos que llegan después de los resultados de la búsqueda (enriquecimiento)
+const CAMPOS_PENDIENTES = { presupuesto_total: '', inicio: '…', final: '…', bases: '', estado: 'pendiente' };
+
 export const useChat = () => {
   const [sessions, setSessions] = useState<ChatSession[]>([]);
   const [currentSession, setCurrentSession] = useState<ChatSession | null>(null);
@@ -98,58 +143,109 @@ export const useChat = () => {
 
       try {
         const API_URL = 'https://tfm-docker.onrender.com';
-        let res, data;
+        let res;
 
         if (panel === 'document') {
-          // Preguntas a documentos (RAG)
-          res = await fetch(`${API_URL}/preguntar_rag`, {
+          // Preguntas a documentos (RAG) en streaming: la respuesta se pinta según llegan los tokens.
+          // El índice es obligatorio: sin documento procesado en esta sesión no se pregunta al backend
+          const indice = sessionStorage.getItem('indiceRag');
+          const messageId = (Date.now() + 1).toString();
+          let respuesta = '';
+
+          const publicar = () => {
+            const assistantMessage: Message = {
+              id: messageId,
+              type: 'assistant',
+              content: respuesta || 'Sin respuesta',
+              timestamp: new Date(),
+              phase: panel,
+            };
+            const finalSession: ChatSession = {
+              ...updatedSession,
+              messages: [...updatedSession.messages, assistantMessage],
+              documentMessages: [...updatedSession.documentMessages, assistantMessage],
+            };
+            setCurrentSession(finalSession);
+            setSessions(prev => prev.map(s => (s.id === finalSession.id ? finalSession : s)));
+          };
+
+          if (!indice) {
+            respuesta = '⚠️ No hay documentos procesados aún. Por favor, procesa primero un documento.';
+            publicar();
+            return;
+          }
+          res = await fetch(`${API_URL}/preguntar_rag/stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ pregunta: content }),
+            body: JSON.stringify({ pregunta: content, indice }),
           });
-          data = await res.json();
-
-          const respuesta = data.resultados?.[0]?.respuesta || data.error || 'Sin respuesta';
-          const assistantMessage: Message = {
-            id: (Date.now() + 1).toString(),
-            type: 'assistant',
-            content: respuesta,
-            timestamp: new Date(),
-            phase: panel,
-          };
+          if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
 
-          const finalSession: ChatSession = {
-            ...updatedSession,
-            messages: [...updatedSession.messages, assistantMessage],
-            documentMessages: [...updatedSession.documentMessages, assistantMessage],
-          };
-          setCurrentSession(finalSession);
-          setSessions(prev => prev.map(s => (s.id === finalSession.id ? finalSession : s)));
+          await leerSse(res, evento => {
+            if (evento.tipo === 'token') {
+              respuesta += evento.texto;
+              setIsLoading(false);
+            } else if (evento.tipo === 'aviso') {
+              respuesta = evento.texto;
+            } else if (evento.tipo === 'error') {
+              respuesta = respuesta || evento.error;
+            } else {
+              return; // "contexto" y "fin" no cambian el mensaje
+            }
+            publicar();
+          });
         } else {
-          // Búsqueda de convocatorias (tarjetas)
-          res = await fetch(`${API_URL}/convocatorias`, {
+          // Búsqueda de convocatorias (tarjetas) en streaming: primero los resultados
+          // de la búsqueda y después el enriquecimiento de cada fila según termina
+          res = await fetch(`${API_URL}/convocatorias/stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ texto: content }),
           });
-          if (!res.ok) throw new Error(`HTTP ${res.status}`);
-          data = await res.json();
-
-          const assistantMessage: Message = {
-            id: (Date.now() + 1).toString(),
-            type: 'assistant',
-            content: JSON.stringify(data),
-            timestamp: new Date(),
-            phase: panel,
-          };
+          if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+
+          const messageId = (Date.now() + 1).toString();
+          let resultados: Record<string, any>[] = [];
+          let error: string | null = null;
 
-          const finalSession: ChatSession = {
-            ...updatedSession,
-            messages: [...updatedSession.messages, assistantMessage],
-            searchMessages: [...updatedSession.searchMessages, assistantMessage],
+          const publicar = () => {
+            const assistantMessage: Message = {
+              id: messageId,
+              type: 'assistant',
+              content: JSON.stringify(error ? { error } : { resultados }),
+              timestamp: new Date(),
+              phase: panel,
+            };
+            const finalSession: ChatSession = {
+              ...updatedSession,
+              messages: [...updatedSession.messages, assistantMessage],
+              searchMessages: [...updatedSession.searchMessages, assistantMessage],
+            };
+            setCurrentSession(finalSession);
+            setSessions(prev => prev.map(s => (s.id === finalSession.id ? finalSession : s)));
           };
-          setCurrentSession(finalSession);
-          setSessions(prev => prev.map(s => (s.id === finalSession.id ? finalSession : s)));
+
+          await leerNdjson(res, evento => {
+            if (evento.tipo === 'resultados') {
+              resultados = evento.resultados.map((r: Record<string, any>) => ({ ...CAMPOS_PENDIENTES, ...r }));
+              setIsLoading(false); // las tarjetas ya se pueden mostrar
+            } else if (evento.tipo === 'fila') {
+              const campos = { ...evento };
+              delete campos.tipo;
+              if (campos.estado === null) delete campos.estado;
+              resultados = resultados.map(r =>
+                String(r.numeroConvocatoria) === String(campos.numeroConvocatoria) ? { ...r, ...campos } : r
+              );
+            } else if (evento.tipo === 'orden') {
+              const posicion = new Map(evento.orden.map((n: unknown, i: number) => [String(n), i]));
+              resultados = [...resultados].sort(
+                (a, b) => (posicion.get(String(a.numeroConvocatoria)) ?? 0) - (posicion.get(String(b.numeroConvocatoria)) ?? 0)
+              );
+            } else if (evento.tipo === 'error') {
+              error = evento.error;
+            }
+            publicar();
+          });
         }
       } catch (e) {
         console.error('Error sending message:', e);